@@ -0,0 +1,350 @@
+import argparse
+import collections
+import hashlib
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import select
+import sys
+import tempfile
+import time
+from socket import *
+from auc_client_rdt import auc_client, congestion_controllers, stream_codecs
+
+"""
+Loopback benchmark for the UDP rdt item transfer. Drives auc_client.send_item and auc_client.recieve_item directly,
+without an auction server or any typed input, over every combination of the file sizes, chunk sizes, loss rates, window
+sizes, congestion controllers, codecs, parity block sizes, delays and reordering given on the command line. Every
+combination is repeated and the transfer time and goodput are reported as median and percentiles in JSON, together with
+the medians of the transfer metrics both sides record (retransmissions, dropped acks, rtt, time to first byte), so runs
+can be compared against a saved baseline.
+
+The seller and buyer each run in their own process. Delay, jitter and reordering are injected by a relay process that
+sits between them and forwards datagrams in both directions after a scheduled delay; loss is simulated by the clients'
+own loss_rate. With --rate the relay also acts as a bottleneck link towards the buyer, serializing the seller's
+datagrams at that rate behind a drop tail queue of --queue datagrams, so congestion control can be compared against the
+queueing loss and delay it causes. The received file is checked against the sent file after every run.
+
+Run example: python3 auc_bench_rdt.py --sizes 100000,2000000 --loss-rates 0,0.1 --windows 1,32 --repeat 5 --output
+bench.json [--baseline old_bench.json --tolerance 0.25]
+"""
+class auc_bench:
+    source = "tosend.txt"           # file the benchmark items are cut from, random bytes if missing
+    run_timeout = 600               # seconds before a hung run is killed and counted as a failure
+
+    """ Parses the benchmark matrix from argv. """
+    def __init__(self, argv=None):
+        parser = argparse.ArgumentParser(description="Loopback benchmark for the UDP rdt item transfer.")
+        parser.add_argument("--sizes", default="2167737", help="comma separated item sizes in bytes")
+        parser.add_argument("--chunk-sizes", default=str(auc_client.chunk_size),
+                            help="comma separated chunk sizes the start handshake probes upward from")
+        parser.add_argument("--max-chunk-sizes", default=str(auc_client.max_chunk_size),
+                            help="comma separated largest chunk sizes, equal to the chunk size for no probing")
+        parser.add_argument("--loss-rates", default="0", help="comma separated loss rates")
+        parser.add_argument("--windows", default="1", help="comma separated window sizes, 1 for stop and wait")
+        parser.add_argument("--cc", default=auc_client.congestion_control,
+                            help="comma separated congestion controllers, out of " + ",".join(sorted(congestion_controllers)))
+        parser.add_argument("--codecs", default=auc_client.codec,
+                            help="comma separated codecs offered for the transfer, out of none," + ",".join(sorted(stream_codecs)))
+        parser.add_argument("--fec", default="0", help="comma separated chunks per parity packet, 0 for none")
+        parser.add_argument("--delays", default="0", help="comma separated one way delays in ms added by the relay")
+        parser.add_argument("--jitter", type=float, default=0, help="random extra delay in ms, up to this value")
+        parser.add_argument("--reorder", default="0", help="comma separated probabilities of delaying a datagram "
+                                                            "past the ones behind it")
+        parser.add_argument("--rate", type=float, default=0, help="bottleneck rate in Mbit/s towards the buyer, 0 for none")
+        parser.add_argument("--queue", type=int, default=64, help="datagrams the bottleneck queues before dropping")
+        parser.add_argument("--repeat", type=int, default=3, help="runs per combination")
+        parser.add_argument("--seed", type=int, default=1, help="seed for item content and relay randomness")
+        parser.add_argument("--source", default=self.source, help="file the items are cut from")
+        parser.add_argument("--output", help="write the JSON report here instead of stdout")
+        parser.add_argument("--baseline", help="JSON report to compare median transfer times against")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="allowed relative slowdown against the baseline before a run counts as a regression")
+        self.args = parser.parse_args(argv)
+
+    """ Runs every combination of the matrix, prints or saves the report and checks it against the baseline. """
+    def main(self):
+        args = self.args
+        matrix = itertools.product(self.parse_list(args.sizes, int), self.parse_list(args.chunk_sizes, int),
+                                   self.parse_list(args.max_chunk_sizes, int),
+                                   self.parse_list(args.loss_rates, float), self.parse_list(args.windows, int),
+                                   self.parse_list(args.cc, str), self.parse_list(args.codecs, str),
+                                   self.parse_list(args.fec, int), self.parse_list(args.delays, float),
+                                   self.parse_list(args.reorder, float))
+        results = []
+        with tempfile.TemporaryDirectory() as work_dir:
+            for size, chunk_size, max_chunk_size, loss_rate, window, cc, codec, fec, delay, reorder in matrix:
+                config = {"size": size, "chunk_size": chunk_size, "max_chunk_size": max(chunk_size, max_chunk_size),
+                          "loss_rate": loss_rate, "window": window, "cc": cc,
+                          "codec": codec, "fec": fec, "delay_ms": delay, "jitter_ms": args.jitter, "reorder": reorder,
+                          "rate_mbps": args.rate, "queue": args.queue}
+                item = self.make_item(work_dir, size)
+                times = []
+                metrics = []
+                failures = 0
+                for run in range(args.repeat):
+                    elapsed, run_metrics = self.run_transfer(work_dir, item, config, args.seed + run)
+                    if elapsed is None:
+                        failures += 1
+                    else:
+                        times.append(elapsed)
+                        metrics.append(run_metrics)
+                print("bench " + json.dumps(config) + " median " + str(self.percentile(times, 50)) + " s", file=sys.stderr)
+                results.append({"config": config, "runs": times, "failures": failures,
+                                "time_s": self.summarize(times),
+                                "goodput_Bps": self.summarize([size / t for t in times if t > 0]),
+                                "metrics_median": self.median_metrics(metrics)})
+
+        report = {"created": time.time(), "repeat": args.repeat, "results": results}
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+
+        if args.baseline:
+            return self.compare(report, args.baseline, args.tolerance)
+        return 0 if all(r["failures"] == 0 for r in results) else 1
+
+    """ Splits a comma separated command line value into a list of convert(value). """
+    def parse_list(self, value, convert):
+        return [convert(v.strip()) for v in value.split(",") if v.strip()]
+
+    """ Creates the item of size bytes in work_dir by repeating the source file, or from seeded random bytes. """
+    def make_item(self, work_dir, size):
+        path = os.path.join(work_dir, "item_" + str(size))
+        if os.path.exists(path):
+            return path
+        if os.path.isfile(self.args.source) and os.path.getsize(self.args.source) > 0:
+            with open(self.args.source, "rb") as f:
+                pattern = f.read()
+        else:
+            pattern = random.Random(self.args.seed).randbytes(1 << 20)
+        with open(path, "wb") as f:
+            written = 0
+            while written < size:
+                written += f.write(pattern[:size - written])
+        return path
+
+    """
+    Runs one transfer of item with the given config between a seller and a buyer process through the relay process.
+    Returns the seconds the seller took from the start msg until the fin msg was acked and the transfer metrics of both
+    sides, or None and None if the run failed or the received file does not match the item.
+    """
+    def run_transfer(self, work_dir, item, config, seed):
+        seller_port, buyer_port, relay_seller_port, relay_buyer_port = self.free_ports(4)
+        received = os.path.join(work_dir, "received")
+        seller_metrics = os.path.join(work_dir, "seller_metrics.json")
+        buyer_metrics = os.path.join(work_dir, "buyer_metrics.json")
+        for path in (seller_metrics, buyer_metrics):
+            if os.path.exists(path):
+                os.remove(path)
+        results = multiprocessing.Queue()
+
+        relay = multiprocessing.Process(target=run_relay, args=(relay_seller_port, relay_buyer_port, buyer_port, config, seed))
+        buyer = multiprocessing.Process(target=run_buyer, args=(work_dir, buyer_port, relay_buyer_port, received, config,
+                                                                buyer_metrics))
+        seller = multiprocessing.Process(target=run_seller, args=(work_dir, seller_port, relay_seller_port, item, config,
+                                                                  seller_metrics, results))
+        procs = [relay, buyer, seller]
+        relay.start()
+        buyer.start()
+        self.wait_bound(buyer_port)
+        self.wait_bound(relay_seller_port)
+        seller.start()
+
+        try:
+            elapsed = results.get(timeout=self.run_timeout)
+            buyer.join(self.run_timeout)
+        except Exception:
+            elapsed = None
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+
+        if elapsed is None or buyer.exitcode != 0 or self.digest(received) != self.digest(item):
+            return None, None
+        return elapsed, {"send": self.read_metrics(seller_metrics), "receive": self.read_metrics(buyer_metrics)}
+
+    """ Returns the last metrics summary written to the JSON lines file at path, or an empty dict. """
+    def read_metrics(self, path):
+        if not os.path.isfile(path):
+            return {}
+        with open(path) as f:
+            lines = f.read().splitlines()
+        return json.loads(lines[-1]) if lines else {}
+
+    """ Returns the median of every numeric metric of each side over the runs. """
+    def median_metrics(self, runs):
+        medians = {}
+        for side in ("send", "receive"):
+            fields = {}
+            for run in runs:
+                for name, value in run.get(side, {}).items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        fields.setdefault(name, []).append(value)
+            medians[side] = {name: self.percentile(values, 50) for name, values in fields.items()}
+        return medians
+
+    """ Returns n distinct free UDP ports on the loopback interface. """
+    def free_ports(self, n):
+        socks = []
+        for _ in range(n):
+            sock = socket(AF_INET, SOCK_DGRAM)
+            sock.bind(("127.0.0.1", 0))
+            socks.append(sock)
+        ports = [sock.getsockname()[1] for sock in socks]
+        for sock in socks:
+            sock.close()
+        return ports
+
+    """ Waits until another process has bound UDP port, so the first datagram sent to it is not lost. """
+    def wait_bound(self, port):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            probe = socket(AF_INET, SOCK_DGRAM)
+            try:
+                probe.bind(("", port))
+            except OSError:
+                return
+            finally:
+                probe.close()
+            time.sleep(0.005)
+
+    """ Returns the sha256 hex digest of the file at path, or None if it does not exist. """
+    def digest(self, path):
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest() if hasattr(hashlib, "file_digest") \
+                else hashlib.sha256(f.read()).hexdigest()
+
+    """ Returns the p-th percentile of values by linear interpolation, or None for no values. """
+    def percentile(self, values, p):
+        if not values:
+            return None
+        ordered = sorted(values)
+        pos = (len(ordered) - 1) * p / 100
+        low = int(pos)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+    """ Summarizes values as min, median, p90, p99 and max. """
+    def summarize(self, values):
+        return {"min": min(values) if values else None, "median": self.percentile(values, 50),
+                "p90": self.percentile(values, 90), "p99": self.percentile(values, 99),
+                "max": max(values) if values else None}
+
+    """
+    Compares the median transfer time of every config in report with the same config in the baseline report. Prints
+    every config that got slower than the tolerance allows and returns 1 if any did, 0 otherwise.
+    """
+    def compare(self, report, baseline_path, tolerance):
+        with open(baseline_path) as f:
+            baseline = {json.dumps(r["config"], sort_keys=True): r for r in json.load(f)["results"]}
+        regressions = 0
+        for result in report["results"]:
+            old = baseline.get(json.dumps(result["config"], sort_keys=True))
+            if old is None or old["time_s"]["median"] is None:
+                continue
+            new_median = result["time_s"]["median"]
+            if new_median is None or new_median > old["time_s"]["median"] * (1 + tolerance):
+                regressions += 1
+                print("REGRESSION " + json.dumps(result["config"]) + ": median " + str(new_median) + " s, baseline "
+                      + str(old["time_s"]["median"]) + " s", file=sys.stderr)
+        return 1 if regressions else 0
+
+
+""" Creates a quiet client for one side of a benchmark transfer, bound to port and simulating loss_rate. """
+def make_client(port, config, metrics_file):
+    client = auc_client(["127.0.0.1", "0", str(port), str(config["loss_rate"]), "--window", str(config["window"]),
+                         "--cc", config["cc"], "--codec", config["codec"],
+                         "--fec", str(config["fec"]), "--chunk-size", str(config["chunk_size"]),
+                         "--max-chunk-size", str(config["max_chunk_size"]), "--quiet", "--metrics", metrics_file])
+    return client
+
+
+""" Process target for the seller side, reports the transfer time on results. """
+def run_seller(work_dir, port, relay_port, item, config, metrics_file, results):
+    os.chdir(work_dir)
+    client = make_client(port, config, metrics_file)
+    client.filename = item
+    start = time.perf_counter()
+    client.send_item([("127.0.0.1", relay_port, [relay_port])])
+    results.put(time.perf_counter() - start)
+
+
+""" Process target for the buyer side, writes the item to received. """
+def run_buyer(work_dir, port, relay_port, received, config, metrics_file):
+    os.chdir(work_dir)
+    client = make_client(port, config, metrics_file)
+    client.received_filename = received
+    client.recieve_item("127.0.0.1", [relay_port])
+
+
+"""
+Process target for the relay between seller and buyer. Datagrams from the seller arrive on seller_side_port and are
+forwarded to the buyer from buyer_side_port, and acks from the buyer travel back the other way. Every datagram is held
+for the configured delay plus random jitter, and with the reorder probability for an extra delay so later datagrams
+overtake it. With a bottleneck rate, datagrams towards the buyer first wait for the link to serialize the ones ahead of
+them and are dropped if the queue is full. Runs until terminated.
+"""
+def run_relay(seller_side_port, buyer_side_port, buyer_port, config, seed):
+    rand = random.Random(seed)
+    seller_side = socket(AF_INET, SOCK_DGRAM)
+    seller_side.bind(("127.0.0.1", seller_side_port))
+    buyer_side = socket(AF_INET, SOCK_DGRAM)
+    buyer_side.bind(("127.0.0.1", buyer_side_port))
+    for sock in (seller_side, buyer_side):                              # buffer like the clients' transfer sockets
+        sock.setsockopt(SOL_SOCKET, SO_RCVBUF, auc_client.socket_buffer)
+        sock.setsockopt(SOL_SOCKET, SO_SNDBUF, auc_client.socket_buffer)
+    seller_addr = None
+    buyer_addr = ("127.0.0.1", buyer_port)
+    delay = config["delay_ms"] / 1000
+    jitter = config["jitter_ms"] / 1000
+    pending = []                                                        # heap of (due time, order, socket, data, addr)
+    order = itertools.count()
+    rate = config["rate_mbps"] * 1e6 / 8                                # bottleneck bytes per second, 0 for none
+    link_free = 0                                                       # time the bottleneck has sent its queue
+    queued = collections.deque()                                        # serialization end times of queued datagrams
+
+    while True:
+        wait = max(0, pending[0][0] - time.monotonic()) if pending else None
+        readable, _, _ = select.select([seller_side, buyer_side], [], [], wait)
+        now = time.monotonic()
+        for sock in readable:
+            data, addr = sock.recvfrom(65535)
+            if sock is seller_side:
+                seller_addr = addr
+                out, dest = buyer_side, buyer_addr
+            elif seller_addr is not None:
+                out, dest = seller_side, seller_addr
+            else:
+                continue
+            hold = delay + rand.random() * jitter
+            if rate > 0 and sock is seller_side:
+                while queued and queued[0] <= now:
+                    queued.popleft()
+                if len(queued) >= config["queue"]:                      # drop tail
+                    continue
+                link_free = max(link_free, now) + len(data) / rate
+                queued.append(link_free)
+                hold += link_free - now
+            if rand.random() < config["reorder"]:
+                hold += max(2 * delay, 0.002)
+            if hold <= 0:
+                out.sendto(data, dest)
+            else:
+                heapq.heappush(pending, (now + hold, next(order), out, data, dest))
+
+        while pending and pending[0][0] <= time.monotonic():
+            _, _, out, data, dest = heapq.heappop(pending)
+            out.sendto(data, dest)
+
+
+if __name__ == "__main__":
+    sys.exit(auc_bench().main())
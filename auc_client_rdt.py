@@ -1,332 +1,1878 @@
 # Author: Isabella Samuelsson
 # Date: 10/7/22
+import argparse
+import base64
+import collections
+import csv
+import hashlib
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
 import os
+import select
+import struct
 import sys
+import time
+import zlib
+from array import array
 from datetime import datetime
 from random import randint
 from socket import *
-from interruptingcow import timeout
+from auc_protocol import msg_reader, send_msg
+try:
+    import lzma
+except ImportError:                 # Python built without liblzma
+    lzma = None
 """
 Auction client class. If you are the first to connect to the server you will be connected as a seller client, if not you 
 will be connected as a buyer client. Bids must be an integer greater than zero. Once the auction has concluded the seller 
 will initiate reliable data transfer to transfer the file item tosend.txt to the winning buyer.
 
-Seller Client: Once connected you will be prompted to enter auction information. This includes Auction Type: 1 
-for a first price auction and 2 for a second price auction, Minimum Bid price: non-negative integer, Number of Bidders: 
-non-negative integer less than 10 and Item Name: string. If you enter invalid auction information you will be prompted 
-for valid information before continuing. At the end of the auction your file item tosend.txt will be transferred to the 
-winning buyer through rdt.
+Seller Client: Once connected you will be prompted to enter auction information. This includes Auction Type: 1 for a 
+first price auction, 2 for a second price auction and 3 for an ascending auction, Minimum Bid price: non-negative 
+integer, Number of Bidders: positive integer and Item Name: string. If you enter invalid auction information you will 
+be prompted for valid information before continuing. At the end of the auction your file item tosend.txt will be 
+transferred to the winning buyer through rdt.
 
 Buyer Client: Once connected you will be prompted to enter a bid. A bid should be a non-negative integer, if an invalid 
-bid is given you will be prompted again. You will receive the file item received.txt through rdt.
+bid is given you will be prompted again. In an ascending auction every line you enter is a bid and the current price 
+is shown whenever another buyer raises it, until the auction closes. You will receive the file item received.txt 
+through rdt.
 
-Run example: python3 auc_client_rdt.py server_ip_address server_port_number transfer_port_number drop_rate
+Item Transfer: Every rdt packet starts with a binary header (sequence number, type, flags, payload length) followed by 
+the raw payload bytes, so any file item can be transferred. By default the item is sent through stop and wait. A seller 
+started with --window N (N > 1) will instead transfer the item with selective repeat, keeping up to N chunks in flight. 
+The window size is announced to the buyer in the rdt start message so the buyer does not need to be configured.
+
+Resumable Transfers: The buyer keeps a checkpoint of the chunks it has written next to received.txt. If a transfer is 
+interrupted, the next transfer of the same item reports the chunks already held in its reply to the start message and 
+the seller only sends the rest. The received item is checked against the sha256 the seller sends in the start message.
+
+Compression: With --codec zlib|lzma (and --level) the seller offers to compress the item in its start message and the 
+buyer accepts or declines in the reply. The item is compressed as one stream and the compressed bytes are cut into 
+chunks of the usual size, the buyer decompresses the chunks in order as they arrive. An item that does not compress, 
+checked on a sample before the transfer, is sent raw. A buyer resuming a transfer declines compression.
+
+Forward Error Correction: With --fec K the seller follows every block of K chunks with a parity packet, the XOR of the 
+block's chunks. The buyer rebuilds a single lost chunk of a block from the parity and the other chunks and acks it, so 
+the loss costs no retransmission timeout. Chunks are only re-sent when a block lost more than one of its packets.
+
+Delta Transfer: With --delta the seller offers to send only what changed since a version of the item the buyer already 
+holds in received.txt, as in rsync. The buyer answers the start message with a rolling (adler32) and a strong (blake2b) 
+checksum of every block of its copy, the seller finds those blocks anywhere in the item with the rolling checksum and 
+sends a stream of copy instructions for them and literal data for the rest, and the buyer rebuilds the item in place in 
+received.txt as the stream arrives. The buyer keeps the old bytes it overwrites for the last 8 MB before the position it 
+writes to, so blocks are copied from anywhere past that position or from up to 8 MB before it, data that moved further 
+towards the end of the item is sent as literal data. Delta transfers are used for items sent over a single stream, and 
+not when resuming.
+
+Datagram I/O: Transfer sockets are non-blocking with 4 MB kernel buffers, every wakeup drains all ready datagrams into 
+one preallocated buffer. The chunk size is negotiated in the start handshake: the seller offers the largest chunk the 
+path carries unfragmented (probed upward from --chunk-size, at most --max-chunk-size) and the buyer accepts it or a 
+smaller one so that a whole window fits its receive buffer.
+
+Acknowledgements: The buyer acks data with one cumulative ack, the next chunk it is missing, plus a bitmap of the 
+chunks it holds beyond it. Acks are delayed until --ack-every new chunks arrived or --ack-delay ms passed, but are sent 
+at once when a chunk arrives out of order, fills a gap or is a duplicate. The seller acks every chunk an ack covers at 
+once and re-sends a chunk as soon as chunks well past it are acked, without waiting for its timer.
+
+Parallel Streams: With --streams N the item is split into N byte ranges that are sent over N port pairs at once, the 
+ports transfer_port to transfer_port + N - 1 on both sides, each stream driven by its own worker process. The ports are 
+exchanged through the auction server, and the number of streams used is the smaller of the seller's and the buyer's.
+
+Congestion Control: Within the window the seller's congestion controller (--cc, veno by default) decides how many 
+chunks are in flight and paces them over the measured round trip time. aimd is slow start plus additive increase and 
+multiplicative decrease, veno additionally only cuts the window slightly on losses that happen without a queue building 
+up, such as the simulated drop rate, and fixed keeps the whole window in flight.
+
+Multi-unit Auctions: A seller can offer several copies of the item by adding a bidding deadline (0 for none) and the 
+number of units to the auction request. The item is then delivered to every winning buyer at the same time over the 
+seller's one transfer socket, each buyer with its own window and timers.
+
+Auction Rooms: The server hosts many auctions at once in separate rooms. Pass --room ID to join a room other than the 
+default lobby; the first client to join a room becomes its seller.
+
+Transfer Metrics: At the end of a transfer both sides print a one line JSON summary (packets sent, retransmissions, 
+dropped acks, rtt samples, goodput, time to first byte) and append it to the --metrics file, as CSV if its name ends in 
+.csv. Per packet logging is off unless -v is given, -q silences the transfer output.
+
+Run example: python3 auc_client_rdt.py server_ip_address server_port_number transfer_port_number drop_rate [--room ID] 
+[--window N] [--streams N] [--cc aimd|veno|fixed] [--codec none|zlib|lzma] [--level N] [--fec K] [--delta] 
+[--ack-every N] [--ack-delay MS] [--chunk-size N] [--max-chunk-size N] [-v | -q] [--metrics FILE]
 """
+class rtt_estimator:
+    """ 
+    Retransmission timeout estimation from measured round trip times (RFC 6298). Keeps a smoothed rtt and rtt variance 
+    and sets the timeout to srtt + 4 * rttvar, clamped to [min_rto, max_rto]. The timeout doubles on every expiry until 
+    a new sample arrives. Samples must only be taken from packets that were not re-sent (Karn's algorithm).
+    """
+    alpha = 0.125                   # smoothed rtt gain
+    beta = 0.25                     # rtt variance gain
+    min_rto = 0.05                  # lower bound on the timeout in seconds
+    max_rto = 10                    # upper bound on the timeout in seconds
+
+    def __init__(self, initial_rto):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, self.min_rto), self.max_rto)
+
+    def backoff(self):
+        self.rto = min(self.rto * 2, self.max_rto)
+
+
+class aimd_controller:
+    """ 
+    Reno style congestion control for one transfer session: slow start up to ssthresh, then additive increase, and the 
+    window halved at most once per window of lost chunks. The window never exceeds the receive window max_window and 
+    chunks are paced at gain * window / srtt.
+    """
+    name = "aimd"
+    initial_window = 2              # chunks in flight before the first ack
+    slow_start_gain = 2             # pacing gain while the window doubles every round trip
+    avoidance_gain = 1.25           # pacing gain once the window grows linearly
+
+    def __init__(self, max_window):
+        self.max_window = max_window
+        self.cwnd = min(self.initial_window, max_window)
+        self.ssthresh = max_window
+        self.recover = 0                    # losses of chunks below this seq belong to the last congestion event
+        self.events = 0                     # number of window reductions
+
+    """ Returns the number of chunks that may be in flight. """
+    def window(self):
+        return max(1, int(self.cwnd))
+
+    """ Grows the window for the newly acked chunk seq, rtt is its round trip time or None if it was re-sent. """
+    def on_ack(self, seq, rtt):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += 1
+        else:
+            self.cwnd += 1 / self.cwnd
+        self.cwnd = min(self.cwnd, self.max_window)
+
+    """ Shrinks the window for the lost chunk seq, next_seq is the next chunk that has not been sent yet. """
+    def on_loss(self, seq, next_seq):
+        if seq < self.recover:
+            return
+        self.recover = next_seq
+        self.events += 1
+        self.ssthresh = max(self.cwnd * self.decrease_factor(), 1)
+        self.cwnd = self.ssthresh
+
+    """ Returns the factor the window is multiplied with on a congestion event. """
+    def decrease_factor(self):
+        return 0.5
+
+    """ Returns the seconds between two chunks for the smoothed round trip time srtt. """
+    def pacing_interval(self, srtt):
+        gain = self.slow_start_gain if self.cwnd < self.ssthresh else self.avoidance_gain
+        return srtt / (self.cwnd * gain)
+
+
+class veno_controller(aimd_controller):
+    """ 
+    AIMD that tells random loss from congestion loss (TCP Veno). A loss while the estimated queue on the path, cwnd * 
+    (rtt - min_rtt) / rtt chunks, is below backlog_threshold only cuts the window to random_loss_factor, a loss with a 
+    standing queue halves it like aimd.
+    """
+    name = "veno"
+    backlog_threshold = 3           # chunks queued on the path before a loss counts as congestion
+    random_loss_factor = 0.8        # window decrease on random loss
+
+    def __init__(self, max_window):
+        super().__init__(max_window)
+        self.min_rtt = None
+        self.last_rtt = None
+
+    def on_ack(self, seq, rtt):
+        if rtt is not None:
+            self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+            self.last_rtt = rtt
+        super().on_ack(seq, rtt)
+
+    def decrease_factor(self):
+        if self.last_rtt is None or self.last_rtt <= 0:
+            return 0.5
+        backlog = self.cwnd * (self.last_rtt - self.min_rtt) / self.last_rtt
+        return self.random_loss_factor if backlog < self.backlog_threshold else 0.5
+
+
+class fixed_controller:
+    """ No congestion control: the whole receive window may be in flight and chunks are sent back to back. """
+    name = "fixed"
+
+    def __init__(self, max_window):
+        self.max_window = max_window
+        self.events = 0
+
+    def window(self):
+        return self.max_window
+
+    def on_ack(self, seq, rtt):
+        pass
+
+    def on_loss(self, seq, next_seq):
+        pass
+
+    def pacing_interval(self, srtt):
+        return 0
+
+
+# congestion control algorithms by name, a new algorithm plugs in here with the methods of aimd_controller
+congestion_controllers = {aimd_controller.name: aimd_controller, veno_controller.name: veno_controller,
+                          fixed_controller.name: fixed_controller}
+
+
+class transfer_metrics:
+    """ 
+    Counters collected over one rdt transfer by the seller (role "send") or the winning buyer (role "receive"). The 
+    transfer clock starts when the object is created. summary() reports packet counts, retransmissions, dropped and 
+    duplicate packets, round trip time statistics, time to first byte and goodput; emit() appends the summary to a JSON 
+    lines or CSV file.
+    """
+    def __init__(self, role, loss_rate, window_size, chunk_size):
+        self.role = role
+        self.loss_rate = loss_rate
+        self.window_size = window_size
+        self.chunk_size = chunk_size
+        self.peers = 1                      # buyers the item is delivered to at once
+        self.stream = 0                     # index of the stream in a multi-stream transfer
+        self.congestion_control = None      # name of the congestion controller of the sender
+        self.congestion_events = 0          # congestion window reductions over all buyers
+        self.fec_block = 0                  # data chunks per parity packet, 0 without forward error correction
+        self.codec = "none"                 # compression the chunks were sent with
+        self.delta_block = 0                # block size of a delta transfer, 0 if the whole item was sent
+        self.start = time.monotonic()
+        self.end = None
+        self.first_byte = None              # time the first data chunk was acked (send) or received (receive)
+        self.packets_sent = 0               # data and control packets, including retransmissions
+        self.retransmissions = 0
+        self.fast_retransmits = 0           # retransmissions triggered by later chunks being acked, not by a timer
+        self.acks_sent = 0
+        self.acks_received = 0
+        self.acks_dropped = 0               # acks dropped by the loss simulation
+        self.packets_received = 0
+        self.packets_dropped = 0            # packets dropped by the loss simulation
+        self.duplicates = 0                 # data chunks received more than once
+        self.parity_sent = 0                # parity packets sent (send) or received (receive)
+        self.recovered = 0                  # chunks rebuilt from parity by the buyer, acked without a retransmission
+        self.bytes = 0                      # file bytes acked (send) or received (receive)
+        self.wire_bytes = 0                 # chunk payload bytes acked or received, compressed if a codec is used
+        self.resumed_bytes = 0              # file bytes the buyer already held from an earlier transfer
+        self.reused_bytes = 0               # file bytes a delta transfer rebuilt from the buyer's earlier version
+        self.verified = None                # if the received bytes matched the seller's sha256
+        self.rtt_samples = array('d')
+
+    """ Marks the first data byte as acked or received if it has not been already. """
+    def first_data(self):
+        if self.first_byte is None:
+            self.first_byte = time.monotonic()
+
+    """ Stops the transfer clock. """
+    def finish(self):
+        self.end = time.monotonic()
+
+    def summary(self):
+        elapsed = (self.end if self.end is not None else time.monotonic()) - self.start
+        rtts = sorted(self.rtt_samples)
+        return {
+            "role": self.role, "loss_rate": self.loss_rate, "window_size": self.window_size,
+            "chunk_size": self.chunk_size, "peers": self.peers, "stream": self.stream,
+            "congestion_control": self.congestion_control, "congestion_events": self.congestion_events,
+            "fec_block": self.fec_block, "parity_packets": self.parity_sent, "recovered": self.recovered,
+            "codec": self.codec, "delta_block": self.delta_block, "bytes": self.bytes, "wire_bytes": self.wire_bytes,
+            "resumed_bytes": self.resumed_bytes, "reused_bytes": self.reused_bytes, "verified": self.verified,
+            "elapsed_s": elapsed,
+            "goodput_Bps": self.bytes / elapsed if elapsed > 0 else 0,
+            "ttfb_s": self.first_byte - self.start if self.first_byte is not None else None,
+            "packets_sent": self.packets_sent, "retransmissions": self.retransmissions,
+            "fast_retransmits": self.fast_retransmits,
+            "acks_sent": self.acks_sent, "acks_received": self.acks_received, "acks_dropped": self.acks_dropped,
+            "packets_received": self.packets_received, "packets_dropped": self.packets_dropped,
+            "duplicates": self.duplicates, "rtt_samples": len(rtts),
+            "rtt_min_s": rtts[0] if rtts else None,
+            "rtt_median_s": rtts[len(rtts) // 2] if rtts else None,
+            "rtt_p99_s": rtts[min(len(rtts) - 1, len(rtts) * 99 // 100)] if rtts else None,
+            "rtt_max_s": rtts[-1] if rtts else None,
+        }
+
+    """ Appends the summary to filename, as a CSV row if it ends in .csv and as a JSON line otherwise. """
+    def emit(self, filename):
+        summary = self.summary()
+        if filename.endswith(".csv"):
+            new_file = not os.path.isfile(filename) or os.path.getsize(filename) == 0
+            with open(filename, "a", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=list(summary))
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(summary)
+        else:
+            with open(filename, "a") as f:
+                f.write(json.dumps(summary) + "\n")
+
+
+class file_sink:
+    """ 
+    Streams received chunks straight to disk for the winning buyer. The file is created and preallocated to the size 
+    announced in the rdt start msg, then every chunk is written at its own offset with a positioned write, so chunks 
+    can land in any order and nothing is held in memory.
+    """
+    def __init__(self, filename, total_bytes):
+        self.fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+        os.ftruncate(self.fd, total_bytes)
+        if total_bytes > 0 and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(self.fd, 0, total_bytes)
+            except OSError:
+                pass                                                    # file system without fallocate support
+
+    def write(self, offset, data):
+        os.pwrite(self.fd, data, offset)
+
+    def read(self, offset, length):
+        return os.pread(self.fd, length, offset)
+
+    """ Cuts the file off at size bytes. """
+    def truncate(self, size):
+        os.ftruncate(self.fd, size)
+
+    """ Flushes the written chunks to disk. """
+    def sync(self):
+        if hasattr(os, 'fdatasync'):
+            os.fdatasync(self.fd)
+        else:
+            os.fsync(self.fd)
+
+    """ Returns the sha256 hex digest of length bytes of the file from offset, reading it in large blocks. """
+    def digest(self, offset, length, block_size=1 << 20):
+        digest = hashlib.sha256()
+        end = offset + length
+        while offset < end:
+            data = os.pread(self.fd, min(block_size, end - offset), offset)
+            if not data:
+                break
+            digest.update(data)
+            offset += len(data)
+        return digest.hexdigest()
+
+    def close(self):
+        os.close(self.fd)
+
+
+class datagram_socket(socket):
+    """ 
+    Non-blocking UDP socket of one rdt transfer stream, the datagram I/O layer under send_item and recieve_item. The 
+    kernel send and receive buffers are sized explicitly so bursts of a whole window are not dropped. Datagrams are 
+    received with recv_into into one preallocated buffer: receive() hands out a memoryview of the next ready datagram 
+    that is only valid until the following call, so draining every ready datagram after a wakeup allocates nothing per 
+    packet. wait() blocks until a datagram is ready.
+    """
+    max_datagram = 65507            # largest UDP payload over IPv4
+    ip_mtu = 14                     # Linux IP_MTU socket option, the path mtu of a connected socket
+
+    def __init__(self, port, buffer_size):
+        super().__init__(AF_INET, SOCK_DGRAM)
+        for option in (SO_SNDBUF, SO_RCVBUF):
+            try:
+                self.setsockopt(SOL_SOCKET, option, buffer_size)
+            except OSError:
+                pass                                                    # keep the system default
+        self.bind(('', port))
+        self.setblocking(False)
+        self.buffer = bytearray(self.max_datagram + 1)
+        self.view = memoryview(self.buffer)
+
+    """ Returns the next ready datagram as (memoryview, address), or None if no datagram is ready. """
+    def receive(self):
+        try:
+            length, addr = self.recvfrom_into(self.buffer)
+        except (BlockingIOError, InterruptedError):
+            return None
+        return self.view[:length], addr
+
+    """ Yields every ready datagram, see receive(). """
+    def drain(self):
+        packet = self.receive()
+        while packet is not None:
+            yield packet
+            packet = self.receive()
+
+    """ Blocks until a datagram is ready or timeout seconds passed, forever if timeout is None. """
+    def wait(self, timeout=None):
+        select.select([self], [], [], timeout)
+
+    """ 
+    Returns the largest UDP payload the path to addr carries in one IP packet as far as the kernel knows it, or None 
+    where the path mtu cannot be read.
+    """
+    def path_payload(self, addr):
+        if not sys.platform.startswith("linux"):
+            return None
+        probe = socket(AF_INET, SOCK_DGRAM)
+        try:
+            probe.connect(addr)
+            return min(probe.getsockopt(IPPROTO_IP, self.ip_mtu) - 28, self.max_datagram)   # IPv4 and UDP headers
+        except OSError:
+            return None
+        finally:
+            probe.close()
+
+
+class transfer_checkpoint:
+    """ 
+    On-disk progress of receiving one byte range of the item, kept next to the received file as 
+    <received file>.<offset>.ckpt: the parameters of the start msg, including the sha256 of the range, and a bitmap of 
+    the chunks written so far. Every interval_bytes of new chunks the received data is synced before a new checkpoint is 
+    renamed over the old one, so a checkpoint never claims chunks that are not on disk. A checkpoint that does not match 
+    the new start msg is discarded.
+    """
+    interval_bytes = 1 << 19        # bytes of new chunks between two saves
+    max_have_size = 60000           # largest have list sent in the start ack, in bytes
+
+    def __init__(self, filename, offset, params, num_chunks):
+        self.path = filename + "." + str(offset) + ".ckpt"
+        self.params = params
+        self.num_chunks = num_chunks
+        self.interval = max(1, self.interval_bytes // params["chunk_size"])    # new chunks between two saves
+        self.bitmap = bytearray((num_chunks + 7) // 8)
+        self.unsaved = 0
+        if os.path.isfile(filename):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                params = json.loads(f.readline())
+                bitmap = f.read()
+        except (OSError, ValueError):
+            return
+        if params == self.params and len(bitmap) == len(self.bitmap):
+            self.bitmap[:] = bitmap
+
+    def has(self, seq):
+        return self.bitmap[seq >> 3] >> (seq & 7) & 1
+
+    def add(self, seq):
+        self.bitmap[seq >> 3] |= 1 << (seq & 7)
+        self.unsaved += 1
+
+    """ Returns the chunks held as a list of (first, end) sequence number ranges, end exclusive. """
+    def held_ranges(self):
+        ranges = []
+        seq = 0
+        while seq < self.num_chunks:
+            if seq & 7 == 0 and self.bitmap[seq >> 3] == 0:           # skip whole empty bytes
+                seq += 8
+                continue
+            if not self.has(seq):
+                seq += 1
+                continue
+            first = seq
+            while seq < self.num_chunks and self.has(seq):
+                seq += 1
+            ranges.append((first, seq))
+        return ranges
+
+    """ Returns the have=first-end,first-end,... token of the start ack naming the chunks already held. """
+    def have_msg(self):
+        msg = "have=" + ",".join(str(first) + "-" + str(end) for first, end in self.held_ranges())
+        if len(msg) > self.max_have_size:                               # the seller re-sends what is cut off
+            msg = msg[:msg.rfind(",", 0, self.max_have_size)]
+        return msg
+
+    """ Syncs the chunks written to sink and replaces the checkpoint file with the current bitmap. """
+    def save(self, sink):
+        sink.sync()
+        with open(self.path + ".tmp", 'wb') as f:
+            f.write(json.dumps(self.params).encode() + b"\n")
+            f.write(self.bitmap)
+        os.replace(self.path + ".tmp", self.path)
+        self.unsaved = 0
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class compressed_stream:
+    """ 
+    The compressed form of one byte range of the item, cut into chunks of the size each buyer agreed on. The range is 
+    compressed as a single stream, block_size bytes at a time and only as far as the chunks asked for so far, and the 
+    compressed bytes are kept for re-sending. The sessions of all buyers of the range share one compressed_stream, so 
+    it is compressed once.
+    """
+    block_size = 1 << 16            # bytes of the range compressed per step
+
+    def __init__(self, item, compressor):
+        self.item = item
+        self.compressor = compressor        # None once the stream has been flushed
+        self.read = 0                       # bytes of item compressed so far
+        self.data = bytearray()             # compressed bytes so far
+
+    """ Returns compressed chunk seq of chunk_size bytes, or b'' past the end of the stream. """
+    def chunk(self, seq, chunk_size):
+        end = (seq + 1) * chunk_size
+        while len(self.data) < end and self.compressor is not None:
+            self.compress_block()
+        return bytes(self.data[seq * chunk_size:end])
+
+    def compress_block(self):
+        if self.read < len(self.item):
+            self.data += self.compressor.compress(self.item[self.read:self.read + self.block_size])
+            self.read += self.block_size
+        else:
+            self.data += self.compressor.flush()
+            self.compressor = None
+
+
+# stream codecs by name: (compressor for a level, decompressor), a new codec plugs in here
+stream_codecs = {"zlib": (lambda level: zlib.compressobj(level), zlib.decompressobj)}
+if lzma is not None:
+    stream_codecs["lzma"] = (lambda level: lzma.LZMACompressor(preset=level), lzma.LZMADecompressor)
+
+
+class delta_patch:
+    """ 
+    Rebuilds the item in place in the buyer's copy of an earlier version, the file of sink, from the seller's delta 
+    stream. The stream is a sequence of instructions, each an op header followed for literals by the new data, and is 
+    fed to apply() in order in pieces of any size. The file is written front to back, and the bytes of the earlier 
+    version it overwrites are kept in memory while they lie less than backlog bytes before the position written to, so 
+    blocks may be copied from anywhere past the position or up to backlog bytes before it, as after an insertion. Blocks 
+    that stayed in place are not moved at all.
+    """
+    op = struct.Struct('!BQI')      # instruction: op, offset in the earlier version, length
+    literal_op = 0                  # length bytes of new data follow
+    copy_op = 1                     # copy length bytes of the earlier version from offset
+    copy_size = 1 << 20             # bytes moved per read and write of a copy
+    backlog = 8 << 20               # overwritten bytes of the earlier version kept for copies
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.buffer = bytearray()           # stream bytes not applied yet
+        self.literal = 0                    # bytes of the current literal still to come
+        self.saved = collections.deque()    # [offset, bytes] of the earlier version overwritten lately, in order
+        self.reused = 0                     # bytes copied from the earlier version
+
+    """ Applies the next piece of the delta stream, writing the item from position on. Returns the bytes written. """
+    def apply(self, data, position):
+        self.buffer += data
+        start = position
+        while True:
+            if self.literal > 0:
+                take = min(self.literal, len(self.buffer))
+                if take == 0:
+                    break
+                self.write(position, self.buffer[:take])
+                del self.buffer[:take]
+                self.literal -= take
+                position += take
+                continue
+            if len(self.buffer) < self.op.size:
+                break
+            kind, old, length = self.op.unpack_from(self.buffer)
+            del self.buffer[:self.op.size]
+            if kind == self.literal_op:
+                self.literal = length
+                continue
+            if old != position:
+                for done in range(0, length, self.copy_size):
+                    self.write(position + done, self.read(old + done, min(self.copy_size, length - done)))
+            self.reused += length
+            position += length
+        return position - start
+
+    """ Returns length bytes of the earlier version from offset, from the saved bytes where overwritten already. """
+    def read(self, offset, length):
+        data = bytearray(self.sink.read(offset, length))
+        for start, saved in self.saved:
+            first, end = max(offset, start), min(offset + length, start + len(saved))
+            if first < end:
+                data[first - offset:end - offset] = saved[first - start:end - start]
+        return data
+
+    """ Writes data at position, saving the bytes of the earlier version it overwrites. """
+    def write(self, position, data):
+        old = self.sink.read(position, len(data))
+        if self.saved and self.saved[-1][0] + len(self.saved[-1][1]) == position:
+            self.saved[-1][1] += old
+        else:
+            self.saved.append([position, bytearray(old)])
+        limit = position + len(data) - self.backlog                     # no copy reaches below this any more
+        while self.saved and self.saved[0][0] < limit:
+            start, saved = self.saved[0]
+            if start + len(saved) <= limit:
+                self.saved.popleft()
+            else:
+                del saved[:limit - start]
+                self.saved[0][0] = limit
+        self.sink.write(position, data)
+
+
+class transfer_session:
+    """ 
+    Sender side state of the transfer of item, the whole file item or one stream's byte range of it, to one winning 
+    buyer at addr. Every packet, the start and fin control msgs included, waits in in_flight with its own timer until 
+    its ack arrives, and the congestion controller cc limits how many chunks are in flight. The sessions of all winners 
+    are driven by one loop on a shared socket (see auc_client.send_sessions).
+    """
+    start_phase = 0                 # waiting for the start msg ack
+    data_phase = 1                  # sending chunks
+    fin_phase = 2                   # waiting for the fin msg ack
+    done_phase = 3
+
+    def __init__(self, addr, initial_rto, cc, item, start_msg, chunk_size):
+        self.addr = addr
+        self.chunk_size = chunk_size        # offered in the start msg, then the size the buyer accepted
+        self.item = item                    # memoryview of the bytes this session sends
+        self.compressed = None              # compressed_stream offered in the start msg and sent if the buyer accepts
+        self.delta = None                   # delta stream sent instead of the item if the buyer sent block checksums
+        self.fec = False                    # if the buyer accepted parity packets
+        self.start_msg = start_msg
+        self.rtt = rtt_estimator(initial_rto)
+        self.cc = cc
+        self.next_send = 0                  # time the pacing lets the next chunk go
+        self.paced = False                  # if chunks are waiting for the pacing
+        self.phase = self.start_phase
+        self.base = 0                       # oldest chunk not acked yet
+        self.next_seq = 0                   # next chunk to send
+        self.in_flight = {}                 # (ack flags, seq) -> [type, payload, last send time, re-sent]
+        self.held = collections.deque()     # (first, end) ranges of chunks the buyer already holds
+
+    """ 
+    Returns chunk seq of the session, of the delta stream if the buyer accepted a delta transfer and compressed if it 
+    accepted compression, or b'' past the end.
+    """
+    def chunk(self, seq):
+        if self.compressed is not None:
+            return self.compressed.chunk(seq, self.chunk_size)
+        data = self.delta if self.delta is not None else self.item
+        return data[seq*self.chunk_size:(seq + 1)*self.chunk_size]
+
+    """ Returns True if the chunks are not the plain bytes of the item. """
+    def encoded(self):
+        return self.compressed is not None or self.delta is not None
+
+
+class start_options:
+    """ 
+    Receiver side options of one stream, negotiated by the seller's start msg and the buyer's start ack: the byte range, 
+    window, chunk size, codec, parity block size and ack holding, the checkpoint the transfer resumes from and the block 
+    checksums of the earlier version for a delta transfer.
+    """
+    def __init__(self, offset, total_bytes, window_size, chunk_size):
+        self.offset = offset                # file offset of the stream's byte range
+        self.total_bytes = total_bytes      # length of the byte range
+        self.window_size = window_size
+        self.chunk_size = chunk_size        # accepted chunk size, 0 if none was offered
+        self.checkpoint = None              # transfer_checkpoint the chunks are resumed from and recorded in
+        self.codec = None                   # codec of the compressed chunks, None for the raw item
+        self.fec_block = 0                  # chunks per parity block, 0 for no parity packets
+        self.ack_every = 1                  # new chunks acked at once
+        self.ack_delay = 0                  # seconds an ack is held back at most
+        self.signature = None               # block checksums of the earlier version, None for no delta transfer
+
+
 class auc_client:
     # default server name and port
     serverName = "192.168.0.15"
     serverPort = 12345
+    room = "lobby"                  # id of the auction room to join
 
     # Project 2:
-    sendingPort = 12346             # specified sending port for rdt
-    chunk_size = 2000
+    sendingPort = 12346             # specified sending port for rdt, the first of the stream ports
+    streams = 1                     # parallel transfer streams, each on its own port and worker process
+    chunk_size = 2000               # smallest chunk size, probed upward to what the path and the buyer take
+    max_chunk_size = 65495          # largest chunk size, a parity packet of it still fits one UDP datagram
+    socket_buffer = 1 << 22         # bytes requested for the kernel send and receive buffers of a transfer socket
     loss_rate = 0                   # specified loss rate for rdt
     filename = "tosend.txt"         # filename of seller item
-    timeout = 2
-    initial_send = True             # if this is the first instance of msg send
-    file_arr = []                   # received file buffer for winning buyer
+    timeout = 2                     # initial rdt retransmission timeout in seconds, adapted from measured rtt
+    window_size = 1                 # 1 for stop and wait, >1 for selective repeat window size
+    congestion_control = "veno"     # name of the congestion controller in congestion_controllers
+    pacing_burst = 4                # chunks the pacing lets go at once after the sender fell behind
+    codec = "none"                  # compression offered to the buyer, "none" or a name in stream_codecs
+    level = 6                       # compression level of the codec
+    probe_size = 1 << 18            # bytes of an item compressed to check if it is worth compressing
+    min_saving = 0.1                # share of the probe the codec must save, otherwise the item is sent raw
+    fec_block = 0                   # data chunks per XOR parity packet, 0 for no forward error correction
+    ack_every = 2                   # new chunks the buyer acks together
+    ack_delay = 0.001               # seconds the buyer may hold back an ack
+    reorder_threshold = 3           # later chunks acked before a chunk that is not counts as lost
+    delta = False                   # if the seller offers delta transfers against the buyer's earlier version
+    delta_block = 1024              # smallest block size of the buyer's block checksums
+    delta_max_blocks = 3000         # most block checksums, so they fit the start ack datagram
 
-    """ Initializes server name and port from run command arguments and starts the main() function."""
-    def __init__(self):
-        self.serverName = sys.argv[1]
-        self.serverPort = int(sys.argv[2])
-        self.sendingPort = int(sys.argv[3])
+    # rdt packet header: sequence number, type, flags, payload length
+    header = struct.Struct('!IBBH')
+    control_type = 0                # start / fin msgs, payload is ascii text
+    data_type = 1                   # file chunk, payload is raw bytes
+    ack_type = 2                    # ack of the msg with the same sequence number, no payload
+    parity_type = 3                 # XOR of a block of chunks, sequence number is the block, never acked
+    control_flag = 1                # set on acks of control msgs
+    recovered_flag = 2              # set on acks of chunks the buyer rebuilt from parity
+    sack_flag = 4                   # set on cumulative data acks, the payload is a bitmap of chunks held past it
+    parity_header = struct.Struct('!HH')    # parity payload prefix: chunks in the block, XOR of their lengths
+    block_checksum = struct.Struct('!I8s')  # delta block checksums: adler32, blake2b digest
+    received_filename = "received.txt"  # filename the winning buyer streams the item to
+    verbosity = 1                   # 0 silent, 1 transfer start and summary, 2 every packet
+    metrics_file = None             # JSON lines or .csv file transfer metrics are appended to
+    metrics = None                  # transfer_metrics of the current transfer
+    reserved_sockets = {}           # transfer port -> datagram_socket bound before the hello, see reserve_ports
+    disconnected_msg = "Lost the connection. Disconnecting from the Auctioneer server.\n"
 
-        if len(sys.argv) == 5:
-            self.loss_rate = float(sys.argv[4])
+    """ 
+    Initializes server name and port from the run command arguments, or from argv when the client is driven by 
+    another script such as the benchmark. Call main() to start the auction.
+    """
+    def __init__(self, argv=None):
+        parser = argparse.ArgumentParser(description="Auction client with UDP rdt item transfer.")
+        parser.add_argument("server_ip")
+        parser.add_argument("server_port", type=int)
+        parser.add_argument("transfer_port", type=int)
+        parser.add_argument("loss_rate", type=float, nargs="?", default=self.loss_rate)
+        parser.add_argument("--room", default=self.room,
+                            help="auction room to join, the first client to join a room becomes its seller")
+        parser.add_argument("--window", type=int, default=self.window_size,
+                            help="selective repeat window size, 1 for stop and wait")
+        parser.add_argument("--streams", type=int, default=self.streams,
+                            help="parallel transfer streams on ports transfer_port, transfer_port + 1, ...")
+        parser.add_argument("--cc", choices=sorted(congestion_controllers), default=self.congestion_control,
+                            help="congestion control of the selective repeat window")
+        parser.add_argument("--codec", choices=["none"] + sorted(stream_codecs), default=self.codec,
+                            help="compression offered to the buyer for the item transfer")
+        parser.add_argument("--level", type=int, choices=range(10), default=self.level, metavar="0-9",
+                            help="compression level of the codec")
+        parser.add_argument("--chunk-size", type=int, default=self.chunk_size, metavar="N",
+                            help="smallest chunk size in bytes, probed upward in the start handshake")
+        parser.add_argument("--max-chunk-size", type=int, default=self.max_chunk_size, metavar="N",
+                            help="largest chunk size in bytes, equal to --chunk-size for no probing")
+        parser.add_argument("--fec", type=int, default=self.fec_block, metavar="K",
+                            help="send an XOR parity packet after every K chunks, 0 for none")
+        parser.add_argument("--delta", action="store_true",
+                            help="send only the changes to the version of the item the buyer already holds")
+        parser.add_argument("--ack-every", type=int, default=self.ack_every, metavar="N",
+                            help="new chunks the buyer acks together")
+        parser.add_argument("--ack-delay", type=float, default=self.ack_delay * 1000, metavar="MS",
+                            help="milliseconds the buyer may hold back an ack")
+        parser.add_argument("-v", "--verbose", action="count", default=0, help="log every rdt packet")
+        parser.add_argument("-q", "--quiet", action="store_true", help="no rdt transfer output")
+        parser.add_argument("--metrics", help="append transfer metrics to this JSON lines or .csv file")
+        args = parser.parse_args(argv)
+        if not 0 <= args.fec <= 0xffff:                                 # parity_header counts the chunks in 16 bits
+            parser.error("argument --fec: K must be between 0 and 65535")
 
-        self.main()
+        self.serverName = args.server_ip
+        self.serverPort = args.server_port
+        self.sendingPort = args.transfer_port
+        self.loss_rate = args.loss_rate
+        self.room = args.room
+        self.window_size = max(1, args.window)
+        self.congestion_control = args.cc
+        self.streams = max(1, args.streams)
+        self.codec = args.codec
+        self.level = args.level
+        self.fec_block = args.fec
+        self.delta = args.delta
+        self.max_chunk_size = min(max(1, args.max_chunk_size),
+                                  datagram_socket.max_datagram - self.header.size - self.parity_header.size)
+        self.chunk_size = min(max(1, args.chunk_size), self.max_chunk_size)
+        self.ack_every = max(1, args.ack_every)
+        self.ack_delay = max(0, args.ack_delay) / 1000
+        self.verbosity = 0 if args.quiet else 1 + args.verbose
+        self.metrics_file = args.metrics
 
     """ 
-    Creates a connection to the auction server and at the end of the auction initiates file transfer for Seller 
-    and Winning Buyer.
-    - If you are the first to connect to the server you will be connected as a seller client, if not you will be 
-    connected as a buyer client. 
-    - If the client connects when the sever is busy setting up a seller connection or the server is busy handling 
-    bidding the client will receive a "connect again later" message and the client will close the socket and exit. 
+    Creates a connection to the auction server, joins the auction room and at the end of the auction initiates file 
+    transfer for Seller and Winning Buyer. The hello message carries the room and the transfer ports of every stream, so 
+    the result already names the peer to transfer with.
+    - If you are the first to join the room you will be connected as a seller client, if not you will be connected as a 
+    buyer client.
+    - If the client joins when the room is busy setting up a seller connection or the room is busy handling bidding the 
+    client is queued for the next auction and prints its queue position as it changes. 
+    - If the room's queue is full the client will receive a "connect again later" message and the client will close the 
+    socket and exit.
+    - If the server closes the connection before the auction result the client prints a disconnect message and exits.
     """
     def main(self):
+        ports = [self.sendingPort + stream for stream in range(self.streams)]
+        self.reserve_ports(ports)                                       # the ports announced are ours before the hello
         clientSocket = socket(AF_INET, SOCK_STREAM)
         clientSocket.connect((self.serverName, self.serverPort))        # client connection
+        reader = msg_reader(clientSocket)
+        send_msg(clientSocket, "hello", room=self.room, port=self.sendingPort, ports=ports)    # join the auction room
 
-        client_status_msg = clientSocket.recv(1024).decode()
-        if "connect again later" in client_status_msg:                  # if server sends a busy msg disconnect and exit
-            print(client_status_msg)
+        client_status = self.recv_server_msg(clientSocket, reader)
+        while client_status["type"] == "queued":                        # wait in the room's queue
+            print(client_status["text"])
+            client_status = self.recv_server_msg(clientSocket, reader)
+        if client_status["type"] == "busy":                             # if server sends a busy msg disconnect and exit
+            print(client_status["text"])
             clientSocket.close()
             exit()
-        if "Seller" in client_status_msg:                               # if client is a buyer prompt for auction info
-            auc_info_msg = input(client_status_msg)
-            clientSocket.send(auc_info_msg.encode())
-            received_auc_info = clientSocket.recv(1024).decode()
-
-            while "Invalid" in received_auc_info:                       # if invalid auction info given prompt again
-                new_auc_info = input(received_auc_info)
-                clientSocket.send(new_auc_info.encode())
-                received_auc_info = clientSocket.recv(1024).decode()
-
-            print(received_auc_info)
-
-            auction_finished = clientSocket.recv(1024).decode()
-            print(auction_finished)
-
-            # Project2: Start sending item.
-            if "Success" in auction_finished:
-                clientSocket.send(str(self.sendingPort).encode())
-                buyer_info = clientSocket.recv(1024).decode().split(" ")
-                buyer_ip = buyer_info[0]
-                buyer_port = buyer_info[1]
-                buyer_port = int(buyer_port)
-                self.send_item(buyer_ip, buyer_port)
-
-        else:                                                           # if client is a seller wait for bid start
-            print(client_status_msg)
-            did_bid_start = clientSocket.recv(1024).decode()
-            if "waiting" in did_bid_start:
-                print(did_bid_start)
-                did_bid_start = clientSocket.recv(1024).decode()
-
-            bid = input(did_bid_start)                                  # at bid start prompt for bid
-            clientSocket.send(bid.encode())
-            received_bid = clientSocket.recv(1024).decode()
-
-            while "Invalid" in received_bid:                            # if bid is invalid prompt again
-                new_bid = input(received_bid)
-                clientSocket.send(new_bid.encode())
-                received_bid = clientSocket.recv(1024).decode()
-
-            print(received_bid)
-
-            auction_finished = clientSocket.recv(1024).decode()         # print auction result and disconnect
-            print(auction_finished)
-
-            # Project2: Start receiving item.
-            if "won" in auction_finished:
-                clientSocket.send(str(self.sendingPort).encode())
-                seller_info = clientSocket.recv(1024).decode().split(" ")
-                seller_ip = seller_info[0]
-                seller_port = seller_info[1]
-                seller_port = int(seller_port)
-                self.recieve_item(seller_ip, seller_port)
+        if client_status["role"] == "seller":
+            if client_status.get("restored"):                           # auction restored from the server's journal
+                print(client_status["text"])
+                received_auc_info = self.recv_server_msg(clientSocket, reader)
+            else:                                                       # if client is a seller prompt for auction info
+                auc_info = input(client_status["text"])
+                send_msg(clientSocket, "auction", **self.parse_auction_request(auc_info))
+                received_auc_info = self.recv_server_msg(clientSocket, reader)
+
+                while received_auc_info["type"] == "invalid":           # if invalid auction info given prompt again
+                    new_auc_info = input(received_auc_info["text"])
+                    send_msg(clientSocket, "auction", **self.parse_auction_request(new_auc_info))
+                    received_auc_info = self.recv_server_msg(clientSocket, reader)
+
+            print(received_auc_info["text"])
+
+            auction_finished = self.recv_server_msg(clientSocket, reader)
+            print(auction_finished["text"])
+
+            # Project2: Start sending item to the winning buyers.
+            if auction_finished["peers"]:
+                self.send_item([(buyer_ip, int(buyer_port), [int(port) for port in buyer_ports])
+                                for buyer_ip, buyer_port, buyer_ports in auction_finished["peers"]])
+
+        else:                                                           # if client is a buyer wait for bid start
+            print(client_status["text"])
+            did_bid_start = self.recv_server_msg(clientSocket, reader)
+            while did_bid_start["type"] == "wait":
+                print(did_bid_start["text"])
+                did_bid_start = self.recv_server_msg(clientSocket, reader)
+
+            received_bid = did_bid_start                                # bid restored by the server
+            if did_bid_start["type"] == "bid_start" and "price" in did_bid_start:   # ascending auction
+                received_bid = self.ascending_bidding(clientSocket, reader, did_bid_start)
+                if received_bid is None:                                # server closed the connection
+                    print(self.disconnected_msg)
+                    clientSocket.close()
+                    exit()
+            elif did_bid_start["type"] == "bid_start":
+                bid = input(did_bid_start["text"])                      # at bid start prompt for bid
+                send_msg(clientSocket, "bid", amount=self.parse_int(bid))
+                received_bid = self.recv_server_msg(clientSocket, reader)
+
+            while received_bid["type"] == "invalid":                    # if bid is invalid prompt again
+                new_bid = input(received_bid["text"])
+                send_msg(clientSocket, "bid", amount=self.parse_int(new_bid))
+                received_bid = self.recv_server_msg(clientSocket, reader)
+
+            auction_finished = received_bid                             # bidding deadline passed before the bid
+            if received_bid["type"] == "bid_ok":
+                print(received_bid["text"])
+                auction_finished = self.recv_server_msg(clientSocket, reader)   # print auction result and disconnect
+            print(auction_finished["text"])
+            clientSocket.close()                                        # the server lingers until the buyer closes
+
+            # Project2: Start receiving item from the seller.
+            if auction_finished["peer"] is not None:
+                seller_ip, _, seller_ports = auction_finished["peer"]
+                self.recieve_item(seller_ip, [int(port) for port in seller_ports])
 
         clientSocket.close()
 
+    """ 
+    Bids in an ascending auction once bid_start arrived, until the auction result arrives and is returned, or None if 
+    the server closed the connection. Every line typed is sent as a bid while the prices the server pushes are shown as 
+    they arrive, so typing never holds up the price updates. Once the input ends the buyer just follows the prices.
+    """
+    def ascending_bidding(self, clientSocket, reader, bid_start):
+        print(bid_start["text"])
+        stdin = sys.stdin.fileno()
+        typed = b''                                                     # typed input not ending in a newline yet
+        watched = [clientSocket, stdin]
+        leading = None                                                  # own bid that is the current price
+        while True:
+            msg = reader.next_msg()
+            if msg is None:
+                for ready in select.select(watched, [], [])[0]:
+                    if ready is clientSocket:
+                        if not reader.fill():
+                            return None
+                        continue
+                    data = os.read(stdin, 4096)
+                    if not data:                                        # no more bids, send a last unfinished line
+                        watched.remove(stdin)
+                        data = b'\n'
+                    typed += data
+                    *lines, typed = typed.split(b'\n')
+                    for line in lines:
+                        if line.strip():
+                            send_msg(clientSocket, "bid", amount=self.parse_int(line.decode()))
+                continue
+            if msg["type"] == "result":
+                return msg
+            if msg["type"] == "bid_ok":
+                leading = msg["price"]
+            elif msg["type"] == "price" and msg["price"] == leading:    # the broadcast of our own bid
+                continue
+            print(msg["text"])
 
     """ 
-    Project 2: Handles UDP rdt for a seller client. Sends CHUNK_SIZE chunks of the file through stop and wait. Utilizes method 
-    send_packet for actual packet construction and sending.
+    Returns the next control message from the server. If the server closed the connection instead the client prints 
+    disconnected_msg and exits.
     """
-    def send_item(self, buyer_ip, buyer_port):
+    def recv_server_msg(self, clientSocket, reader):
+        msg = reader.recv_msg()
+        if msg is None:
+            print(self.disconnected_msg)
+            clientSocket.close()
+            exit()
+        return msg
 
-        clientSocket = socket(AF_INET, SOCK_DGRAM)
-        clientSocket.bind(('', self.sendingPort))
-        seq_num = 0
+    """ 
+    Binds the transfer socket of every port in ports before the ports are announced to the server, so a port in use 
+    fails the client before it joins an auction. The stream workers are forked and take the sockets over (see 
+    transfer_socket).
+    """
+    def reserve_ports(self, ports):
+        for port in ports:
+            self.reserved_sockets[port] = datagram_socket(port, self.socket_buffer)
 
-        print('UDP socket opened for RDT.')
-        print('Start sending file.')
+    """ Returns the transfer socket of stream, the one reserved for its port or a newly bound one. """
+    def transfer_socket(self, stream):
+        sock = self.reserved_sockets.pop(self.sendingPort + stream, None)
+        return sock if sock is not None else datagram_socket(self.sendingPort + stream, self.socket_buffer)
 
-        if os.path.isfile(self.filename):  # if file is found
+    """ Closes the reserved transfer sockets so stream workers that are not forked can bind their ports. """
+    def release_ports(self):
+        for sock in self.reserved_sockets.values():
+            sock.close()
+        self.reserved_sockets.clear()
 
-            total_bytes = os.stat(self.filename).st_size
+    """ Returns text as an int, or the stripped text itself if it is not an integer so the server can reject it. """
+    def parse_int(self, text):
+        try:
+            return int(text)
+        except ValueError:
+            return text.strip()
 
-            # Send rdt start msg
-            print('Sending control seq ' + str(seq_num) + ': start ' + str(total_bytes))
-            while True:
-                if self.send_packet(seq_num, 0, "start " + str(total_bytes), clientSocket, buyer_ip, buyer_port) == 1:
-                    self.initial_send = True
-                    break
-                print('Msg re-sent HERE: ' + str(seq_num))
-
-            seq_num = 0 if seq_num == 1 else 1
-
-            # Start rdt file transmission
-            f = open(file=self.filename, mode='rb')
-            chunk = f.read(self.chunk_size)
-            num_chunks_sent = 0
-
-            while chunk:
-                num_chunks_sent += 1
-
-                # Send chunk until ack received
-                while True:
-                    if self.initial_send:
-                        print('Sending data seq ' + str(seq_num) + ': ' + str(num_chunks_sent*self.chunk_size) + ' / ' + str(total_bytes))
-                    else:
-                        print('Msg re-sent: ' + str(seq_num))
-
-                    # Send chunk and check for ack success
-                    if self.send_packet(seq_num, 1, chunk, clientSocket, buyer_ip, buyer_port) == 1:
-                        seq_num = 0 if seq_num == 1 else 1
-                        chunk = f.read(self.chunk_size)
-                        self.initial_send = True
-                        break
+    """ 
+    Parses the auction request typed by the seller, "auction_type minimum_price number_of_bidders item_name" with an 
+    optional bidding deadline in seconds and number of units, into the fields of an auction message. Malformed fields 
+    are passed on as typed so the server responds with its invalid auction request prompt.
+    """
+    def parse_auction_request(self, auc_info):
+        auc_info_arr = auc_info.split()
+        if len(auc_info_arr) not in (4, 5, 6):
+            return {"item": auc_info}
+        fields = {"auc_type": self.parse_int(auc_info_arr[0]), "lowest_price": self.parse_int(auc_info_arr[1]),
+                  "num_bids": self.parse_int(auc_info_arr[2]), "item": auc_info_arr[3], "deadline": 0}
+        if len(auc_info_arr) >= 5:
+            try:
+                fields["deadline"] = float(auc_info_arr[4])
+            except ValueError:
+                fields["deadline"] = auc_info_arr[4]
+        if len(auc_info_arr) == 6:
+            fields["units"] = self.parse_int(auc_info_arr[5])
+        return fields
 
-            # Send rdt finished
-            print('Sending control seq ' + str(seq_num) + ': fin')
-            while True:
-                if self.send_packet(seq_num, 0, "fin", clientSocket, buyer_ip, buyer_port) == 1:
-                    self.initial_send = True
-                    break
-                print('Msg re-sent: ' + str(seq_num))
 
+    """ 
+    Sends one rdt packet to addr. The header and payload are handed to the socket as separate buffers (scatter gather) 
+    so the payload bytes or memoryview are never copied into a concatenated packet.
+    """
+    def send_packet(self, sock, seq_num, type, payload, addr, flags=0):
+        try:
+            sock.sendmsg([self.header.pack(seq_num, type, flags, len(payload)), payload], [], 0, addr)
+        except BlockingIOError:                                         # send buffer full, lost like on the path
+            pass
+        self.metrics.packets_sent += 1
+
+    """ Sends an ack packet for seq_num to addr, header only unless a payload is given. """
+    def send_ack(self, sock, seq_num, addr, flags=0, payload=b''):
+        try:
+            sock.sendto(self.header.pack(seq_num, self.ack_type, flags, len(payload)) + payload, addr)
+        except BlockingIOError:                                         # send buffer full, lost like on the path
+            pass
+        self.metrics.acks_sent += 1
+
+    """ Feeds a round trip time sample to the retransmission timeout estimator of session and the transfer metrics. """
+    def sample_rtt(self, session, rtt):
+        session.rtt.sample(rtt)
+        self.metrics.rtt_samples.append(rtt)
+
+    """ Stops the transfer clock, appends the metrics to the metrics file if one is set and prints the summary. """
+    def report_metrics(self):
+        self.metrics.finish()
+        if self.metrics_file:
+            self.metrics.emit(self.metrics_file)
+        if self.verbosity > 0:
+            print('Transfer metrics: ' + json.dumps(self.metrics.summary()))
+
+    """ 
+    Project 2: Handles UDP rdt for a seller client. Delivers the file item to every winning buyer in buyers, a list of 
+    (ip, port, ports) where ports are the buyer's stream transfer ports. The file is split into as many chunk aligned 
+    byte ranges as both sides have streams, each sent by its own worker process (see send_stream).
+    """
+    def send_item(self, buyers):
+        if self.verbosity > 0:
+            print('Start sending file to ' + str(len(buyers)) + ' buyer(s).')
+
+        if not os.path.isfile(self.filename):  # if file is not found
+            if self.verbosity > 0:
+                print("Can't open file item. Notifying buyer and exiting.")
+            self.send_stream(0, [((ip, ports[0]), None) for ip, _, ports in buyers])
+            return
+
+        total_bytes = os.stat(self.filename).st_size
+        streams = []                                                    # per stream, list of (buyer addr, byte range)
+        for ip, _, ports in buyers:
+            for stream, byte_range in enumerate(self.byte_ranges(total_bytes, min(self.streams, len(ports)))):
+                if stream == len(streams):
+                    streams.append([])
+                streams[stream].append(((ip, ports[stream]), byte_range))
+
+        if len(streams) == 1:
+            self.send_stream(0, streams[0])
         else:
-            print("Can't open file item. Notifying buyer and exiting.")
-            while True:
-                if self.send_packet(seq_num, 0, "Can't open file item. Exiting.", clientSocket, buyer_ip, buyer_port) == 1:
-                    break
-                print('Msg re-sent: ' + str(seq_num))
+            if multiprocessing.get_start_method() != "fork":
+                self.release_ports()
+            with multiprocessing.Pool(len(streams)) as pool:
+                pool.starmap(self.send_stream, enumerate(streams))
 
+    """ 
+    Splits total_bytes into n byte ranges (offset, length) on chunk boundaries, the last ranges are shorter or empty if 
+    there are fewer chunks than streams.
+    """
+    def byte_ranges(self, total_bytes, n):
+        num_chunks = -(-total_bytes // self.chunk_size)
+        per_stream = -(-num_chunks // n) * self.chunk_size
+        return [(min(i * per_stream, total_bytes), max(0, min(per_stream, total_bytes - i * per_stream)))
+                for i in range(n)]
+
+    """ 
+    Sends one stream of the file item from seller port sendingPort + stream to every buyer in targets, a list of (buyer 
+    addr, (offset, length)). Every session sends slices of the same memory mapping of the file. The start msg carries 
+    the sha256 of the range so the buyer can verify and resume it, the codec offered if the range compresses (see 
+    compress_range), the offer of a delta transfer if the range is the whole file, and the offset and file size of a 
+    range that is not the whole file. A byte range of None notifies the buyer that the file item could not be opened.
+    """
+    def send_stream(self, stream, targets):
+
+        clientSocket = self.transfer_socket(stream)
+        self.metrics = transfer_metrics("send", self.loss_rate, self.window_size, self.chunk_size)
+        self.metrics.peers = len(targets)
+        self.metrics.stream = stream
+        self.metrics.congestion_control = self.congestion_control
+        self.metrics.fec_block = self.fec_block
+        controller = congestion_controllers[self.congestion_control]
+
+        if self.verbosity > 0:
+            print('UDP socket opened for RDT stream ' + str(stream) + '.')
+
+        item = memoryview(b'')
+        total_bytes = os.stat(self.filename).st_size if os.path.isfile(self.filename) else 0
+        if total_bytes > 0:
+            # Start rdt file transmission, chunks are slices of the memory mapped file item
+            with open(self.filename, 'rb') as f:
+                item = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        sessions = []
+        digests = {}                                                    # byte range -> sha256, hashed once per range
+        compressed = {}                                                 # byte range -> compressed_stream or None
+        for addr, byte_range in targets:
+            chunk_size = self.chunk_size
+            if byte_range is None:
+                start_msg = b"Can't open file item. Exiting."
+                payload = item
+            else:
+                # Send rdt start msg, announcing the window and offering a chunk size
+                chunk_size = self.probe_chunk_size(clientSocket, addr)
+                offset, length = byte_range
+                payload = item[offset:offset + length]
+                if byte_range not in digests:
+                    digests[byte_range] = hashlib.sha256(payload).hexdigest()
+                    compressed[byte_range] = self.compress_range(payload)
+                start_msg = "start " + str(length) + " " + str(self.window_size) + " " + str(chunk_size)
+                start_msg += " sha256=" + digests[byte_range]
+                if compressed[byte_range] is not None:
+                    start_msg += " codec=" + self.codec + ":" + str(self.level)
+                if self.fec_block > 0:
+                    start_msg += " fec=" + str(self.fec_block)
+                if self.delta and length == total_bytes:
+                    start_msg += " delta=1"
+                start_msg += " ack=" + str(self.ack_every) + ":" + str(self.ack_delay * 1000)
+                if length != total_bytes:
+                    start_msg += " offset=" + str(offset) + " total=" + str(total_bytes)
+                start_msg = start_msg.encode()
+            session = transfer_session(addr, self.timeout, controller(self.window_size), payload, start_msg, chunk_size)
+            session.compressed = compressed.get(byte_range)
+            sessions.append(session)
+        self.send_sessions(sessions, clientSocket)
+
+        self.metrics.congestion_events = sum(session.cc.events for session in sessions)
         clientSocket.close()
+        self.report_metrics()
 
     """ 
-    Project 2: Handles UDP rdt packet send for a seller client. Sends CHUNK_SIZE chunk of the file through stop and 
-    wait. Waits timeout seconds for ack. Returns 1 ack success if received correct sequence ack within timeout seconds.
-    Returns 0 if timeout occurs, ack is dropped or incorrect sender. Will drop msgs with the specified loss_rate.
+    Returns the chunk size offered to the buyer at addr, probed upward from chunk_size to the largest chunk whose 
+    packets the path to the buyer carries unfragmented, at most max_chunk_size. The buyer may accept a smaller one.
     """
-    def send_packet(self, seq_num, type, chunk, clientSocket, buyer_ip, buyer_port):
-        self.initial_send = False
+    def probe_chunk_size(self, clientSocket, addr):
+        path = clientSocket.path_payload(addr)
+        if path is None:
+            return self.chunk_size
+        return max(self.chunk_size, min(self.max_chunk_size, path - self.header.size - self.parity_header.size))
 
-        header = ""
-        if type == 0:
-            header += str(seq_num) + str(type) + chunk
-        else:
-            header += str(seq_num) + str(type) + chunk.decode()
+    """ 
+    Returns a compressed_stream of payload with the configured codec, or None if no codec is set or compressing the 
+    first probe_size bytes of payload saves less than min_saving of them, as for already compressed items.
+    """
+    def compress_range(self, payload):
+        if self.codec == "none" or len(payload) == 0:
+            return None
+        make_compressor = stream_codecs[self.codec][0]
+        probe = make_compressor(self.level)
+        sample = payload[:self.probe_size]
+        if len(probe.compress(sample)) + len(probe.flush()) > len(sample) * (1 - self.min_saving):
+            if self.verbosity > 0:
+                print('Item does not compress with ' + self.codec + ', sending it raw.')
+            return None
+        return compressed_stream(payload, make_compressor(self.level))
 
+    """ 
+    Returns the delta stream of the item payload against the buyer's earlier version, given by the delta token of the 
+    start ack, block_size:base64 of the adler32 and blake2b checksums of its blocks. An invalid token yields a stream 
+    of the whole payload as literal data, the buyer has already set out to patch its copy. The rolling adler32 of the 
+    block_size bytes at every position of payload is looked up among the buyer's blocks, a block found whose blake2b 
+    also matches becomes a copy instruction (see delta_patch) if it lies no more than the patch backlog before the 
+    position, and scanning goes on after it. Runs of consecutive blocks are merged into one copy, and everything 
+    between copies is sent as literal data. Unchanged stretches cost one adler32 and one blake2b per block, only 
+    changed stretches are rolled over byte by byte.
+    """
+    def encode_delta(self, payload, token):
+        block_size, _, checksums = token.partition(':')
         try:
-            with timeout(self.timeout):
-                clientSocket.sendto(header.encode(), (buyer_ip, buyer_port))
+            block_size = int(block_size)
+            checksums = base64.b64decode(checksums)
+        except ValueError:
+            block_size = 0
+        if block_size <= 0 or len(checksums) % self.block_checksum.size:
+            block_size, checksums = len(payload) + 1, b''               # no block can match
+        blocks = {}                                                     # adler32 -> [(blake2b, offset)] of the buyer
+        for ix in range(len(checksums) // self.block_checksum.size):
+            weak, strong = self.block_checksum.unpack_from(checksums, ix * self.block_checksum.size)
+            blocks.setdefault(weak, []).append((strong, ix * block_size))
 
-                # Wait for ACK or timeout
-                res, res_info = clientSocket.recvfrom(1024)
+        op = delta_patch.op
+        delta = bytearray()
+        literal = 0                                                     # start of the literal data not sent yet
+        copy = None                                                     # [offset, length] of the copy being merged
+        pos = 0
+        last = len(payload) - block_size                                # last position a block can start at
+        scaled = [block_size * byte for byte in range(256)]
+        while pos <= last:
+            weak = zlib.adler32(payload[pos:pos + block_size])          # fresh block, no rolling state
+            a, b = weak & 0xffff, weak >> 16
+            found = None
+            for pos, out_byte, in_byte in zip(range(pos, last + 1), payload[pos:],
+                                              itertools.chain(payload[pos + block_size:], (0,))):
+                if weak in blocks:
+                    strong = hashlib.blake2b(payload[pos:pos + block_size], digest_size=8).digest()
+                    found = next((old for digest, old in blocks[weak]
+                                  if digest == strong and old >= pos - delta_patch.backlog), None)
+                    if found is not None:
+                        break
+                a = (a - out_byte + in_byte) % 65521                   # roll the adler32 on by one byte
+                b = (b - scaled[out_byte] + a - 1) % 65521
+                weak = a | b << 16
+            if found is None:
+                break
+            if literal < pos:
+                if copy is not None:
+                    delta += op.pack(delta_patch.copy_op, copy[0], copy[1])
+                    copy = None
+                delta += op.pack(delta_patch.literal_op, 0, pos - literal) + payload[literal:pos]
+            if copy is not None and copy[0] + copy[1] == found:
+                copy[1] += block_size
+            else:
+                if copy is not None:
+                    delta += op.pack(delta_patch.copy_op, copy[0], copy[1])
+                copy = [found, block_size]
+            pos += block_size
+            literal = pos
+        if copy is not None:
+            delta += op.pack(delta_patch.copy_op, copy[0], copy[1])
+        if literal < len(payload):
+            delta += op.pack(delta_patch.literal_op, 0, len(payload) - literal) + payload[literal:]
+        self.metrics.delta_block = block_size
+        return delta
 
-                msg = int(res.decode())
+    """ 
+    Drives the transfer sessions to every buyer on one socket until each of them has finished. Every session sends its 
+    start msg, keeps as many chunks in flight as its congestion window allows, paced over the round trip time, and 
+    finishes with a fin msg. Chunks the buyer already holds, listed in its ack of the start msg, are skipped, and the 
+    session sends compressed chunks if the ack names the codec offered, parity packets if it echoes fec=K and the delta 
+    stream (see encode_delta) instead of the item if it carries the buyer's block checksums. Chunks whose timer expired 
+    are re-sent and count as a loss for the session's congestion controller. Data acks are selective acks covering many 
+    chunks at once (see handle_sack), control acks name the control msg they acknowledge. Acks are matched to their 
+    session by the address they come from. Will drop acks with the specified loss_rate.
+    """
+    def send_sessions(self, sessions, clientSocket):
+        by_addr = {session.addr: session for session in sessions}
+        active = len(sessions)
+        for session in sessions:
+            if self.verbosity > 1:
+                print('Sending control seq 0 to ' + str(session.addr) + ': ' + session.start_msg.decode())
+            self.send_session_packet(clientSocket, session, 0, self.control_type, session.start_msg)
+
+        while active > 0:
+            now = time.monotonic()
+            wake = None
+            for session in sessions:
+                if session.phase == session.data_phase:
+                    self.fill_window(clientSocket, session, now)
+                    if session.paced and (wake is None or session.next_send < wake):
+                        wake = session.next_send
+
+            # Handle every ack that is ready, then wait for the next one until the earliest timer of any session expires
+            # or the pacing lets the next chunk go
+            timer = min((entry[2] + session.rtt.rto for session in sessions for entry in session.in_flight.values()),
+                        default=None)
+            wait = min(t for t in (timer, wake) if t is not None) - now
+            acked = False
+            for res, res_info in clientSocket.drain():
+                acked = True
+                ack, res_type, flags, length = self.header.unpack_from(res)
 
                 # Simulate packet drop
-                if randint(1, 100) > self.loss_rate*100:
-                    if res_info[0] != buyer_ip or res_info[1] != buyer_port:
-                        print('Msg received from incorrect sender: IP: ' + res_info[0] + ' Port: ' + res_info[
-                            1])
-                        return 0
-
-                    print('Ack received: ' + str(msg))
-                    return 1
-                else:
-                    print('Ack dropped: ' + str(msg))
-                    return 0
-        except RuntimeError:
-            pass
+                if randint(1, 100) <= self.loss_rate*100:
+                    self.metrics.acks_dropped += 1
+                    if self.verbosity > 1:
+                        print('Ack dropped: ' + str(ack))
+                    continue
+                session = by_addr.get(res_info)
+                if session is None:
+                    if self.verbosity > 1:
+                        print('Msg received from incorrect sender: IP: ' + res_info[0] + ' Port: ' + str(res_info[1]))
+                    continue
+                if res_type != self.ack_type:
+                    continue
 
-        return 0
+                self.metrics.acks_received += 1
+                if flags & self.sack_flag:
+                    self.handle_sack(clientSocket, session, ack, flags, res[self.header.size:self.header.size + length])
+                    continue
+                entry = session.in_flight.pop((self.control_flag, ack), None) if flags & self.control_flag else None
+                if entry is None:                                       # duplicate or stale ack
+                    continue
+                rtt = None if entry[3] else time.monotonic() - entry[2]
+                if rtt is not None:
+                    self.sample_rtt(session, rtt)
+                if self.verbosity > 1:
+                    print('Ack received from ' + str(session.addr) + ': ' + str(ack))
+
+                if session.phase == session.start_phase and entry[1][:5] == b'start':
+                    session.phase = session.data_phase
+                    held, options = self.parse_start_ack(res[self.header.size:self.header.size + length])
+                    session.held.extend(held)
+                    session.fec = self.fec_block > 0 and options.get('fec') == str(self.fec_block)
+                    if 'codec' not in options:                          # buyer declined compression
+                        session.compressed = None
+                    elif session.compressed is not None:
+                        self.metrics.codec = options['codec']
+                    chunk_size = options.get('chunk', '')
+                    if chunk_size.isdigit() and 0 < int(chunk_size) < session.chunk_size:
+                        session.chunk_size = int(chunk_size)
+                    self.metrics.chunk_size = session.chunk_size
+                    if self.delta and 'delta' in options:               # buyer holds an earlier version
+                        session.delta = memoryview(self.encode_delta(session.item, options['delta']))
+                        if session.compressed is not None:              # compress the delta stream instead
+                            session.compressed = compressed_stream(session.delta,
+                                                                   stream_codecs[self.codec][0](self.level))
+                else:                                                   # fin or notice acked, session is done
+                    if session.encoded():
+                        self.metrics.bytes += len(session.item)
+                    session.phase = session.done_phase
+                    active -= 1
+            if acked:
+                continue
+            if wait > 0:
+                clientSocket.wait(wait)
+                continue
+            if timer is None or now < timer:                            # woken by the pacing
+                continue
+
+            # Re-send every packet whose timer has expired. The timeout of its session is only backed off once a re-sent
+            # packet expires again, losses of several first sends in one window do not compound the backoff.
+            for session in sessions:
+                expired = [key for key, entry in session.in_flight.items() if now - entry[2] >= session.rtt.rto]
+                if any(session.in_flight[key][3] for key in expired):
+                    session.rtt.backoff()
+                for key in expired:
+                    entry = session.in_flight[key]
+                    if entry[0] == self.data_type:
+                        session.cc.on_loss(key[1], session.next_seq)
+                    self.send_packet(clientSocket, key[1], entry[0], entry[1], session.addr)
+                    entry[2] = now
+                    entry[3] = True
+                    self.metrics.retransmissions += 1
+                    if self.verbosity > 1:
+                        print('Msg re-sent to ' + str(session.addr) + ': ' + str(key[1]))
+
+    """ 
+    Handles a selective ack of session. Every chunk below the cumulative ack cum and every chunk set in the bitmap 
+    payload, bit i standing for chunk cum + 1 + i, is acked at once. The rtt is sampled from the newest chunk acked, 
+    unless it was re-sent or the ack is for a chunk the buyer rebuilt from parity (recovered_flag). A chunk that was 
+    sent only once and has not been acked while chunks more than reorder_threshold (plus the parity block) past it 
+    have, is taken as lost and re-sent right away instead of waiting for its timer.
+    """
+    def handle_sack(self, clientSocket, session, cum, flags, payload):
+        bits = int.from_bytes(payload, 'little')
+        acked = sorted(seq for kind, seq in session.in_flight
+                       if kind == 0 and (seq < cum or seq > cum and bits >> (seq - cum - 1) & 1))
+        now = time.monotonic()
+        for seq in acked:
+            entry = session.in_flight.pop((0, seq))
+            rtt = None
+            if seq == acked[-1] and not entry[3] and not flags & self.recovered_flag:
+                rtt = now - entry[2]
+                self.sample_rtt(session, rtt)
+            self.metrics.first_data()
+            self.metrics.wire_bytes += len(entry[1])
+            if not session.encoded():
+                self.metrics.bytes += len(entry[1])
+            session.cc.on_ack(seq, rtt)
+        self.metrics.recovered += flags & self.recovered_flag > 0
+        if self.verbosity > 1:
+            print('Ack received from ' + str(session.addr) + ': ' + str(cum) + ' acking ' + str(len(acked)) + ' chunk(s)')
+
+        # Fast retransmit of the chunks the buyer is missing behind the newest chunk it holds
+        newest = cum + bits.bit_length()
+        threshold = self.reorder_threshold + (self.fec_block if session.fec else 0)
+        for (kind, seq), entry in session.in_flight.items():
+            if kind == 0 and not entry[3] and newest - seq > threshold:
+                session.cc.on_loss(seq, session.next_seq)
+                self.send_packet(clientSocket, seq, entry[0], entry[1], session.addr)
+                entry[2] = now
+                entry[3] = True
+                self.metrics.retransmissions += 1
+                self.metrics.fast_retransmits += 1
+                if self.verbosity > 1:
+                    print('Msg re-sent to ' + str(session.addr) + ': ' + str(seq))
+        session.base = min(seq for _, seq in session.in_flight) if session.in_flight else session.next_seq
+
+    """ 
+    Sends the chunks of the session's item that fit in the congestion window and the receive window of session, as far 
+    as the pacing allows at time now. Sets session.paced if chunks are held back by the pacing. Once every chunk has 
+    been acked the fin msg is sent with the sequence number after the last chunk.
+    """
+    def fill_window(self, clientSocket, session, now):
+        item = session.item
+        total_bytes = len(item)
+        interval = session.cc.pacing_interval(session.rtt.srtt) if session.rtt.srtt else 0
+        session.paced = False
+        while True:
+            while session.held and session.held[0][0] <= session.next_seq:    # skip chunks the buyer already holds
+                first, end = session.held.popleft()
+                if end > session.next_seq:
+                    self.metrics.resumed_bytes += len(item[session.next_seq*session.chunk_size:end*session.chunk_size])
+                    session.next_seq = end
+                    session.base = min(seq for _, seq in session.in_flight) if session.in_flight else session.next_seq
+            if len(session.in_flight) >= session.cc.window() or session.next_seq >= session.base + self.window_size:
+                break
+            seq = session.next_seq
+            chunk = session.chunk(seq)
+            if not chunk:                                               # every chunk has been sent
+                break
+            if interval > 0:
+                if session.next_send > now:
+                    session.paced = True
+                    break
+                session.next_send = max(session.next_send, now - self.pacing_burst * interval) + interval
+            self.send_session_packet(clientSocket, session, seq, self.data_type, chunk)
+            if self.verbosity > 1:
+                print('Sending data seq ' + str(seq) + ' to ' + str(session.addr) + ': ' + str(seq * session.chunk_size + len(chunk)) + ' / ' + str(total_bytes))
+            session.next_seq += 1
+            if session.fec and (session.next_seq % self.fec_block == 0 or not session.chunk(session.next_seq)):
+                self.send_parity(clientSocket, session, seq // self.fec_block)
+
+        if not session.in_flight and not session.chunk(session.next_seq):
+            if self.verbosity > 1:
+                print('Sending control seq ' + str(session.next_seq) + ' to ' + str(session.addr) + ': fin')
+            self.send_session_packet(clientSocket, session, session.next_seq, self.control_type, b'fin')
+            session.phase = session.fin_phase
+
+    """ 
+    Sends the parity packet of block, the chunks fec_block * block onwards of session, after the last of them was sent. 
+    The payload is the number of chunks in the block and the XOR of their lengths, followed by the XOR of the chunks 
+    padded to chunk_size. Parity packets are not acked or re-sent.
+    """
+    def send_parity(self, clientSocket, session, block):
+        first = block * self.fec_block
+        parity = 0
+        lengths = 0
+        count = 0
+        for seq in range(first, first + self.fec_block):
+            chunk = session.chunk(seq)
+            if not chunk:
+                break
+            parity ^= int.from_bytes(bytes(chunk).ljust(session.chunk_size, b'\0'), 'big')
+            lengths ^= len(chunk)
+            count += 1
+        payload = self.parity_header.pack(count, lengths) + parity.to_bytes(session.chunk_size, 'big')
+        self.send_packet(clientSocket, block, self.parity_type, payload, session.addr)
+        self.metrics.parity_sent += 1
+        if self.verbosity > 1:
+            print('Sending parity of block ' + str(block) + ' to ' + str(session.addr))
 
     """ 
-    Project 2: Handles UDP rdt packet receive for a winning buyer client. Receives CHUNK_SIZE chunk of the file through 
-    stop and wait. Calculates total file send time and throughput and saves metrics to performance.txt. Writes transferred 
-    file to received.txt. Will drop acks with the specified loss_rate.
+    Parses the payload of a start ack, space separated tokens have=first-end,... naming the chunks the buyer already 
+    holds, codec=name if it accepted compression, fec=K if it accepted parity packets and chunk=N, the chunk size it 
+    accepted. Returns the sorted (first, end) chunk ranges held and the dict of all tokens.
     """
-    def recieve_item(self, seller_addr, seller_port):
+    def parse_start_ack(self, payload):
+        ranges = []
+        options = dict(token.split('=', 1) for token in bytes(payload).decode(errors='replace').split() if '=' in token)
+        for held in options.get('have', '').split(','):
+            first, _, end = held.partition("-")
+            if first.isdigit() and end.isdigit():
+                ranges.append((int(first), int(end)))
+        return sorted(ranges), options
 
-        itemSocket = socket(AF_INET, SOCK_DGRAM)
-        itemSocket.bind(('', self.sendingPort))
-        print('UDP socket opened for RDT.')
-        print('Start receiving file.')
+    """ Sends a packet of session for the first time and starts its timer. """
+    def send_session_packet(self, clientSocket, session, seq_num, type, payload):
+        self.send_packet(clientSocket, seq_num, type, payload, session.addr)
+        flags = self.control_flag if type == self.control_type else 0
+        session.in_flight[(flags, seq_num)] = [type, payload, time.monotonic(), False]
 
+    """ 
+    Project 2: Handles UDP rdt receive for a winning buyer client. The item arrives over as many streams as both sides 
+    have, each received by its own worker process into its byte range of received.txt (see recieve_stream). Calculates 
+    total file send time and throughput and saves metrics to performance.txt.
+    """
+    def recieve_item(self, seller_addr, seller_ports):
+        if self.verbosity > 0:
+            print('Start receiving file.')
         total_time = datetime.now()
 
-        seq_num_expected = 0
-        total_bytes = 0
+        streams = min(self.streams, len(seller_ports))
+        if streams == 1:
+            num_bytes = self.recieve_stream(0, seller_addr, seller_ports[0])
+        else:
+            if multiprocessing.get_start_method() != "fork":
+                self.release_ports()
+            with multiprocessing.Pool(streams) as pool:
+                num_bytes = sum(pool.starmap(self.recieve_stream,
+                                             [(stream, seller_addr, seller_ports[stream]) for stream in range(streams)]))
+
+        # Calculate file transfer metrics.
+        total_time = (datetime.now() - total_time).total_seconds()
+        if self.verbosity > 0:
+            print('Transmission finished: ' + str(num_bytes) + ' / ' + str(total_time) + ' seconds = ' + str(num_bytes / total_time) + ' bps')
+
+        with open('performance.txt', 'a') as log:
+            run_metrics = '\'\'^||^\'\'' + '\n'
+            run_metrics += 'LOSS RATE=' + str(self.loss_rate) + '\n'
+            run_metrics += 'NUMBER OF BYTES=' + str(num_bytes) + '\n'
+            run_metrics += 'TOTAL TIME=' + str(total_time) + '\n'
+            run_metrics += 'AVERAGE THROUGHPUT=' + str(num_bytes / total_time) + '\n'
+            log.write(run_metrics)
+
+    """ 
+    Receives one stream of the item from the seller at seller_port on buyer port sendingPort + stream, through the 
+    selective repeat window announced by its start msg. Streams the bytes to received.txt at the offset of the stream's 
+    byte range and returns the number of bytes received. Will drop acks with the specified loss_rate.
+    """
+    def recieve_stream(self, stream, seller_addr, seller_port):
+
+        itemSocket = self.transfer_socket(stream)
+        if self.verbosity > 0:
+            print('UDP socket opened for RDT stream ' + str(stream) + '.')
+
+        self.metrics = transfer_metrics("receive", self.loss_rate, 1, 0)
+        self.metrics.stream = stream
         num_bytes = 0
+        sink = None
         while True:
             # Wait for packet to arrive
-            msg, clientAddress = itemSocket.recvfrom(2048)
+            packet = itemSocket.receive()
+            if packet is None:
+                itemSocket.wait()
+                continue
+            msg, clientAddress = packet
+            self.metrics.packets_received += 1
 
-            msg = msg.decode()
-            seq_num = int(msg[0])
-            msg_type = int(msg[1])
-            content = msg[2:]
+            seq_num, msg_type, _, length = self.header.unpack_from(msg)
+            content = memoryview(msg)[self.header.size:self.header.size + length]
 
             # Simulate packet loss
             if randint(1, 100) > self.loss_rate*100:
-                if clientAddress[0] != seller_addr:
+                if clientAddress[0] != seller_addr or msg_type != self.control_type:   # transfer opens with a start msg
                     continue
+                content = bytes(content).decode()
+                if 'start' not in content:                              # seller could not open the file item
+                    self.send_ack(itemSocket, seq_num, (seller_addr, seller_port), self.control_flag)
+                    if self.verbosity > 0:
+                        print(content)
+                    break
 
-                # If incorrect sequence number ack previous message
-                if seq_num_expected != seq_num:
-                    header = 0 if seq_num_expected == 1 else 1
-                    itemSocket.sendto(str(header).encode(), (seller_addr, seller_port))
-                    print('Msg received with mismatched sequence number ' + str(seq_num) + '. Expecting ' + str(seq_num_expected))
-                    print('Ack re-sent: ' + str(header))
-                    continue
+                # start length window chunk_size [sha256=H] [offset=O total=T] [codec=name:level] [fec=K] [ack=N:MS]
+                start_info = [token for token in content.split() if '=' not in token]
+                options = dict(token.split('=', 1) for token in content.split() if '=' in token)
+                total_bytes = int(start_info[1])
+                window_size = int(start_info[2])
+                start = start_options(int(options.get('offset', 0)), total_bytes, window_size,
+                                      self.accept_chunk_size(itemSocket, int(start_info[3]), window_size))
+                file_bytes = int(options.get('total', total_bytes))
 
-                # Handle control messages start and fin
-                if msg_type == 0:
-                    if 'start' in content:
-                        total_bytes = int(content[6:])
-                        header = seq_num_expected
-                        itemSocket.sendto(str(header).encode(), (seller_addr, seller_port))
-                        print('Msg received: ' + str(seq_num))
-                        print('Ack sent: ' + str(seq_num))
-                    if 'fin' in content:
-                        header = seq_num_expected
-                        itemSocket.sendto(str(header).encode(), (seller_addr, seller_port))
-                        itemSocket.sendto(str(header).encode(), (seller_addr, seller_port))
-                        itemSocket.sendto(str(header).encode(), (seller_addr, seller_port))
-                        print('Msg received: ' + str(seq_num))
-                        print('Ack sent: ' + str(seq_num))
-                        print('All data received! Exiting...')
+                # Resume from the checkpoint of an earlier transfer of the same range
+                if 'sha256' in options:
+                    params = {"length": total_bytes, "chunk_size": start.chunk_size, "offset": start.offset,
+                              "total": file_bytes, "sha256": options['sha256']}
+                    start.checkpoint = transfer_checkpoint(self.received_filename, start.offset, params,
+                                                           -(-total_bytes // start.chunk_size))
 
-                        break
-                else:
-                    # Handle data messages and add to file data buffer
-                    print('Msg received: ' + str(seq_num))
-                    self.file_arr.append(content.encode())
+                # Accept the offered compression and delta transfer unless resuming, their chunks are not checkpointed
+                resuming = start.checkpoint is not None and start.checkpoint.held_ranges()
+                codec = options.get('codec', 'none').split(':')[0]
+                if codec in stream_codecs and not resuming:
+                    start.codec = codec
+                if 'delta' in options and start.offset == 0 and total_bytes == file_bytes and not resuming:
+                    start.signature = self.delta_signature(self.received_filename)
+                old_bytes = 0
+                if start.signature is not None:
+                    old_bytes = os.path.getsize(self.received_filename)
+                    self.metrics.delta_block = int(start.signature.partition(':')[0])
+                if (start.codec is not None or start.signature is not None) and start.checkpoint is not None:
+                    start.checkpoint.remove()
+                    start.checkpoint = None
+                if start.codec is not None:
+                    self.metrics.codec = start.codec
+                fec = options.get('fec', '0')
+                start.fec_block = int(fec) if fec.isdigit() else 0
+                self.metrics.fec_block = start.fec_block
+                ack_every, _, ack_delay = options.get('ack', '1:0').partition(':')
+                start.ack_every = int(ack_every)
+                start.ack_delay = float(ack_delay or 0) / 1000
 
-                    header = seq_num_expected
-                    itemSocket.sendto(str(header).encode(), (seller_addr, seller_port))
-                    num_bytes += len(content)
+                sink = file_sink(self.received_filename, max(file_bytes, old_bytes))
+                self.send_ack(itemSocket, seq_num, (seller_addr, seller_port), self.control_flag, self.start_ack(start))
+                if self.verbosity > 1:
+                    print('Msg received: ' + str(seq_num))
                     print('Ack sent: ' + str(seq_num))
-                    print('Received data seq ' + str(seq_num) + ': ' + str(num_bytes) + ' / ' + str(total_bytes))
 
-                seq_num_expected = 0 if seq_num_expected == 1 else 1
+                # Receive the item through the selective repeat window the seller announced
+                self.metrics.window_size = window_size
+                self.metrics.chunk_size = start.chunk_size
+                try:
+                    num_bytes = self.recieve_window(itemSocket, seller_addr, seller_port, sink, start)
+                except BaseException:                                   # keep the progress for the next attempt
+                    if start.checkpoint is not None:
+                        start.checkpoint.save(sink)
+                    raise
+                if old_bytes > file_bytes:                              # the earlier version was longer
+                    sink.truncate(file_bytes)
+                if 'sha256' in options:
+                    self.verify_item(sink, start.offset, total_bytes, options['sha256'])
+                if start.checkpoint is not None:
+                    start.checkpoint.remove()
+                break
 
             else:
-                print('Pkt dropped: ' + str(seq_num))
+                self.metrics.packets_dropped += 1
+                if self.verbosity > 1:
+                    print('Pkt dropped: ' + str(seq_num))
 
-        # Write file data buffer to received.txt
-        self.write_file()
+        if sink is not None:
+            sink.close()
+        itemSocket.close()
+        self.report_metrics()
+        return num_bytes
 
-        # Calculate file transfer metrics.
-        total_time = (datetime.now() - total_time).total_seconds()
-        print('Transmission finished: ' + str(num_bytes) + ' / ' + str(total_time) + ' seconds = ' + str(num_bytes / total_time) + ' bps')
 
-        with open('performance.txt', 'a') as log:
-            run_metrics = '\'\'^||^\'\'' + '\n'
-            run_metrics += 'LOSS RATE=' + str(self.loss_rate) + '\n'
-            run_metrics += 'NUMBER OF BYTES=' + str(num_bytes) + '\n'
-            run_metrics += 'TOTAL TIME=' + str(total_time) + '\n'
-            run_metrics += 'AVERAGE THROUGHPUT=' + str(num_bytes / total_time) + '\n'
-            log.write(run_metrics)
+    """ 
+    Returns the chunk size the buyer accepts for offered: at most max_chunk_size and small enough that a whole window 
+    of chunks fits the receive buffer of itemSocket, but not below chunk_size unless that is what was offered.
+    """
+    def accept_chunk_size(self, itemSocket, offered, window_size):
+        room = itemSocket.getsockopt(SOL_SOCKET, SO_RCVBUF) // 2 // max(1, window_size)  # kernel reports twice the buffer
+        return min(offered, self.max_chunk_size, max(self.chunk_size, room))
 
+    """ 
+    Returns the payload of the start ack for the start_options start: the chunks held in its checkpoint, the codec, 
+    parity block size and chunk size accepted, and the block checksums of the earlier version if a delta transfer was 
+    accepted.
+    """
+    def start_ack(self, start):
+        tokens = []
+        if start.checkpoint is not None:
+            tokens.append(start.checkpoint.have_msg())
+        if start.codec is not None:
+            tokens.append("codec=" + start.codec)
+        if start.fec_block > 0:
+            tokens.append("fec=" + str(start.fec_block))
+        if start.chunk_size > 0:
+            tokens.append("chunk=" + str(start.chunk_size))
+        if start.signature is not None:
+            tokens.append("delta=" + start.signature)
+        return " ".join(tokens).encode()
+
+    """ 
+    Returns the delta token of the buyer's earlier version of the item at filename, block_size:base64 of the adler32 
+    and blake2b checksum of each of its whole blocks, or None if there is no earlier version worth patching. Blocks are 
+    at least delta_block bytes, the square root of the file size for large files, and never more than delta_max_blocks 
+    so the checksums fit the start ack.
+    """
+    def delta_signature(self, filename):
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            return None
+        block_size = max(self.delta_block, math.isqrt(size), -(-size // self.delta_max_blocks))
+        if size < block_size:
+            return None
+        checksums = bytearray()
+        with open(filename, 'rb') as f:
+            while True:
+                block = f.read(block_size)
+                if len(block) < block_size:
+                    break
+                checksums += self.block_checksum.pack(zlib.adler32(block),
+                                                      hashlib.blake2b(block, digest_size=8).digest())
+        return str(block_size) + ":" + base64.b64encode(checksums).decode()
+
+    """ Compares the sha256 of the received byte range with the seller's digest and records the result. """
+    def verify_item(self, sink, offset, total_bytes, digest):
+        self.metrics.verified = sink.digest(offset, total_bytes) == digest
+        if self.verbosity > 0:
+            if self.metrics.verified:
+                print('Item verified: sha256 ' + digest)
+            else:
+                print('Item failed verification! Received bytes do not match sha256 ' + digest)
+
+    """ 
+    Handles selective repeat receive with the start_options start negotiated by the start msg and its ack. Writes every 
+    chunk to the sink at its position after the offset as soon as it arrives, in any order, and returns the number of 
+    bytes received once the fin msg arrives. Chunks held in the checkpoint count as received and every new chunk is 
+    recorded in it. If the buyer accepted a codec the chunks are instead held until the window base reaches them and 
+    decompressed in order, likewise with the block checksums of an earlier version the chunks are the delta stream, 
+    applied in order by a delta_patch. With parity blocks, a block missing a single chunk has it rebuilt (see 
+    rebuild_chunk). Chunks are acked with selective acks (see send_sack), held back until ack_every new chunks arrived 
+    or for at most ack_delay seconds. A chunk that arrives out of order, fills a gap, is a duplicate or was rebuilt is 
+    acked once every datagram ready on itemSocket is handled, a rebuilt chunk with recovered_flag. Will drop msgs with 
+    the specified loss_rate.
+    """
+    def recieve_window(self, itemSocket, seller_addr, seller_port, sink, start):
+        offset, total_bytes, window_size = start.offset, start.total_bytes, start.window_size
+        chunk_size, checkpoint, fec_block = start.chunk_size, start.checkpoint, start.fec_block
+        ack_delay = start.ack_delay
+        base = 0
+        received = set()                                                # chunks received ahead of the window base
+        num_bytes = 0
+        decompressor = stream_codecs[start.codec][1]() if start.codec is not None else None
+        patch = delta_patch(sink) if start.signature is not None else None
+        pending = {}                                                    # encoded chunks waiting for the window base
+        block_chunks = {}                                               # chunks of the parity blocks not yet passed
+        parities = {}                                                   # block -> (chunks, XOR of lengths, XOR of chunks)
+        ack_every = max(1, min(start.ack_every, window_size // 2))      # a small window must not wait for held acks
+        unacked = 0                                                     # new chunks not acked yet
+        ack_due = None                                                  # time the held back ack is sent
+        ack_wanted = False                                              # ack once every ready datagram is handled
+        ack_flags = 0
+        for first, end in checkpoint.held_ranges() if checkpoint is not None else []:
+            self.metrics.resumed_bytes += min(end * chunk_size, total_bytes) - first * chunk_size
+            if first == base:
+                base = end
+            else:
+                received.update(range(first, end))
+
+        while True:
+            packet = itemSocket.receive()
+            if packet is None:                                          # every ready datagram handled
+                now = time.monotonic()
+                if ack_wanted or ack_due is not None and now >= ack_due:
+                    self.send_sack(itemSocket, base, received, window_size, (seller_addr, seller_port), ack_flags)
+                    unacked = 0
+                    ack_due = None
+                    ack_wanted = False
+                    ack_flags = 0
+                    if self.verbosity > 1:
+                        print('Ack sent: ' + str(base))
+                itemSocket.wait(None if ack_due is None else ack_due - now)
+                continue
+            msg, clientAddress = packet
+            self.metrics.packets_received += 1
+
+            # Simulate packet loss
+            if randint(1, 100) <= self.loss_rate*100:
+                self.metrics.packets_dropped += 1
+                if self.verbosity > 1:
+                    print('Pkt dropped')
+                continue
+            if clientAddress[0] != seller_addr:
+                continue
+
+            seq_num, msg_type, _, length = self.header.unpack_from(msg)
+            content = memoryview(msg)[self.header.size:self.header.size + length]
+
+            if msg_type == self.control_type:
+                # Start msg re-sent by the seller because its ack was lost
+                if content[:5] == b'start':
+                    self.send_ack(itemSocket, seq_num, (seller_addr, seller_port), self.control_flag,
+                                  self.start_ack(start))
+                    if self.verbosity > 1:
+                        print('Ack re-sent: ' + str(seq_num))
+                elif content == b'fin' and seq_num == base:
+                    for _ in range(3):
+                        self.send_ack(itemSocket, seq_num, (seller_addr, seller_port), self.control_flag)
+                    if self.verbosity > 1:
+                        print('Msg received: ' + str(seq_num))
+                        print('Ack sent: ' + str(seq_num))
+                    if self.verbosity > 0:
+                        print('All data received! Exiting...')
+                    return num_bytes
+                continue
+
+            recovered = False
+            if msg_type == self.parity_type:
+                if fec_block == 0 or length < self.parity_header.size:
+                    continue
+                self.metrics.parity_sent += 1
+                count, lengths = self.parity_header.unpack_from(content)
+                if seq_num * fec_block + count <= base:                # every chunk of the block already arrived
+                    continue
+                parities[seq_num] = (count, lengths, bytes(content[self.parity_header.size:]))
+                rebuilt = self.rebuild_chunk(parities[seq_num], seq_num * fec_block, base, received, block_chunks,
+                                             chunk_size)
+                if rebuilt is None:
+                    continue
+                seq_num, content = rebuilt
+                recovered = True
+            else:
+                if seq_num >= base + window_size:                       # beyond the window, seller will re-send
+                    continue
+
+                if seq_num < base or seq_num in received:             # its ack was lost, ack again at once
+                    self.metrics.duplicates += 1
+                    ack_wanted = True
+                    continue
+
+            # Deliver the chunk, and the chunk of its block it lets the parity rebuild
+            ack_now = recovered or seq_num != base                      # rebuilt or out of order
+            while True:
+                if recovered:
+                    self.metrics.recovered += 1
+                    if self.verbosity > 1:
+                        print('Msg rebuilt from parity: ' + str(seq_num))
+                elif self.verbosity > 1:
+                    print('Msg received: ' + str(seq_num))
+                if decompressor is None and patch is None:
+                    sink.write(offset + seq_num * chunk_size, content)
+                    num_bytes += len(content)
+                    if checkpoint is not None:
+                        checkpoint.add(seq_num)
+                        if checkpoint.unsaved >= checkpoint.interval:
+                            checkpoint.save(sink)
+                else:
+                    pending[seq_num] = bytes(content)
+                if fec_block > 0:
+                    block_chunks[seq_num] = bytes(content)
+                received.add(seq_num)
+                self.metrics.first_data()
+                self.metrics.wire_bytes += len(content)
+
+                # Slide the window past the chunks received in order, decoding them in order
+                while base in received:
+                    received.remove(base)
+                    if base in pending:
+                        data = pending.pop(base)
+                        if decompressor is not None:
+                            data = decompressor.decompress(data)
+                        if patch is None:
+                            sink.write(offset + num_bytes, data)
+                            num_bytes += len(data)
+                        else:
+                            num_bytes += patch.apply(data, offset + num_bytes)
+                            self.metrics.reused_bytes = patch.reused
+                    base += 1
+                    if fec_block > 0 and base % fec_block == 0:        # the window passed a whole block
+                        for seq in range(base - fec_block, base):
+                            block_chunks.pop(seq, None)
+                        parities.pop(base // fec_block - 1, None)
+                ack_now = ack_now or base > seq_num + 1                 # filled a gap
+                unacked += 1
+                self.metrics.bytes = num_bytes
+                if self.verbosity > 1:
+                    print('Received data seq ' + str(seq_num) + ': ' + str(num_bytes) + ' / ' + str(total_bytes))
+
+                block = seq_num // fec_block if fec_block > 0 else None
+                if recovered or block not in parities:
+                    break
+                rebuilt = self.rebuild_chunk(parities[block], block * fec_block, base, received, block_chunks,
+                                             chunk_size)
+                if rebuilt is None:
+                    break
+                seq_num, content = rebuilt
+                recovered = ack_now = True
+
+            if recovered:
+                ack_flags |= self.recovered_flag
+            if ack_now:
+                ack_wanted = True
+            elif unacked >= ack_every or ack_delay <= 0:
+                self.send_sack(itemSocket, base, received, window_size, (seller_addr, seller_port), ack_flags)
+                unacked = 0
+                ack_due = None
+                ack_wanted = False
+                ack_flags = 0
+                if self.verbosity > 1:
+                    print('Ack sent: ' + str(base))
+            elif ack_due is None:
+                ack_due = time.monotonic() + ack_delay
+
+    """ 
+    Sends a selective ack to addr: the cumulative ack base, the first chunk not received yet, and a bitmap of the 
+    chunks received within window_size past it, bit i standing for chunk base + 1 + i.
+    """
+    def send_sack(self, sock, base, received, window_size, addr, flags=0):
+        bits = 0
+        for seq in received if len(received) <= window_size else range(base + 1, base + window_size + 1):
+            if base < seq <= base + window_size and seq in received:
+                bits |= 1 << (seq - base - 1)
+        self.send_ack(sock, base, addr, flags | self.sack_flag, bits.to_bytes((bits.bit_length() + 7) // 8, 'little'))
 
     """ 
-    Project 2: Writes the received file chunks to the received.txt file for UDP rdt for the winning buyer client.
+    Rebuilds the chunk missing from a parity block, the chunks first onwards, if it is the only one missing. parity is 
+    (chunks in the block, XOR of their lengths, XOR of the chunks padded to chunk_size). The other chunks of the block 
+    are taken from chunks, a block with chunks held from an earlier transfer is not rebuilt. Returns (seq, chunk) or 
+    None.
     """
-    def write_file(self):
-        new_file = open('received.txt', 'wb')
-        for x in self.file_arr:
-            new_file.write(x)
-        new_file.close()
+    def rebuild_chunk(self, parity, first, base, received, chunks, chunk_size):
+        count, lengths, value = parity
+        missing = [seq for seq in range(first, first + count) if seq >= base and seq not in received]
+        if len(missing) != 1:
+            return None
+        value = int.from_bytes(value, 'big')
+        for seq in range(first, first + count):
+            if seq == missing[0]:
+                continue
+            chunk = chunks.get(seq)
+            if chunk is None:
+                return None
+            value ^= int.from_bytes(chunk.ljust(chunk_size, b'\0'), 'big')
+            lengths ^= len(chunk)
+        if lengths > chunk_size:
+            return None
+        return missing[0], value.to_bytes(chunk_size, 'big')[:lengths]
 
 
-""" Creates a client object. """
+""" Creates a client object and starts the auction. """
 if __name__ == "__main__":
     client = auc_client()
+    client.main()
 
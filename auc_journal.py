@@ -0,0 +1,208 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+"""
+Append-only journal of the auction events of a server, the durable record auctions are billed from. Every event is a
+record of a 8 byte header, the length and CRC-32 of the body, followed by a UTF-8 encoded JSON body with the event
+name in "ev", the auction id in "auction" and the file offset of the auction's previous record in "prev" (-1 for the
+first, and for a record appended after the auction closed). An auction's id is the offset of its created record, so ids
+are unique for the life of the journal.
+
+Events: created {room, auc_type, lowest_price, num_bids, item, deadline, units, seller}, bid {buyer, endpoint, amount},
+resolved {highest_bid, bids, winners} where winners lists [buyer, payment, endpoint], transfer {seller, peers} once the
+endpoints of the item transfer have been exchanged, and aborted {reason}. endpoint, seller and peers are the
+[ip, port, ports] transfer endpoints of the clients. An auction is open from its created record until it is resolved
+or aborted, every record carries the time it was appended in "time".
+
+Group commit: appending only encodes the record into the pending batch, a commit thread writes the batch and fsyncs
+it, so one fsync covers every record appended meanwhile and the bid path never waits for the disk. Callers that must
+not go on before their record is durable (e.g. before announcing a result) wait for the commit covering it. If a
+commit fails its error is raised to the callers waiting for it and by every later append.
+
+Index: after a commit, at most every index_interval seconds, the offsets of the last record of every open auction and
+the committed journal length are saved to the index file next to the journal, written to a temporary file and renamed
+over the old index so it is never torn. Replay on startup follows the prev offsets back from the indexed records, and
+only scans the journal written after the index, so recovery takes time proportional to the open auctions and their
+events, not to the whole history. A record torn by a crash at the end of the journal is cut off.
+"""
+record_header = struct.Struct('!II')
+terminal_events = ("resolved", "aborted")       # events that close an auction
+
+
+class auction_journal:
+    commit_interval = 0.002         # seconds the commit thread gathers records before each write and fsync
+    index_interval = 1.0            # smallest seconds between index saves
+
+    """ Opens the journal at path, creating it if needed, replays its open auctions and starts the commit thread. """
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".index"
+        self.cond = threading.Condition()
+        self.batch = bytearray()                # encoded records not written yet
+        self.open_auctions = self.replay()      # auction id -> records of every open auction, oldest first
+        self.file = open(path, "ab")
+        self.end = self.file.tell()             # journal length including the pending batch
+        self.committed = self.end               # journal length known to be on disk
+        self.last = {auction: records[-1]["offset"] for auction, records in self.open_auctions.items()}
+        self.open = set(self.last)              # ids of the auctions not resolved or aborted yet
+        self.index_time = 0
+        self.failure = None                     # exception of the failed commit, nothing is written after it
+        threading.Thread(target=self.run_commits, daemon=True).start()
+
+    """
+    Appends an event record of the auction with the given id and fields, or starts a new auction for a created event
+    (auction None). Returns the auction id. With wait the call returns only once the record has been committed. Raises
+    OSError once a commit has failed.
+    """
+    def append(self, event, auction, wait=False, **fields):
+        with self.cond:
+            self.check_failure()
+            offset = self.end
+            if auction is None:
+                auction = offset
+                self.open.add(auction)
+            fields.update(ev=event, auction=auction, prev=self.last.get(auction, -1), time=time.time())
+            body = json.dumps(fields, separators=(',', ':')).encode()
+            self.batch += record_header.pack(len(body), zlib.crc32(body)) + body
+            self.end += record_header.size + len(body)
+            if event in terminal_events:
+                self.open.discard(auction)
+                self.last.pop(auction, None)    # records appended after the close do not link back
+            elif auction in self.open:
+                self.last[auction] = offset
+            self.cond.notify_all()
+            end = self.end
+            while wait and self.committed < end:
+                self.cond.wait()
+                self.check_failure()
+        return auction
+
+    """ Raises OSError if a commit has failed, called with cond held. """
+    def check_failure(self):
+        if self.failure is not None:
+            raise OSError("journal commit failed: " + str(self.failure))
+
+    """
+    Writes and fsyncs the pending batch whenever there is one, and saves the index every index_interval. A failure is
+    recorded and the waiting callers are woken to raise it, the journal is not written to again.
+    """
+    def run_commits(self):
+        try:
+            self.commit_batches()
+        except Exception as e:
+            with self.cond:
+                self.failure = e
+                self.cond.notify_all()
+
+    """ Commits the pending batches until an error is raised. """
+    def commit_batches(self):
+        while True:
+            with self.cond:
+                while not self.batch:
+                    self.cond.wait()
+            time.sleep(self.commit_interval)                    # let more records join this commit
+            with self.cond:
+                batch, self.batch = self.batch, bytearray()
+                end = self.end
+                index = {str(auction): self.last[auction] for auction in self.open} \
+                    if time.monotonic() - self.index_time >= self.index_interval else None
+            self.file.write(batch)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            with self.cond:
+                self.committed = end
+                self.cond.notify_all()
+            if index is not None:
+                self.save_index(end, index)
+                self.index_time = time.monotonic()
+
+    """ Saves the committed journal length end and the last record offset of every open auction to the index file. """
+    def save_index(self, end, index):
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"end": end, "open": index}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.index_path)
+
+    """
+    Returns the records of every open auction by auction id. Starts from the index if there is a valid one, following
+    every indexed auction's records back through their prev offsets, then scans the journal written after the index.
+    A torn record at the end of the journal is truncated.
+    """
+    def replay(self):
+        if not os.path.exists(self.path):
+            return {}
+        open_auctions = None
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            index = self.load_index()
+            if index is not None and index["end"] <= size:
+                open_auctions = self.indexed_auctions(f, index["open"])
+            offset = index["end"] if open_auctions is not None else 0
+            if open_auctions is None:                           # no usable index, scan the whole journal
+                open_auctions = {}
+            while offset < size:
+                record, next_offset = self.read_record(f, offset)
+                if record is None:
+                    break
+                auction = record["auction"]
+                if record["ev"] == "created":
+                    open_auctions[auction] = [record]
+                elif auction in open_auctions:
+                    if record["ev"] in terminal_events:
+                        del open_auctions[auction]
+                    else:
+                        open_auctions[auction].append(record)
+                offset = next_offset
+        if offset < size:                                       # cut off the torn record
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+        return open_auctions
+
+    """
+    Returns the records of every auction of index, the last record offset of every open auction, by following the prev
+    offsets back from those records. Returns None if a record cannot be read, the index does not match the journal.
+    """
+    def indexed_auctions(self, f, index):
+        open_auctions = {}
+        for auction, offset in index.items():
+            records = []
+            while offset >= 0:
+                record, _ = self.read_record(f, offset)
+                if record is None:
+                    return None
+                records.append(record)
+                offset = record["prev"]
+            open_auctions[int(auction)] = records[::-1]
+        return open_auctions
+
+    """ Returns the saved index, or None if there is none or it cannot be read. """
+    def load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            return index if isinstance(index.get("end"), int) and isinstance(index.get("open"), dict) else None
+        except (OSError, ValueError):
+            return None
+
+    """
+    Reads the record at offset of the open journal file f. Returns the record, with its offset added as "offset", and
+    the offset of the next record, or None and offset if the record is incomplete or corrupt.
+    """
+    def read_record(self, f, offset):
+        f.seek(offset)
+        header = f.read(record_header.size)
+        if len(header) < record_header.size:
+            return None, offset
+        length, crc = record_header.unpack(header)
+        body = f.read(length)
+        if len(body) < length or zlib.crc32(body) != crc:
+            return None, offset
+        record = json.loads(body)
+        record["offset"] = offset
+        return record, offset + record_header.size + length
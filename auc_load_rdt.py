@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import collections
+import cProfile
+import io
+import json
+import multiprocessing
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from socket import *
+from auc_protocol import encode_msg, length_prefix, max_msg_size
+from auc_server_rdt import auc_server
+try:
+    import resource
+except ImportError:                 # not available on Windows, the open file limit is left as it is
+    resource = None
+
+"""
+Load generator for the auction control plane. Simulates many scripted sellers and buyers against a local auction server
+over the framed control protocol, without typed input or item transfers, and reports the latencies every client sees as
+p50, p95 and p99 in JSON:
+connect: TCP connect, which grows once the accept loop falls behind and the listen backlog fills up.
+role: hello sent until the role message, which includes time spent queued in a room's waiting room or for a worker.
+bid_ack: bid sent until the bid_ok message, the time bidding() takes to handle a bid.
+auction: seller's auction request sent until its result, the whole auction including buyers joining and bidding.
+
+Every room hosts --auctions auctions in total, --concurrency of them at once. An auction's seller joins its room first,
+its --buyers buyers join as soon as the seller's auction has started, and every buyer bids a random amount. Clients that
+are turned away with a busy message, disconnected or time out are counted as errors per stage. In ascending auctions
+(--auc-type 3) the random amount is the buyer's budget: it outbids every price pushed to it by a small random step as
+long as the budget allows, the auction closes --close seconds after the last raise, and the price updates the buyers
+received are reported, showing the broadcast load.
+
+The server runs in a child process with its output discarded, or --server points the load at a running server. With
+--profile the child process records a profile of all server threads while the load runs: cprofile saves pstats to
+--profile-output, sample takes a stack sample of every thread each --sample-ms and saves them as collapsed stacks
+(one "frame;frame;... count" line per stack, the input of flame graph tools). The top functions are printed either
+way, showing whether the accept loop, bidding() or handle_seller() saturates first.
+
+Run example: python3 auc_load_rdt.py --auctions 1000 --buyers 4 --concurrency 200 [--workers 64] [--profile sample]
+[--journal load.journal] [--output load.json]
+"""
+class auc_load:
+    timeout = 60                    # seconds a client waits for a message before it counts as timed out
+    stages = ("connect", "role", "bid_ack", "auction")
+
+    """ Parses the load parameters from argv. """
+    def __init__(self, argv=None):
+        parser = argparse.ArgumentParser(description="Load generator for the auction control plane.")
+        parser.add_argument("--auctions", type=int, default=1000, help="auctions to run in total")
+        parser.add_argument("--buyers", type=int, default=4, help="buyers of every auction")
+        parser.add_argument("--concurrency", type=int, default=100, help="auctions running at once")
+        parser.add_argument("--auc-type", type=int, choices=(1, 2, 3), default=2,
+                            help="1 for first price, 2 for second price, 3 for ascending")
+        parser.add_argument("--close", type=float, default=0.2,
+                            help="seconds without a higher bid that close an ascending auction")
+        parser.add_argument("--server", metavar="HOST:PORT", help="running server to load instead of a local child process")
+        parser.add_argument("--workers", type=int, default=auc_server.workers, help="worker pool size of the local server")
+        parser.add_argument("--backlog", type=int, default=auc_server.backlog, help="listen backlog of the local server")
+        parser.add_argument("--queue-cap", type=int, default=auc_server.queue_cap, metavar="N",
+                            help="waiting room size of the local server")
+        parser.add_argument("--journal", help="auction journal of the local server")
+        parser.add_argument("--profile", choices=("cprofile", "sample"), help="profile the local server under load")
+        parser.add_argument("--profile-output", help="file the profile is saved to")
+        parser.add_argument("--sample-ms", type=float, default=5, help="milliseconds between stack samples")
+        parser.add_argument("--timeout", type=float, default=self.timeout, help="seconds a client waits for a message")
+        parser.add_argument("--seed", type=int, default=1, help="seed for the bids")
+        parser.add_argument("--output", help="write the JSON report here instead of stdout")
+        self.args = parser.parse_args(argv)
+        self.rand = random.Random(self.args.seed)
+        self.latencies = {stage: [] for stage in self.stages}
+        self.errors = collections.Counter()
+        self.queued = 0                                                 # clients that were told a queue position
+        self.price_updates = 0                                          # price msgs received by buyers
+
+    """ Starts the local server if needed, runs the load, prints or saves the report and stops the server. """
+    def main(self):
+        args = self.args
+        raise_file_limit()
+        server = None
+        if args.server:
+            host, port = args.server.rsplit(":", 1)
+            self.address = (host, int(port))
+        else:
+            self.address = ("127.0.0.1", self.free_port())
+            server_argv = [str(self.address[1]), "--workers", str(args.workers), "--backlog", str(args.backlog),
+                           "--queue-cap", str(args.queue_cap)]
+            if args.journal:
+                server_argv += ["--journal", args.journal]
+            profile_output = args.profile_output or ("load_profile.prof" if args.profile == "cprofile" else "load_profile.txt")
+            stop = multiprocessing.Event()
+            server = multiprocessing.Process(target=run_server,
+                                             args=(server_argv, args.profile, profile_output, args.sample_ms / 1000, stop))
+            server.start()
+            self.wait_listening()
+
+        start = time.perf_counter()
+        asyncio.run(self.run_load())
+        elapsed = time.perf_counter() - start
+
+        if server is not None:
+            stop.set()
+            server.join(self.args.timeout)
+            if server.is_alive():
+                server.terminate()
+                server.join()
+
+        report = {"config": {"auctions": args.auctions, "buyers": args.buyers, "concurrency": args.concurrency,
+                             "auc_type": args.auc_type, "close": args.close, "workers": args.workers, "backlog": args.backlog,
+                             "queue_cap": args.queue_cap, "journal": args.journal, "server": args.server},
+                  "clients": args.auctions * (args.buyers + 1), "elapsed_s": elapsed,
+                  "auctions_per_s": args.auctions / elapsed if elapsed > 0 else None,
+                  "queued": self.queued, "price_updates": self.price_updates,
+                  "errors": dict(self.errors),
+                  "latency_s": {stage: self.summarize(values) for stage, values in self.latencies.items()}}
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+        return 1 if self.errors else 0
+
+    """ Runs every auction, at most concurrency of them at once. """
+    async def run_load(self):
+        limit = asyncio.Semaphore(max(1, self.args.concurrency))
+        await asyncio.gather(*(self.run_auction(ix, limit) for ix in range(self.args.auctions)))
+
+    """ Runs auction ix in its own room: the seller joins first, its buyers once the seller's auction has started. """
+    async def run_auction(self, ix, limit):
+        async with limit:
+            room = "load" + str(ix)
+            joined = asyncio.Event()
+            seller = asyncio.ensure_future(self.run_client(room, joined))
+            started = asyncio.ensure_future(joined.wait())
+            await asyncio.wait([seller, started], return_when=asyncio.FIRST_COMPLETED)
+            started.cancel()
+            if not joined.is_set():                                     # seller failed before its auction started
+                return
+            bids = [self.rand.randint(1, 1000) for _ in range(self.args.buyers)]
+            await asyncio.gather(seller, *(self.run_client(room, None, bid) for bid in bids))
+
+    """
+    Runs one scripted client in room: connects, sends the hello and answers the server until the result arrives. A
+    client that becomes seller requests an auction for the configured buyers, a buyer bids bid, or bids up to bid in an
+    ascending auction. joined is set once the seller's auction has started. Latencies are recorded per stage, failures
+    counted as errors.
+    """
+    async def run_client(self, room, joined, bid=1):
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(*self.address), self.args.timeout)
+        except (OSError, asyncio.TimeoutError):
+            self.errors["connect"] += 1
+            return
+        hello_sent = time.perf_counter()
+        self.latencies["connect"].append(hello_sent - start)
+        writer.write(encode_msg("hello", room=room, port=0, ports=[0]))
+        auction = {"auc_type": self.args.auc_type, "lowest_price": 1, "num_bids": self.args.buyers, "item": room}
+        if self.args.auc_type == 3:
+            auction["deadline"] = self.args.close
+        leading = None                                                  # own bid that is the current price
+        role = None
+        queued = False                                                  # if the client was told a queue position
+        sent = None                                                     # time the auction request or bid was sent
+        try:
+            while True:
+                msg = await asyncio.wait_for(self.read_msg(reader), self.args.timeout)
+                now = time.perf_counter()
+                if msg is None:
+                    self.errors["disconnected"] += 1
+                    break
+                if msg["type"] == "queued":
+                    self.queued += not queued
+                    queued = True
+                elif msg["type"] == "role":
+                    self.latencies["role"].append(now - hello_sent)
+                    role = msg["role"]
+                    if role == "seller":
+                        writer.write(encode_msg("auction", **auction))
+                        sent = now
+                elif msg["type"] == "busy":
+                    self.errors["busy"] += 1
+                    break
+                elif msg["type"] == "invalid" and "price" not in msg:
+                    self.errors["invalid"] += 1
+                    break
+                elif msg["type"] == "bid_start" and "price" not in msg:
+                    writer.write(encode_msg("bid", amount=bid))
+                    sent = now
+                elif msg["type"] in ("bid_start", "price", "invalid"):   # ascending auction, outbid within the budget
+                    self.price_updates += msg["type"] == "price"
+                    amount = msg["price"] + self.rand.randint(1, 10)
+                    if msg["price"] != leading and amount <= bid:
+                        writer.write(encode_msg("bid", amount=amount))
+                        sent = sent or now
+                elif msg["type"] == "bid_ok":
+                    if sent is not None:                                # the first bid_ok of raises sent together
+                        self.latencies["bid_ack"].append(now - sent)
+                    leading = msg.get("price")
+                    sent = None
+                elif msg["type"] == "result":
+                    if role == "seller":
+                        self.latencies["auction"].append(now - sent)
+                    break
+                elif msg["type"] == "auction_start" and joined is not None:
+                    joined.set()
+        except asyncio.TimeoutError:
+            self.errors["timeout " + (role or "joining")] += 1
+        except (OSError, ValueError):
+            self.errors["disconnected"] += 1
+        writer.close()
+
+    """ Reads the next framed control message, or returns None if the server closed the connection. """
+    async def read_msg(self, reader):
+        try:
+            prefix = await reader.readexactly(length_prefix.size)
+        except asyncio.IncompleteReadError:
+            return None
+        length, = length_prefix.unpack(prefix)
+        if length > max_msg_size:
+            raise ValueError("control message of " + str(length) + " bytes exceeds the maximum size")
+        return json.loads(await reader.readexactly(length))
+
+    """ Returns a free TCP port on the loopback interface. """
+    def free_port(self):
+        sock = socket(AF_INET, SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
+    """ Waits until the local server accepts connections. """
+    def wait_listening(self):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                create_connection(self.address).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("auction server did not start listening on port " + str(self.address[1]))
+
+    """ Returns the p-th percentile of values by nearest rank, or None for no values. """
+    def percentile(self, ordered, p):
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    """ Summarizes latencies as count, p50, p95, p99 and max. """
+    def summarize(self, values):
+        ordered = sorted(values)
+        return {"count": len(ordered), "p50": self.percentile(ordered, 50), "p95": self.percentile(ordered, 95),
+                "p99": self.percentile(ordered, 99), "max": ordered[-1] if ordered else None}
+
+
+""" Raises the soft open file limit to the hard limit, thousands of clients need as many sockets. """
+def raise_file_limit():
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+"""
+Process target for the local server. Runs the server on a daemon thread until stop is set, profiling every server
+thread with the given profiler, then saves the profile to profile_output and prints its top functions.
+"""
+def run_server(server_argv, profile, profile_output, sample_interval, stop):
+    raise_file_limit()
+    sys.stdout = open(os.devnull, "w")                                  # the server logs every client
+    profiles = []
+    if profile == "cprofile":
+        def start_profile(frame, event, arg):
+            thread_profile = cProfile.Profile()                         # replaces this hook for the new thread
+            profiles.append(thread_profile)
+            thread_profile.enable()
+        threading.setprofile(start_profile)
+    elif profile == "sample":
+        sampler = stack_sampler(sample_interval)
+
+    threading.Thread(target=auc_server, args=(server_argv,), daemon=True).start()
+    stop.wait()
+
+    if profile == "cprofile" and profiles:
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(profile_output)
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats("tottime").print_stats(20)
+        print(text.getvalue(), file=sys.stderr)
+    elif profile == "sample":
+        sampler.save(profile_output)
+        sampler.print_top(20)
+
+
+class stack_sampler:
+    """
+    Sampling profiler of every thread of the process. A daemon thread takes the stack of every other thread each
+    interval seconds and counts the distinct stacks, so unlike cProfile it also sees threads it did not start and
+    costs the profiled threads nothing between samples. Blocked threads are sampled too, so workers that all sit
+    waiting for buyers show up as well as busy ones.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = collections.Counter()                             # "outer;...;inner" frame names -> samples
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    """ Samples until the process exits. """
+    def run(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(os.path.basename(code.co_filename) + ":" + code.co_name)
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+
+    """ Saves the samples as collapsed stacks to path. """
+    def save(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(stack + " " + str(count) + "\n")
+
+    """ Prints the n functions most often on top of a sampled stack, with their share of all samples. """
+    def print_top(self, n):
+        total = sum(self.stacks.values())
+        top = collections.Counter()
+        for stack, count in self.stacks.items():
+            top[stack.rsplit(";", 1)[-1]] += count
+        print("samples: " + str(total), file=sys.stderr)
+        for name, count in top.most_common(n):
+            print(str(round(100 * count / total, 1)) + "%  " + name, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(auc_load().main())
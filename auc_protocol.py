@@ -0,0 +1,78 @@
+import json
+import struct
+
+"""
+Framed control protocol shared by the auction client and server. Every control message is a JSON object with a "type"
+field naming the message, sent after a 4 byte big endian length prefix, so one connection can carry pipelined messages
+however TCP splits the byte stream. Clients send hello, auction and bid messages, the server role (flagged restored for
+the seller of an auction restored from the journal), queued, busy, invalid, auction_start, wait, bid_start, bid_ok (also
+sent instead of bid_start to a buyer whose bid was restored), price and result messages. A price message is pushed to
+every buyer of an ascending auction when a bid raises the price, and bid_start, bid_ok and invalid carry the current
+price there. A buyer's result names the seller to receive the item from, the seller's result every winning buyer to
+deliver it to, each with the transfer ports of its streams.
+"""
+length_prefix = struct.Struct('!I')
+max_msg_size = 1 << 20          # largest accepted message body in bytes
+
+
+""" Encodes a control message of msg_type with the given fields into a length prefixed frame. """
+def encode_msg(msg_type, **fields):
+    fields["type"] = msg_type
+    body = json.dumps(fields, separators=(',', ':')).encode()
+    return length_prefix.pack(len(body)) + body
+
+
+""" Sends a control message of msg_type with the given fields on the TCP socket sock. """
+def send_msg(sock, msg_type, **fields):
+    sock.sendall(encode_msg(msg_type, **fields))
+
+
+class msg_reader:
+    """
+    Buffered reader of framed control messages from a TCP socket. Bytes are received in large reads and every complete
+    frame in the buffer is handed out in order, so pipelined messages that arrive in one segment are not lost and a
+    message split across segments is reassembled. fill() and next_msg() let a selector driven caller read without
+    blocking, recv_msg() blocks until a whole message has arrived.
+    """
+    recv_size = 65536
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+
+    """ Receives once from the socket into the buffer. Returns False if the peer closed the connection. """
+    def fill(self):
+        try:
+            data = self.sock.recv(self.recv_size)
+        except OSError:
+            return False
+        self.buffer += data
+        return len(data) > 0
+
+    """ 
+    Returns the next complete message in the buffer, or None if no complete message has been received yet. Raises 
+    ValueError for a message that is not a JSON object.
+    """
+    def next_msg(self):
+        if len(self.buffer) < length_prefix.size:
+            return None
+        length, = length_prefix.unpack_from(self.buffer)
+        if length > max_msg_size:
+            raise ValueError("control message of " + str(length) + " bytes exceeds the maximum size")
+        end = length_prefix.size + length
+        if len(self.buffer) < end:
+            return None
+        msg = json.loads(self.buffer[length_prefix.size:end])
+        del self.buffer[:end]
+        if not isinstance(msg, dict):
+            raise ValueError("control message is not a JSON object")
+        return msg
+
+    """ Blocks until the next message has been received and returns it, or None if the connection was closed. """
+    def recv_msg(self):
+        msg = self.next_msg()
+        while msg is None:
+            if not self.fill():
+                return None
+            msg = self.next_msg()
+        return msg
@@ -1,8 +1,16 @@
 # Author: Isabella Samuelsson
 # Date: 10/7/22
-import sys
-from _thread import *
+import argparse
+import collections
+import heapq
+import selectors
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from socket import *
+from auc_journal import auction_journal
+from auc_protocol import encode_msg, msg_reader, send_msg
 
 """
 Auction server class. There are two types of auctions type 1 which is first price auction and type 2 which is second 
@@ -15,277 +23,934 @@ transfer of the seller and winning buyers ip address and transfer port numbers f
 server will disconnect the seller and buyer clients, restart the auction state and will wait for more incoming 
 connections to start another auction.
 
-Seller Client: The first client to connect will be the seller. The server prompts for auction information. This 
-includes Auction Type: 1 for a first price auction and 2 for a second price auction, Minimum Bid price: non-negative 
-integer, Number of Bidders: non-negative integer less than 10 and Item Name: string. If invalid auction information is received the 
-server will continue to prompt for valid information. If a client tries to connect while auction information is being 
-received the client will be sent a busy message and disconnected.
+Multi-unit Auctions: A seller can offer k copies of a digital item in one auction. The k highest bids at or above the 
+minimum price win, ties going to the buyer that joined first. In a first price auction every winner pays its own bid, in 
+a second price auction every winner pays the (k+1)-th highest bid, or the minimum price if there is no such bid.
+
+Ascending Auctions: Type 3 is an open ascending (English) auction of a single unit, starting at the minimum price. 
+Buyers may bid as often as they like, every bid above the current price is pushed to all buyers as the new price. The 
+auction closes once no higher bid arrived for the bidding deadline, or english_close seconds without one, and the 
+highest bidder pays its bid. A buyer that reads slowly gets only the latest price, not a backlog (see price_board).
+
+Control Protocol: Clients and server exchange typed, length prefixed messages (see auc_protocol). On connecting a client 
+sends a hello message with the id of the room it wants to join and the UDP transfer ports of its parallel streams, so 
+the result message can carry the peer's address and ports without an extra round trip.
+
+Auction Rooms: The server hosts many independent auctions at once, each in its own room. The first client to join a room 
+that does not exist yet creates it and is designated the seller of that room, later clients joining the room are its 
+buyers. Once a room's auction has concluded the room is torn down and its id can be used for a new auction.
+
+Admission: One event loop accepts connections and reads their hello messages, and every room runs on a worker of a 
+bounded pool (--workers), rooms beyond the pool wait for a worker. Clients that join a room while its auction 
+information is being received or while bidding is on-going are queued and told their position, they join the auction as 
+buyers once it accepts buyers or take part in the room's next one. A room queues at most --queue-cap clients, --shed 
+picks whether the arriving (newest) or the longest waiting (oldest) client is sent a busy message instead. A room whose 
+seller leaves, or whose buyers do not join within --setup-timeout seconds, is cancelled and frees its worker.
+
+Journal: With --journal the server appends every auction's events, its creation, every accepted bid, its resolution and 
+the transfer endpoints exchanged, to an append-only journal (see auc_journal) committed in groups by a background 
+thread, so bids never wait for the disk. On startup every auction that was open when the server stopped is restored: the 
+first client to join its room becomes its seller without re-entering the auction, and buyers that rejoin from the same 
+ip address and transfer port keep their bid.
+
+Seller Client: The first client to connect will be the seller. The server prompts for auction information. This includes 
+Auction Type: 1 for first price, 2 for second price and 3 for an ascending auction, Minimum Bid price: non-negative 
+integer, Number of Bidders: positive integer up to max_bidders and Item Name: string, optionally followed by a Bidding 
+Deadline: the number of seconds buyers have to bid once bidding starts, and Units: the number of copies for sale, at 
+most the number of bidders. If invalid auction information is received the server will continue to prompt for valid 
+information. A client that tries to join the room while auction information is being received is queued until the 
+auction starts.
 
 Buyer Client: All subsequent connections will be designated buyers. The server will only allow the specified number of 
-bidders sent in the auction information given by the seller. If additional clients try to connect a server busy message 
-will be sent to the client and then it will be disconnected. The server will prompt for a bid. A bid should be a 
-non-negative integer, if an invalid bid is given the client will be prompted again.
-
-Run example: python3 auc_server_rdt.py server_port_number
+bidders sent in the auction information given by the seller. Additional clients are queued for the next auction. The 
+server will prompt for a bid. A bid should be a non-negative integer, if an invalid bid is given the client will be 
+prompted again. All buyers are prompted at once and their bids are collected into the room's bid book as they arrive. If 
+the seller set a bidding deadline the auction is resolved with the bids received by then, buyers that did not bid in 
+time lose the auction.
+
+Run example: python3 auc_server_rdt.py server_port_number [--workers N] [--queue-cap N] [--shed newest|oldest] 
+[--backlog N] [--setup-timeout SECONDS] [--journal auctions.journal]
 """
+class bid_book:
+    """ 
+    Bids of one auction room. Every buyer's bid is stored in a compact array indexed by join order, and the units + 1 
+    best bids are kept in a min heap as they arrive, so the winners and the uniform price are known when bidding closes 
+    without scanning, sorting or copying all bids. Higher bids rank first, equal bids rank by join order.
+    """
+    max_bid = (1 << 63) - 1         # largest bid the array can hold
+
+    def __init__(self, num_bids, units):
+        self.bids = array('q', bytes(8 * num_bids))     # bid of every buyer, 0 for buyers that have not bid
+        self.top = []                                   # min heap of (bid, -buyer index) of the best bids
+        self.top_size = units + 1
+        self.count = 0                                  # number of bids placed
+
+    """ Records the bid of buyer ix. Returns False if the buyer has already bid. """
+    def place(self, ix, bid):
+        if self.bids[ix]:
+            return False
+        self.bids[ix] = bid
+        self.count += 1
+        entry = (bid, -ix)
+        if len(self.top) < self.top_size:
+            heapq.heappush(self.top, entry)
+        elif entry > self.top[0]:
+            heapq.heapreplace(self.top, entry)
+        return True
+
+    """ Returns (buyer index, bid) of the units + 1 best bids, best first. """
+    def ranked(self):
+        return [(-neg_ix, bid) for bid, neg_ix in sorted(self.top, reverse=True)]
+
+
+class price_board:
+    """ 
+    Non-blocking fan-out of the price updates of an ascending auction to the buyers of a room, also used for the prompts 
+    and replies of sealed bidding. Every update is encoded once and written to every buyer socket without blocking. A 
+    buyer whose socket is full keeps only the rest of its current frame and is marked as owing the latest price, so 
+    updates replace each other instead of queueing. Small send buffers and TCP_NODELAY keep the kernel from holding old 
+    prices back. Replies to a buyer's own bids are never dropped.
+    """
+    send_buffer = 8192              # bytes of unsent updates the kernel holds per buyer
+    max_replies = 64                # replies queued for a buyer that does not read before it is dropped
+
+    def __init__(self, connections, sel):
+        self.connections = connections
+        for connection in connections:
+            connection.setsockopt(SOL_SOCKET, SO_SNDBUF, self.send_buffer)
+            connection.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        self.sel = sel                          # selector of the bidding loop, watches blocked buyers for EVENT_WRITE
+        self.latest = None                      # frame of the newest price update
+        self.partial = {}                       # buyer index -> memoryview of the unsent rest of a frame
+        self.replies = collections.defaultdict(collections.deque)  # buyer index -> frames addressed to it alone
+        self.stale = set()                      # buyers owed the latest price
+        self.blocked = set()                    # buyers whose socket was full, watched for EVENT_WRITE
+        self.gone = set()                       # buyers that disconnected
+        self.coalesced = 0                      # price updates replaced before a slow buyer could read them
+
+    """ Sends every buyer the price update frame, coalescing it with the one a blocked buyer has not received yet. """
+    def broadcast(self, frame):
+        self.latest = frame
+        for ix in range(len(self.connections)):
+            if ix in self.gone:
+                continue
+            if ix in self.stale:
+                self.coalesced += 1
+            self.stale.add(ix)
+            if ix not in self.blocked:
+                self.flush(ix)
+
+    """ 
+    Sends frame to buyer ix alone, after everything sent to it before. A buyer that keeps bidding without reading the 
+    replies is dropped and its connection shut down once max_replies of them are queued.
+    """
+    def send(self, ix, frame):
+        if ix in self.gone:
+            return
+        if len(self.replies[ix]) >= self.max_replies:
+            self.drop(ix)
+            try:
+                self.connections[ix].shutdown(SHUT_RDWR)
+            except OSError:
+                pass
+            return
+        self.replies[ix].append(frame)
+        if ix not in self.blocked:
+            self.flush(ix)
+
+    """ 
+    Writes what buyer ix is owed until its socket is full: the rest of a frame, its replies, then the latest price. 
+    Watches the socket for EVENT_WRITE while it is full. Returns False if the buyer has disconnected.
+    """
+    def flush(self, ix):
+        sock = self.connections[ix]
+        while True:
+            if ix in self.partial:
+                data = self.partial.pop(ix)
+            elif self.replies[ix]:
+                data = memoryview(self.replies[ix].popleft())
+            elif ix in self.stale:
+                self.stale.discard(ix)
+                data = memoryview(self.latest)
+            else:
+                break
+            try:
+                sent = sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self.drop(ix)
+                return False
+            if sent < len(data):
+                self.partial[ix] = data[sent:]
+                if ix not in self.blocked:
+                    self.blocked.add(ix)
+                    self.sel.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, ix)
+                return True
+        if ix in self.blocked:
+            self.blocked.discard(ix)
+            self.sel.modify(sock, selectors.EVENT_READ, ix)
+        return True
+
+    """ Forgets buyer ix after it disconnected and stops watching its socket. """
+    def drop(self, ix):
+        if ix in self.gone:
+            return
+        self.gone.add(ix)
+        self.sel.unregister(self.connections[ix])
+        self.partial.pop(ix, None)
+        self.replies.pop(ix, None)
+        self.stale.discard(ix)
+        self.blocked.discard(ix)
+
+    """ 
+    Blocks until every buyer got the rest of the frame it is in the middle of and its replies, so the result can follow 
+    on the same connection. Prices still owed are dropped, the result carries the final price.
+    """
+    def finish(self):
+        for ix in range(len(self.connections)):
+            if ix in self.gone:
+                continue
+            try:
+                self.connections[ix].setblocking(True)
+                if ix in self.partial:
+                    self.connections[ix].sendall(self.partial.pop(ix))
+                for frame in self.replies.pop(ix, ()):
+                    self.connections[ix].sendall(frame)
+            except OSError:
+                self.drop(ix)
+
+
+class auction_room:
+    """ 
+    State of a single auction hosted by the server. Every room has its own seller, auction info, buyer connections, 
+    bids and waiting room, and its own event for the room's worker to wait on, so rooms never share state.
+    """
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.state = 0                          # state 0: waiting for seller auction info, state 1: waiting for buyer
+
+        # Auction info
+        self.auc_type = 1                       # 1 for first price 2 for second price 3 for ascending
+        self.lowest_price = 1                   # positive integer, the opening price of an ascending auction
+        self.num_bids = 1                       # positive integer up to max_bidders
+        self.item = ""                          # item name
+        self.bid_deadline = 0                   # seconds buyers have to bid, 0 for no deadline, seconds without a new
+                                                # highest bid that close an ascending auction
+        self.units = 1                          # copies of the item for sale
+        self.seller_ip_addr = 0                 # seller ip addr
+        self.seller_transfer_port = -1          # seller UDP rdt port
+        self.seller_stream_ports = []           # seller UDP rdt port of every parallel stream
+        self.buyer_connections = []             # list of buyer client connections
+        self.buyer_readers = []                 # list of buyer control message readers
+        self.buyer_ip_addr = []                 # list of buyer ip addr
+        self.buyer_transfer_ports = []          # list of buyer UDP rdt ports
+        self.buyer_stream_ports = []            # list of buyer UDP rdt ports of every parallel stream
+        self.bid_book = None                    # bid_book of the buyer bids, created when bidding starts
+        self.client_count = 0                   # number of buyer clients connected
+        self.bidding_start = False              # if bidding has started
+        self.highest_bid = 0                    # highest bid
+        self.bid_count = 0                      # number of bids accepted
+        self.winners = []                       # (buyer index, payment) of every winning buyer
+        self.waiting = collections.deque()      # (connection, reader, addr, hello) of clients queued for next auction
+        self.closed = False                     # if the room has been torn down
+        self.resolved = False                   # if bidding has been resolved
+        self.journal_id = None                  # id of the auction in the journal, None if it is not journaled
+        self.restored = False                   # if the auction was restored from the journal
+        self.restored_bids = {}                 # (ip, transfer port) -> bid of buyers restored from the journal
+
+        self.buyers_ready = threading.Event()   # set once the requested number of buyers joined
+        self.wake = None                        # socket add_buyer writes to once the buyers are ready, None unless
+                                                # the worker waits in wait_for_buyers
+
+
 class auc_server:
     # Server info
     serverPort = 12345   # default port
-    state = 0            # state 0: waiting for seller, state 1: waiting for buyer
-    bad_info = True      # if auction info is invalid
+    max_bidders = 100000 # largest number of bidders an auction may ask for
+    rooms = None         # room id -> auction_room of every auction in progress
+    rooms_lock = None    # guards rooms and the state of the rooms while clients join
+    backlog = SOMAXCONN  # connections the kernel queues until they are accepted
+    workers = 64         # rooms running at once, each on one worker thread
+    queue_cap = 100      # clients a room queues for its next auction
+    shed_policy = "newest"  # full waiting room turns away the arriving client (newest) or the longest waiting (oldest)
+    pool = None          # ThreadPoolExecutor running the rooms
+    active_rooms = 0     # rooms created and not yet torn down
+    setup_timeout = 600  # seconds a room waits for its buyers before the auction is cancelled
+    journal = None       # auction_journal of the auction events, None for no journal
+    restored = None      # room id -> auction_room restored from the journal and waiting for its seller
+    english_close = 10   # seconds without a new highest bid that close an ascending auction without a deadline
+    close_linger = 5     # seconds the buyer connections are read after the results until the buyers close them
 
     # Server Seller Msg's
     seller_msg = "Connected to the Auctioneer server.\n\nYour role is: [Seller] \nPlease submit auction request: \n"
     busy_msg = "Server is busy. Try to connect again later.\n"
     invalid_info_msg = "Server: Invalid auction request! \nPlease submit auction request: \n"
+    restored_msg = "Connected to the Auctioneer server.\n\nYour role is: [Seller] \nYour auction was restored: "
     valid_info = "Server: Auction start\n"
     auc_finished_msg = "Disconnecting from the Auctioneer server. Auction is over!\n"
+    auc_cancelled_msg = "Auction cancelled! Not enough Buyers joined or the Seller left.\nDisconnecting from the Auctioneer server.\n"
 
     # Server Buyer Msg's
     buyer_msg = "Connected to the Auctioneer server.\n\nYour role is: [Buyer] \n"
     busy_bidding_msg = "Bidding on-going! Try to connect again later.\n"
+    queued_msg = "Auction in progress. You are queued for the next auction at position "
+    worker_wait_msg = "All auctioneers are busy. Your auction is queued at position "
     buyer_wait_msg = "The auctioneer is still waiting for other Buyer to connect... \n"
     bidding_start_msg = "The bidding has started!\nPlease submit your bid:\n"
     invalid_bid_msg = "Server: Invalid bid. Please submit a positive integer!\nPlease submit your bid:\n"
     bid_received_msg = "Server: Bid received. Please wait...\n"
+    bid_restored_msg = "The bidding has started!\nServer: Your bid was restored. Please wait...\n"
+    current_price_msg = "The current price is $"
+    invalid_raise_msg = "Server: Invalid bid. Please bid a positive integer above the current price of $"
+    raise_ok_msg = "Server: Bid received. You hold the highest bid of $"
+    new_price_msg = "Server: New highest bid of $"
     buyer_lost_msg = "Auction finished!\nUnfortunately you did not win the last round.\nDisconnecting from the Auctioneer server. Auction is over!\n"
 
-    # Auction info
-    auc_type = 1                # 1 for first price 2 for second price
-    lowest_price = 1            # positive integer
-    num_bids = 1                # positive integer less then 10
-    seller_ip_addr = 0          # seller ip addr
-    winning_buyer_transfer_port = -1  # winning buyer UDP rdt port
-    seller_transfer_port = -1     # seller UDP rdt port
-    winning_buyer_ready = False   # if wining buyer is ready to receive file
-    item = ""                   # item name
-    buyer_connections = []      # list of buyer client connections
-    buyer_ip_addr = []          # list of buyer ip addr
-    buyer_bids = []             # list of buyer bids
-    client_count = 0            # number of buyer clients connected
-    seller = 0                  # if seller and auction info has been established
-    bidding_start = False       # if bidding has started
-    bidding_resolved = False    # if bidding has finished
-    highest_bid = 0             # highest bid
-    sold_price = 0              # sold price
-    winning_buyer_idx = -1      # index of winning buyer in buyer bids list
-
-    """ Initializes server port from run command arguments and starts the main() function."""
-    def __init__(self):
-        self.serverPort = int(sys.argv[1])
+    """ Initializes server port and admission limits from run command arguments and starts the main() function."""
+    def __init__(self, argv=None):
+        parser = argparse.ArgumentParser(description="Auction server hosting concurrent auction rooms.")
+        parser.add_argument("server_port", type=int)
+        parser.add_argument("--backlog", type=int, default=self.backlog,
+                            help="connections the kernel queues until they are accepted")
+        parser.add_argument("--workers", type=int, default=self.workers,
+                            help="rooms running at once, later rooms wait for a worker")
+        parser.add_argument("--queue-cap", type=int, default=self.queue_cap, metavar="N",
+                            help="clients a room queues for its next auction")
+        parser.add_argument("--shed", choices=["newest", "oldest"], default=self.shed_policy,
+                            help="client turned away when a room's queue is full")
+        parser.add_argument("--setup-timeout", type=float, default=self.setup_timeout, metavar="SECONDS",
+                            help="seconds a room waits for its buyers before the auction is cancelled")
+        parser.add_argument("--journal",
+                            help="append-only journal of the auction events, open auctions in it are restored")
+        args = parser.parse_args(argv)
+
+        self.serverPort = args.server_port
+        self.backlog = max(1, args.backlog)
+        self.workers = max(1, args.workers)
+        self.queue_cap = max(0, args.queue_cap)
+        self.shed_policy = args.shed
+        self.setup_timeout = max(0, args.setup_timeout)
+        self.rooms = {}
+        self.rooms_lock = threading.Lock()
+        self.restored = {}
+        if args.journal:
+            self.journal = auction_journal(args.journal)
+            self.restore_rooms()
         self.main()
 
     """ 
-    Handles server communication with the seller client. The server will ask for the auction information and inform 
-    the seller at the end of the auction what the auction result is. The parameter connectionSocket is the seller 
-    client connection. On auction finish the server will receive the sellers transfer port and send the seller 
-    the winning buyers iP address and port information for UDP rdt.
+    Returns True if the fields of an auction message are valid auction information: auction type 1, 2 or 3, positive 
+    integer minimum price, number of bidders between 1 and max_bidders, an item name, a non-negative bidding deadline 
+    and between 1 and number of bidders units, a single unit in an ascending auction.
     """
-    def handle_seller(self, connectionSocket):
-        print(">> New Seller Thread spawned\n")
-
-        auc_info = connectionSocket.recv(1024).decode()                 # request auction info
-        auc_info_arr = auc_info.split()
+    def valid_auction(self, msg):
+        msg.setdefault("units", 1)
+        for field in ("auc_type", "lowest_price", "num_bids", "units"):
+            if type(msg.get(field)) is not int:
+                return False
+        deadline = msg.get("deadline", 0)
+        if type(deadline) not in (int, float) or not isinstance(msg.get("item"), str) or not msg["item"]:
+            return False
+        return msg["auc_type"] in (1, 2, 3) and msg["lowest_price"] > 0 and 0 < msg["num_bids"] <= self.max_bidders \
+            and deadline >= 0 \
+            and 0 < msg["units"] <= msg["num_bids"] and (msg["auc_type"] != 3 or msg["units"] == 1)
 
-        while self.bad_info:                                            # error check auction info
-            if len(auc_info_arr) == 4:
+    """ 
+    Runs room on a worker of the pool. However the auction ends, the seller and buyer connections are closed and the 
+    room is torn down, so the clients queued for it are not stranded.
+    """
+    def run_room(self, room, connectionSocket, reader):
+        try:
+            self.handle_seller(room, connectionSocket, reader)
+        except (OSError, ValueError):                                   # seller disconnected or sent a malformed message
+            print("Seller of room " + room.room_id + " disconnected.\n")
+        except Exception as e:
+            print("Room " + room.room_id + " failed: " + repr(e) + "\n")
+        finally:
+            connectionSocket.close()
+            for buyer in room.buyer_connections:                        # closed already unless the auction failed
+                buyer.close()
+            self.close_room(room)
 
-                try:
-                    self.auc_type = int(auc_info_arr[0])
-                    self.lowest_price = int(auc_info_arr[1])
-                    self.num_bids = int(auc_info_arr[2])
-                    self.item = str(auc_info_arr[3])
-
-                    if (self.auc_type == 1 or self.auc_type == 2) and self.lowest_price > 0 and 0 < self.num_bids < 10:
-                        self.bad_info = False
-                    else:
-                        connectionSocket.send(self.invalid_info_msg.encode())
-                        auc_info = connectionSocket.recv(1024).decode()
-                        auc_info_arr = auc_info.split()
-                        self.bad_info = True
-
-                except:
-                    connectionSocket.send(self.invalid_info_msg.encode())
-                    auc_info = connectionSocket.recv(1024).decode()
-                    auc_info_arr = auc_info.split()
-                    self.bad_info = True
+    """ 
+    Handles server communication with the seller client of room. The server will ask for the auction information, admit 
+    the clients queued for the room as its buyers, run the bidding once the requested number of buyers joined and inform 
+    the seller at the end of the auction what the auction result is. The parameter connectionSocket is the seller client 
+    connection and reader its control message reader. The result sent to the seller carries the iP address and transfer 
+    port for UDP rdt of every winning buyer. Finally the buyer connections and the room are closed so its id can host a 
+    new auction.
+    """
+    def handle_seller(self, room, connectionSocket, reader):
+        print(">> Worker started for room " + room.room_id + "\n")
+        if room.restored:                                               # auction info is known from the journal
+            send_msg(connectionSocket, "role", role="seller", restored=True, text=self.restored_msg + str(room.units)
+                     + " unit(s) of " + str(room.item) + " for " + str(room.num_bids) + " bidders.\n")
+        else:
+            send_msg(connectionSocket, "role", role="seller", text=self.seller_msg)
+
+            auc_info = reader.recv_msg()                                # request auction info
+            while auc_info is not None and (auc_info.get("type") != "auction" or not self.valid_auction(auc_info)):
+                send_msg(connectionSocket, "invalid", text=self.invalid_info_msg)
+                auc_info = reader.recv_msg()
+
+            if auc_info is None:                                        # seller disconnected before the auction started
+                print("Seller of room " + room.room_id + " disconnected.\n")
+                connectionSocket.close()
+                self.close_room(room)
+                return
+
+            room.auc_type = auc_info["auc_type"]
+            room.lowest_price = auc_info["lowest_price"]
+            room.num_bids = auc_info["num_bids"]
+            room.item = auc_info["item"]
+            room.bid_deadline = auc_info.get("deadline", 0)
+            room.units = auc_info["units"]
+            if self.journal is not None:
+                room.journal_id = self.journal.append("created", None, room=room.room_id, auc_type=room.auc_type,
+                                                      lowest_price=room.lowest_price, num_bids=room.num_bids,
+                                                      item=room.item, deadline=room.bid_deadline, units=room.units,
+                                                      seller=self.seller_endpoint(room))
+
+        print("Auction request received for room " + room.room_id + ". Now waiting for Buyer.\n")
+        send_msg(connectionSocket, "auction_start", text=self.valid_info)
+        with self.rooms_lock:
+            room.state = 1
+            self.admit_waiting(room)                                    # clients queued during setup join as buyers
+
+        if not self.wait_for_buyers(room, connectionSocket, reader):   # seller left or buyers did not join in time
+            return
+        print(">> Bidding started in room " + room.room_id + "\n")
+        self.bidding(room)
+
+        peers = []
+        if len(room.winners) == 1:
+            msg = "Auction finished!\nSuccess! Your item " + str(room.item) + " has been sold for $" + str(room.winners[0][1]) + ".\n"
+        elif room.winners:
+            payments = ", $".join(str(payment) for _, payment in room.winners)
+            msg = "Auction finished!\nSuccess! " + str(len(room.winners)) + " units of your item " + str(room.item) + " have been sold for $" + payments + ".\n"
+        else:
+            msg = "Auction finished!\nUnfortunately your item " + str(room.item) + " was not sold in the Auction.\n"
 
-            else:
-                connectionSocket.send(self.invalid_info_msg.encode())
-                auc_info = connectionSocket.recv(1024).decode()
-                auc_info_arr = auc_info.split()
+        for ix, _ in room.winners:                                      # Project2: sending winning buyers info to Seller
+            peers.append([room.buyer_ip_addr[ix], room.buyer_transfer_ports[ix], room.buyer_stream_ports[ix]])
+            print("buyer ip send: " + str(room.buyer_ip_addr[ix]))
+            print("buyer port send: " + str(room.buyer_transfer_ports[ix]))
 
-        print("Auction request received. Now waiting for Buyer.\n")
-        connectionSocket.send(self.valid_info.encode())
-        self.state = 1
+        send_msg(connectionSocket, "result", text=msg + self.auc_finished_msg, peers=peers)   # notify seller client of auction result
+        if room.journal_id is not None:
+            self.journal.append("transfer", room.journal_id, seller=self.seller_endpoint(room), peers=peers)
+        connectionSocket.close()
+        self.close_buyers(room.buyer_connections)                       # after the seller learned the result
+        self.close_room(room)
 
-        while True:                                                # wait for buyers to connect
-            if self.bidding_resolved:                              # once buyers have connected and bidding is resolved
+    """ 
+    Waits until the requested number of buyers joined room while watching its seller connection, woken by add_buyer 
+    through a socket pair as soon as the last buyer joined. Returns True once the bidding can start. If the seller 
+    disconnects or the buyers do not join within --setup-timeout seconds the auction is cancelled instead: the room 
+    stops admitting buyers, the buyers and the seller are told and False is returned so the room is torn down and its 
+    worker freed.
+    """
+    def wait_for_buyers(self, room, connectionSocket, reader):
+        deadline = time.monotonic() + self.setup_timeout
+        wake, room.wake = socketpair()                                  # add_buyer wakes the worker through room.wake
+        sel = selectors.DefaultSelector()
+        sel.register(connectionSocket, selectors.EVENT_READ)
+        sel.register(wake, selectors.EVENT_READ)
+        reason = None
+        while reason is None and not room.buyers_ready.is_set():
+            wait = deadline - time.monotonic()
+            if wait <= 0:
+                reason = "not enough buyers"
                 break
+            for key, _ in sel.select(wait):
+                if key.fileobj is connectionSocket and not reader.fill():
+                    reason = "seller disconnected"
+        sel.close()
+
+        with self.rooms_lock:
+            room.wake.close()
+            room.wake = None
+            wake.close()
+            if room.buyers_ready.is_set():                              # last buyer joined just in time
+                return True
+            room.bidding_start = True                                   # clients arriving from now on are queued
+        print("Room " + room.room_id + ": Auction cancelled, " + reason + ".\n")
+        for buyer in room.buyer_connections:
+            self.notify(buyer, "result", text=self.auc_cancelled_msg, peer=None)
+        if reason != "seller disconnected":
+            self.notify(connectionSocket, "result", text=self.auc_cancelled_msg, peers=[])
+        self.close_room(room, reason)
+        return False
 
-        if self.winning_buyer_idx != -1:
-            msg = "Auction finished!\nSuccess! Your item " + str(self.item) + " has been sold for $" + str(self.sold_price) + ".\n"
-        else:
-            msg = "Auction finished!\nUnfortunately your item " + str(self.item) + " was not sold in the Auction.\n"
-
-        connectionSocket.send((msg + self.auc_finished_msg).encode())    # notify seller client of auction result
+    """ 
+    Tears down room so its id can host another auction. The clients queued for the room are admitted again in the order 
+    they arrived, so the first of them becomes the seller of the room's next auction.
+    """
+    def close_room(self, room, reason="seller disconnected"):
+        with self.rooms_lock:
+            if room.closed:
+                return
+            room.closed = True
+            self.active_rooms -= 1
+            if room.journal_id is not None and not room.resolved:      # the auction will not resume
+                try:
+                    self.journal.append("aborted", room.journal_id, reason=reason)
+                except OSError as e:                                    # the room is torn down all the same
+                    print("Room " + room.room_id + ": " + str(e) + "\n")
+            if self.rooms.get(room.room_id) is room:
+                del self.rooms[room.room_id]
+            waiting, room.waiting = room.waiting, collections.deque()
+            for client in waiting:
+                self.admit(client)
+        print("Auction Restart: Room " + room.room_id + " is ready for hosting auctions!\n")
 
-        if self.winning_buyer_idx != -1:
-            # Project2: Set seller transfer port and wait for the winning buyer transfer port
-            self.seller_transfer_port = connectionSocket.recv(1024).decode()
+    """ 
+    Handles every control message buffered for buyer ix of room during bidding. Invalid bids re-prompt only this buyer, 
+    the replies are queued on the price_board board so a buyer that does not read never blocks the room. Returns True 
+    once the buyer has placed a valid bid, sent a malformed message or was dropped by the board.
+    """
+    def take_bid(self, room, board, ix):
+        try:
+            msg = room.buyer_readers[ix].next_msg()
+        except ValueError:                                              # malformed message, treat the buyer as gone
+            board.drop(ix)
+            return True
+        while msg is not None:
+            if msg.get("type") == "bid":
+                bid = msg.get("amount")
+                if type(bid) is int and 0 < bid <= room.bid_book.max_bid and room.bid_book.place(ix, bid):
+                    print("Room " + room.room_id + ": Buyer " + str(ix + 1) + " bid $" + str(bid) + "\n")
+                    if room.journal_id is not None:
+                        self.journal.append("bid", room.journal_id, buyer=ix, endpoint=self.buyer_endpoint(room, ix),
+                                            amount=bid)
+                    board.send(ix, encode_msg("bid_ok", text=self.bid_received_msg))
+                    return True
+                board.send(ix, encode_msg("invalid", text=self.invalid_bid_msg))             # make sure valid bid
+                if ix in board.gone:
+                    return True
+            try:
+                msg = room.buyer_readers[ix].next_msg()
+            except ValueError:
+                board.drop(ix)
+                return True
+        return False
 
-            while self.winning_buyer_transfer_port == -1 or not self.winning_buyer_ready:
-                continue
+    """ 
+    Handles server communication with the buyer clients of room. The bids are collected by the auction type's bidding, 
+    sealed bids for first and second price auctions and open ascending bids for an ascending auction, which selects the 
+    winners. The server then informs the buyers of the result, the result sent to every winning buyer carries the 
+    sellers iP address and transfer port for UDP rdt.
+    """
+    def bidding(self, room):
+        if room.auc_type == 3:
+            self.ascending_bidding(room)
+        else:
+            self.sealed_bidding(room)
 
+        if room.winners:
+            payments = ", $".join(str(payment) for _, payment in room.winners)
+            print("<< Room " + room.room_id + ": " + str(room.bid_count) + " bids. " + str(len(room.winners)) + " unit(s) sold! The highest bid is $" + str(room.highest_bid) + ". The actual payment is $" + payments + ".\n")
+        else:
+            print("<< Room " + room.room_id + ": Item did not sell! The highest bid is $" + str(room.highest_bid) + " and the lowest price is $" + str(room.lowest_price) + ".\n")
 
-            # Project2: sending winning buyer info to Seller
-            print("buyer ip send: " + str(self.buyer_ip_addr[self.winning_buyer_idx]))
-            print("buyer port send: " + str(self.winning_buyer_transfer_port))
-            winning_buyer_info = self.buyer_ip_addr[self.winning_buyer_idx] + " " + str(self.winning_buyer_transfer_port)
-            connectionSocket.send(winning_buyer_info.encode())
+        room.resolved = True
+        if room.journal_id is not None:                                 # durable before anyone learns the result
+            self.journal.append("resolved", room.journal_id, wait=True, highest_bid=room.highest_bid,
+                                bids=room.bid_count,
+                                winners=[[ix, payment, self.buyer_endpoint(room, ix)] for ix, payment in room.winners])
 
-        connectionSocket.close()
+        payments = dict(room.winners)
+        for ix in range(0, room.num_bids):                              # notify buyer clients if they have won the item
+            try:
+                if ix in payments:
+                    # Project2: Transfer Seller IP and port information to winning buyer for UDP rdt
+                    buyer_win_msg = "Auction finished!\nYou won this item " + str(room.item) + "! Your payment due is $" + str(payments[ix]) + "\nDisconnecting from the Auctioneer server. Auction is over!\n"
+                    send_msg(room.buyer_connections[ix], "result", text=buyer_win_msg,
+                             peer=[room.seller_ip_addr, room.seller_transfer_port, room.seller_stream_ports])
+                else:
+                    send_msg(room.buyer_connections[ix], "result", text=self.buyer_lost_msg, peer=None)
+            except OSError:
+                pass                                                    # buyer already disconnected
 
-        # reset state for another auction
-        self.state = 0
-        self.bad_info = True
-        self.buyer_connections = []
-        self.buyer_ip_addr = []
-        self.seller_ip_addr = 0
-        self.winning_buyer_transfer_port = -1
-        self.seller_transfer_port = -1
-        self.winning_buyer_ready = False
-        self.buyer_bids = []
-        self.client_count = 0
-        self.seller = 0
-        self.bidding_start = False
-        self.bidding_resolved = False
-        self.winning_buyer_idx = -1
-        print("Auction Restart: Auctioneer is ready for hosting auctions!\n")
+    """ 
+    Collects the sealed bids of a first or second price auction in room. The server prompts every buyer for a bid at 
+    once and collects the bids concurrently as they arrive, re-prompting only the buyer that sent an invalid bid. Bids 
+    pipelined by a buyer before the prompt are taken from its reader's buffer. Prompts and replies are written without 
+    blocking through a price_board, like the prices of an ascending auction. If the seller set a bidding deadline the 
+    auction is resolved with the bids received so far once it passes. The units go to the highest bids, ties broken by 
+    join order.
+    """
+    def sealed_bidding(self, room):
+        room.bid_book = bid_book(room.num_bids, room.units)
+        sel = selectors.DefaultSelector()
+        board = price_board(room.buyer_connections, sel)
+        waiting = set()                                                             # buyers that have not bid yet
+        for ix in range(0, room.num_bids):                                          # prompt every buyer client at once
+            room.buyer_connections[ix].setblocking(False)
+            sel.register(room.buyer_connections[ix], selectors.EVENT_READ, ix)
+            bid = room.restored_bids.pop((room.buyer_ip_addr[ix], room.buyer_transfer_ports[ix]), None)
+            if bid is not None and room.bid_book.place(ix, bid):                    # buyer rejoined a restored auction
+                board.send(ix, encode_msg("bid_ok", text=self.bid_restored_msg))
+                continue
+            board.send(ix, encode_msg("bid_start", text=self.bidding_start_msg))
+            if not self.take_bid(room, board, ix):
+                waiting.add(ix)
+
+        deadline = time.monotonic() + room.bid_deadline if room.bid_deadline > 0 else None
+        while waiting:
+            wait = None
+            if deadline is not None:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    print("Room " + room.room_id + ": Bidding deadline reached with " + str(len(waiting))
+                          + " bids missing\n")
+                    break
+
+            for key, events in sel.select(wait):                                    # retrieve bids as they arrive
+                ix = key.data
+                if ix in board.gone:                                                # dropped by a send in this round
+                    continue
+                if events & selectors.EVENT_WRITE and not board.flush(ix):
+                    waiting.discard(ix)
+                    continue
+                if events & selectors.EVENT_READ:
+                    connected = room.buyer_readers[ix].fill()
+                    if ix not in waiting:                                           # already bid, ignore the rest
+                        room.buyer_readers[ix].buffer.clear()
+                    elif self.take_bid(room, board, ix):                            # valid bid or buyer dropped
+                        waiting.discard(ix)
+                    if not connected:
+                        board.drop(ix)
+                        waiting.discard(ix)
+        board.finish()
+        sel.close()
+
+        ranked = room.bid_book.ranked()                                 # highest bid first, then join order
+        room.highest_bid = ranked[0][1] if ranked else 0
+        room.bid_count = room.bid_book.count
+        winners = [(ix, bid) for ix, bid in ranked[:room.units] if bid >= room.lowest_price]
+
+        if winners:                                                     # select winning buyers based on auction type
+            if room.auc_type == 1:
+                room.winners = winners
+            else:
+                price = room.lowest_price
+                if len(winners) == room.units and len(ranked) > room.units:
+                    price = ranked[room.units][1]                       # uniform (k+1)-th price
+                room.winners = [(ix, price) for ix, _ in winners]
 
+    """ 
+    Runs the open bidding of an ascending auction in room. Every buyer is told the opening price and may bid any number 
+    of times, a bid above the current highest bid and at least the lowest price is acked and pushed to all buyers as the 
+    new price through a price_board. The auction closes once no bid was accepted for the bidding deadline or 
+    english_close seconds, or every buyer left, and the highest bidder pays its bid. Bids restored from the journal 
+    reopen the auction at the highest of them.
+    """
+    def ascending_bidding(self, room):
+        sel = selectors.DefaultSelector()
+        board = price_board(room.buyer_connections, sel)
+        leader = None                                                   # buyer index of the highest bid
+        for ix in range(0, room.num_bids):                              # buyer rejoined a restored auction
+            bid = room.restored_bids.pop((room.buyer_ip_addr[ix], room.buyer_transfer_ports[ix]), None)
+            if bid is not None and bid > room.highest_bid:
+                room.highest_bid, leader = bid, ix
+        room.bid_count = 1 if leader is not None else 0
+
+        price = room.highest_bid if leader is not None else room.lowest_price
+        start = encode_msg("bid_start", text=self.bidding_start_msg + self.current_price_msg + str(price) + ".\n",
+                           price=price)
+        for ix in range(0, room.num_bids):                              # prompt every buyer client at once
+            room.buyer_connections[ix].setblocking(False)
+            sel.register(room.buyer_connections[ix], selectors.EVENT_READ, ix)
+            board.send(ix, start)
+        for ix in range(0, room.num_bids):                              # bids pipelined before the prompt
+            leader = self.take_raise(room, board, ix, leader)
+
+        idle = room.bid_deadline if room.bid_deadline > 0 else self.english_close
+        close = time.monotonic() + idle
+        bids = room.bid_count
+        while len(board.gone) < room.num_bids:
+            wait = close - time.monotonic()
+            if wait <= 0:
+                print("Room " + room.room_id + ": No higher bid for " + str(idle) + " seconds, bidding closed\n")
+                break
+            for key, events in sel.select(wait):
+                ix = key.data
+                if ix in board.gone:                                    # dropped by a send earlier in this round
+                    continue
+                if events & selectors.EVENT_WRITE and not board.flush(ix):
+                    continue
+                if events & selectors.EVENT_READ:
+                    connected = room.buyer_readers[ix].fill()
+                    leader = self.take_raise(room, board, ix, leader)
+                    if not connected:                                   # a bid placed before leaving still counts
+                        board.drop(ix)
+            if room.bid_count > bids:                                   # activity restarts the close timer
+                bids = room.bid_count
+                close = time.monotonic() + idle
+        board.finish()
+        sel.close()
+        if board.coalesced:
+            print("Room " + room.room_id + ": " + str(board.coalesced) + " price updates coalesced for slow buyers\n")
+
+        if leader is not None:
+            room.winners = [(leader, room.highest_bid)]
 
     """ 
-    Handles server communication with the seller client. The server will ask for the auction information and inform 
-    the seller at the end of the auction what the auction result is. The parameter connectionSocket is the seller 
-    client connection. On auction finish the server will receive the winning buyers transfer port and send the winning 
-    buyer the sellers iP address and port information for UDP rdt.
+    Handles every control message buffered for buyer ix of room during ascending bidding. A bid above the highest bid 
+    and at least the lowest price makes the buyer the leader, is acked to it and broadcast as the new price, other bids 
+    are rejected with the current price. Returns the index of the leading buyer.
     """
-    def bidding(self):
-        for ix in range(0, self.num_bids):                                         # retrieve bid from each buyer client
-            self.buyer_connections[ix].send(self.bidding_start_msg.encode())
-            bid = self.buyer_connections[ix].recv(1024).decode()
+    def take_raise(self, room, board, ix, leader):
+        while True:
+            try:
+                msg = room.buyer_readers[ix].next_msg()
+            except ValueError:                                          # malformed message, treat the buyer as gone
+                board.drop(ix)
+                return leader
+            if msg is None:
+                return leader
+            if msg.get("type") != "bid":
+                continue
+            bid = msg.get("amount")
+            price = room.highest_bid if leader is not None else room.lowest_price
+            if type(bid) is not int or not price <= bid <= bid_book.max_bid or (leader is not None and bid == price):
+                board.send(ix, encode_msg("invalid", text=self.invalid_raise_msg + str(price) + ".\n", price=price))
+                continue
+            room.highest_bid, leader = bid, ix
+            room.bid_count += 1
+            print("Room " + room.room_id + ": Buyer " + str(ix + 1) + " bid $" + str(bid) + "\n")
+            if room.journal_id is not None:
+                self.journal.append("bid", room.journal_id, buyer=ix, endpoint=self.buyer_endpoint(room, ix),
+                                    amount=bid)
+            board.send(ix, encode_msg("bid_ok", text=self.raise_ok_msg + str(bid) + ".\n", price=bid))
+            board.broadcast(encode_msg("price", text=self.new_price_msg + str(bid) + ".\n", price=bid,
+                                       bids=room.bid_count))
 
-            not_int = False
+    """ 
+    Closes the buyer connections once their results are sent. The connections are half closed and read until every 
+    buyer closed its end, or for at most close_linger seconds, so raises still in flight are discarded rather than reset 
+    the connection before the buyer read its result.
+    """
+    def close_buyers(self, connections):
+        sel = selectors.DefaultSelector()
+        for connectionSocket in connections:
             try:
-                bid = int(bid)
-            except:
-                not_int = True
-
-            while not_int or bid <= 0:                                              # make sure valid bid
-                self.buyer_connections[ix].send(self.invalid_bid_msg.encode())
-                bid = self.buyer_connections[ix].recv(1024).decode()
-                not_int = False
+                connectionSocket.shutdown(SHUT_WR)
+                connectionSocket.setblocking(False)
+                sel.register(connectionSocket, selectors.EVENT_READ)
+            except (OSError, ValueError):                               # buyer already disconnected
+                connectionSocket.close()
+
+        deadline = time.monotonic() + self.close_linger
+        while sel.get_map():
+            wait = deadline - time.monotonic()
+            if wait <= 0:
+                break
+            for key, _ in sel.select(wait):
                 try:
-                    bid = int(bid)
-                except:
-                    not_int = True
-
-            self.buyer_bids.append(bid)
-            print("Buyer " + str(ix + 1) + " bid $" + str(bid) + "\n")
-            self.buyer_connections[ix].send(self.bid_received_msg.encode())
-
-        self.highest_bid = max(self.buyer_bids)
-
-        if self.highest_bid >= self.lowest_price:                          # select winning buyer based on auction type
-
-            if self.auc_type == 1:
-                self.winning_buyer_idx = self.buyer_bids.index(self.highest_bid)
-                self.sold_price = self.highest_bid
-            else:
-                self.winning_buyer_idx = self.buyer_bids.index(self.highest_bid)
+                    if key.fileobj.recv(65536):
+                        continue
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    pass
+                sel.unregister(key.fileobj)                             # buyer closed its end
+                key.fileobj.close()
+        for key in list(sel.get_map().values()):
+            key.fileobj.close()
+        sel.close()
+
+    """ Returns the [ip, port, ports] transfer endpoint of the seller of room. """
+    def seller_endpoint(self, room):
+        return [room.seller_ip_addr, room.seller_transfer_port, room.seller_stream_ports]
+
+    """ Returns the [ip, port, ports] transfer endpoint of buyer ix of room. """
+    def buyer_endpoint(self, room, ix):
+        return [room.buyer_ip_addr[ix], room.buyer_transfer_ports[ix], room.buyer_stream_ports[ix]]
 
-                other_bids = self.buyer_bids.copy()
-                other_bids.remove(self.highest_bid)
-                self.sold_price = max(other_bids)
+    """ 
+    Restores every auction the journal holds as open into a room waiting for its seller, with the auction info and the 
+    bids placed so far. Only the open auctions are read from the journal.
+    """
+    def restore_rooms(self):
+        for auction, records in self.journal.open_auctions.items():
+            created = records[0]
+            room = auction_room(created["room"])
+            room.auc_type = created["auc_type"]
+            room.lowest_price = created["lowest_price"]
+            room.num_bids = created["num_bids"]
+            room.item = created["item"]
+            room.bid_deadline = created["deadline"]
+            room.units = created["units"]
+            room.journal_id = auction
+            room.restored = True
+            for record in records[1:]:
+                if record["ev"] == "bid":
+                    room.restored_bids[(record["endpoint"][0], record["endpoint"][1])] = record["amount"]
+            self.restored[room.room_id] = room
+            print("Restored auction of " + str(room.item) + " in room " + room.room_id + " with "
+                  + str(len(room.restored_bids)) + " bid(s).\n")
+
+    """ Returns the stream transfer ports of a hello message, or just its transfer port if it names no valid streams. """
+    def stream_ports(self, hello):
+        ports = hello.get("ports")
+        if isinstance(ports, list) and ports and all(type(port) is int for port in ports):
+            return ports
+        return [hello.get("port")]
+
+    """ Sends a control message to a client, returns False if the client has disconnected. """
+    def notify(self, connectionSocket, msg_type, **fields):
+        try:
+            send_msg(connectionSocket, msg_type, **fields)
+            return True
+        except OSError:
+            connectionSocket.close()
+            return False
 
-            print("<< Item sold! The highest bid is $" + str(self.highest_bid) + ". The actual payment is $" + str(self.sold_price) + ".\n")
+    """ 
+    Admits a client that sent a valid hello, called with rooms_lock held. The first client to join a room creates it 
+    and is designated seller, the room is started on the worker pool. Others join the room as buyers while it accepts 
+    buyers, and are queued for the next auction while its auction information is being received or bidding is on-going.
+    """
+    def admit(self, client):
+        connectionSocket, reader, addr, hello = client
+        room_id = str(hello["room"])
+        room = self.rooms.get(room_id)
+        if room is None:                                                            # client is a seller
+            room = self.restored.pop(room_id, None) or auction_room(room_id)
+            room.seller_ip_addr = addr[0]
+            room.seller_transfer_port = hello.get("port")
+            room.seller_stream_ports = self.stream_ports(hello)
+            self.rooms[room_id] = room
+            self.active_rooms += 1
+            print("Seller is connected to room " + room_id + " from " + addr[0] + "\n")
+            if self.active_rooms > self.workers:                                    # every worker runs a room
+                position = self.active_rooms - self.workers
+                self.notify(connectionSocket, "queued", text=self.worker_wait_msg + str(position) + ".\n",
+                            position=position)
+            self.pool.submit(self.run_room, room, connectionSocket, reader)
+        elif room.state == 1 and not room.bidding_start:
+            self.add_buyer(room, client)
         else:
-            print("<< Item did not sell! The highest bid is $" + str(self.highest_bid) + " and the lowest price is $" + str(self.lowest_price) + ".\n")
-
-        self.bidding_resolved = True                                    # mark bidding as finished for seller thread
-
-        for ix in range(0, self.num_bids):                              # notify buyer clients if they have won the item
-            if ix == self.winning_buyer_idx:
-                buyer_win_msg = "Auction finished!\nYou won this item " + str(self.item) + "! Your payment due is $" + str(self.sold_price) + "\nDisconnecting from the Auctioneer server. Auction is over!\n"
-                self.buyer_connections[ix].send(buyer_win_msg.encode())
-
-                # Project2: Transfer Seller IP and port information to winning buyer for UDP rdt
-                self.winning_buyer_transfer_port = self.buyer_connections[ix].recv(1024).decode()
+            self.enqueue(room, client)
 
-                while self.seller_transfer_port == -1:                  # wait until seller has specified transfer port
-                    continue
-
-                seller_info = self.seller_ip_addr + " " + str(self.seller_transfer_port)
-                self.buyer_connections[ix].send(seller_info.encode())
-
-                self.winning_buyer_ready = True
+    """ 
+    Adds client to the buyers of room, called with rooms_lock held. The buyer that completes the requested number of 
+    bidders starts the bidding on the room's worker. Clients that disconnected while queued are skipped.
+    """
+    def add_buyer(self, room, client):
+        connectionSocket, reader, addr, hello = client
+        if not self.notify(connectionSocket, "role", role="buyer", text=self.buyer_msg):   # sent under the lock so it precedes the bidding start msg
+            return
+        room.client_count += 1
+        room.buyer_ip_addr.append(addr[0])                                          # Project2: Added list of buyer ip addr
+        room.buyer_transfer_ports.append(hello.get("port"))
+        room.buyer_stream_ports.append(self.stream_ports(hello))
+        room.buyer_connections.append(connectionSocket)
+        room.buyer_readers.append(reader)
+        if room.client_count == room.num_bids:                                      # correct number of buyers are now connected
+            room.bidding_start = True
+            print("Buyer " + str(room.num_bids) + " is connected to room " + room.room_id + " from " + addr[0] + "\n")
+            print("Requested number of bidders arrived. Let's start bidding!\n")
+            room.buyers_ready.set()
+            if room.wake is not None:                                               # the worker waits in wait_for_buyers
+                room.wake.send(b'\0')
+        else:
+            self.notify(connectionSocket, "wait", text=self.buyer_wait_msg)         # still need more buyers connected so wait for more buyers
+            print("Buyer is connected to room " + room.room_id + " from " + addr[0] + "\n")
 
-            else:
-                self.buyer_connections[ix].send(self.buyer_lost_msg.encode())
-            self.buyer_connections[ix].close()
+    """ 
+    Queues client in the waiting room of room and tells it its queue position, called with rooms_lock held. A full 
+    waiting room sheds the arriving client or the longest waiting one, depending on the shed policy, with a busy msg.
+    """
+    def enqueue(self, room, client):
+        busy_msg = self.busy_bidding_msg if room.bidding_start else self.busy_msg
+        if len(room.waiting) >= self.queue_cap:
+            if self.shed_policy == "newest" or not room.waiting:
+                self.notify(client[0], "busy", text=busy_msg)
+                client[0].close()
+                return
+            shed = room.waiting.popleft()
+            self.notify(shed[0], "busy", text=busy_msg)
+            shed[0].close()
+            room.waiting.append(client)
+            self.send_positions(room)                                               # everyone moved up by one
+            return
+        room.waiting.append(client)
+        position = len(room.waiting)
+        if not self.notify(client[0], "queued", text=self.queued_msg + str(position) + ".\n", position=position):
+            room.waiting.pop()
+        print("Client from " + client[2][0] + " queued for room " + room.room_id + " at position " + str(position)
+              + "\n")
+
+    """ Sends every client in the waiting room of room its current position, dropping clients that disconnected. """
+    def send_positions(self, room):
+        waiting, room.waiting = room.waiting, collections.deque()
+        for client in waiting:
+            position = len(room.waiting) + 1
+            if self.notify(client[0], "queued", text=self.queued_msg + str(position) + ".\n", position=position):
+                room.waiting.append(client)
 
+    """ 
+    Admits the clients queued for room as its buyers once it accepts buyers, called with rooms_lock held. Clients that 
+    do not fit into the auction stay queued for the next one and are told their new position.
+    """
+    def admit_waiting(self, room):
+        if not room.waiting:
+            return
+        while room.waiting and not room.bidding_start:
+            self.add_buyer(room, room.waiting.popleft())
+        self.send_positions(room)
 
     """ 
-    Creates connection sockets for each of the clients. The first client to connect is designated seller and the 
-    others buyers. Handles starting a seller thread on the handle_seller() function for interacting with the seller 
-    client and also starts a bidding thread on the bidding() function to facilitate the bidding process. After the 
-    auction has concluded the seller thread will disconnect the seller client and reset auction state. The bidding 
-    thread will disconnect buyer clients. Then the server is ready for more incoming connections and to start a new 
-    auction.
+    Accepts client connections and reads their hello messages on one selector driven event loop, so neither a burst of 
+    connections nor a slow client blocks admission, and hands every client with a valid hello to admit(). Each room's 
+    worker will disconnect its clients and tear down the room once its auction has concluded.
     """
     def main(self):
         serverSocket = socket(AF_INET, SOCK_STREAM)                                 # Main server socket
+        serverSocket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)                      # rebind at once after a restart
         serverSocket.bind(("", self.serverPort))
-        serverSocket.listen(1)
+        serverSocket.listen(self.backlog)                                           # rooms connect concurrently
+        serverSocket.setblocking(False)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        sel = selectors.DefaultSelector()
+        sel.register(serverSocket, selectors.EVENT_READ, None)
         print("Auctioneer is ready for hosting auctions!\n")
 
         while True:
+            for key, _ in sel.select():
+                if key.data is None:                                                # accept every pending connection
+                    while True:
+                        try:
+                            connectionSocket, addr = serverSocket.accept()          # client socket
+                        except OSError:                                             # no connection pending
+                            break
+                        sel.register(connectionSocket, selectors.EVENT_READ, (msg_reader(connectionSocket), addr))
+                    continue
 
-            connectionSocket, addr = serverSocket.accept()                          # client socket
-            if self.state == 0:                                                     # client is a seller
-                if self.seller == 1:                                                # send busy msg to incoming client connection and disconnect
-                    connectionSocket.send(self.busy_msg.encode())
+                connectionSocket = key.fileobj
+                reader, addr = key.data
+                connected = reader.fill()
+                try:
+                    hello = reader.next_msg()
+                except ValueError:                                                  # not a framed JSON message
+                    hello = None
+                    connected = False
+                if hello is None and connected:                                     # hello not complete yet
+                    continue
+                sel.unregister(connectionSocket)
+                if not isinstance(hello, dict) or hello.get("type") != "hello" or not str(hello.get("room", "")):
                     connectionSocket.close()
-                else:
-                    self.seller_ip_addr = addr[0]
-                    connectionSocket.send(self.seller_msg.encode())
-                    print("Seller is connected from " + addr[0] + "\n")
-                    self.seller = 1
-                    start_new_thread(self.handle_seller, (connectionSocket,))      # start handle seller thread
-            else:
-                if self.bidding_start:                                             # send busy msg tp incoming client connection and disconnect
-                    connectionSocket.send(self.busy_bidding_msg.encode())
+                    continue
+                try:
+                    with self.rooms_lock:
+                        self.admit((connectionSocket, reader, addr, hello))
+                except (OSError, ValueError, TypeError):                            # malformed hello fields
+                    print("Rejected malformed hello from " + addr[0] + "\n")
                     connectionSocket.close()
-                else:
-                    self.client_count += 1
-                    print("Buyer " + str(self.client_count) + " is connected from " + addr[0] + "\n")
-
-                    # Project2: Added list of buyer ip addr
-                    self.buyer_ip_addr.append(addr[0])
-                    print("added")
-
-                    if self.client_count == self.num_bids:                          # since correct number buyers are now connected, add buyer client connection to buyer connections list
-                        connectionSocket.send(self.buyer_msg.encode())
-
-                        self.buyer_connections.append((connectionSocket))
-                        print("Requested number of bidders arrived. Let's start bidding!\n")
-                        print(">> New Bidding Thread spawned\n")
-                        self.bidding_start = True
-                        start_new_thread(self.bidding, ())                          # start bidding thread since correct number of buyer clients are connected
-                    else:
-                        connectionSocket.send(self.buyer_msg.encode())              # still need more buyers connected so add buyer client connection to buyer connection list, and wait for more buyers
-                        connectionSocket.send(self.buyer_wait_msg.encode())
-                        self.buyer_connections.append((connectionSocket))
 
 
 if __name__ == "__main__":
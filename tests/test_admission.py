@@ -0,0 +1,171 @@
+import json
+import socket
+import threading
+import time
+
+from auc_protocol import length_prefix, msg_reader
+from auc_server_rdt import auc_server, auction_room
+
+
+class fake_connection:
+    """ Client connection that records the control messages sent to it, a closed one fails to send. """
+    def __init__(self, name):
+        self.name = name
+        self.msgs = []
+        self.closed = False
+
+    def sendall(self, frame):
+        if self.closed:
+            raise OSError("connection closed")
+        self.msgs.append(json.loads(frame[length_prefix.size:]))
+
+    def close(self):
+        self.closed = True
+
+
+""" Returns a server with the given admission limits that is not listening. """
+def make_server(queue_cap, shed_policy):
+    server = auc_server.__new__(auc_server)
+    server.queue_cap = queue_cap
+    server.shed_policy = shed_policy
+    server.rooms = {}
+    server.rooms_lock = threading.Lock()
+    server.active_rooms = 1
+    return server
+
+
+""" Returns a client tuple as the accept loop hands it to admit(). """
+def make_client(name):
+    return fake_connection(name), None, ("127.0.0.1", 0), {"type": "hello", "room": "r", "port": 1, "ports": [1]}
+
+
+""" Returns a room whose bidding is on-going, so every arriving client is queued. """
+def bidding_room():
+    room = auction_room("r")
+    room.state = 1
+    room.bidding_start = True
+    return room
+
+
+def waiting_names(room):
+    return [client[0].name for client in room.waiting]
+
+
+def test_queue_positions_follow_arrival():
+    server = make_server(3, "newest")
+    room = bidding_room()
+    for name in ("a", "b", "c"):
+        server.enqueue(room, make_client(name))
+    assert waiting_names(room) == ["a", "b", "c"]
+    assert [client[0].msgs[-1]["position"] for client in room.waiting] == [1, 2, 3]
+
+
+def test_full_queue_sheds_newest():
+    server = make_server(2, "newest")
+    room = bidding_room()
+    clients = [make_client(name) for name in ("a", "b", "c")]
+    for client in clients:
+        server.enqueue(room, client)
+    assert waiting_names(room) == ["a", "b"]
+    newest = clients[2][0]
+    assert newest.closed and newest.msgs == [{"type": "busy", "text": server.busy_bidding_msg}]
+    assert not clients[0][0].closed and not clients[1][0].closed
+
+
+def test_full_queue_sheds_oldest_and_moves_everyone_up():
+    server = make_server(2, "oldest")
+    room = bidding_room()
+    clients = [make_client(name) for name in ("a", "b", "c")]
+    for client in clients:
+        server.enqueue(room, client)
+    assert waiting_names(room) == ["b", "c"]
+    oldest = clients[0][0]
+    assert oldest.closed and oldest.msgs[-1]["type"] == "busy"
+    assert clients[1][0].msgs[-1]["position"] == 1
+    assert clients[2][0].msgs[-1]["position"] == 2
+
+
+def test_zero_queue_cap_turns_everyone_away():
+    for policy in ("newest", "oldest"):
+        server = make_server(0, policy)
+        room = bidding_room()
+        client = make_client("a")
+        server.enqueue(room, client)
+        assert not room.waiting
+        assert client[0].closed and client[0].msgs[-1]["type"] == "busy"
+
+
+def test_busy_msg_during_setup():
+    server = make_server(0, "newest")
+    room = auction_room("r")                                            # auction information not received yet
+    client = make_client("a")
+    server.enqueue(room, client)
+    assert client[0].msgs == [{"type": "busy", "text": server.busy_msg}]
+
+
+def test_disconnected_clients_leave_the_queue():
+    server = make_server(3, "newest")
+    room = bidding_room()
+    for name in ("a", "b", "c"):
+        server.enqueue(room, make_client(name))
+    room.waiting[0][0].closed = True
+    server.send_positions(room)
+    assert waiting_names(room) == ["b", "c"]
+    assert [client[0].msgs[-1]["position"] for client in room.waiting] == [1, 2]
+
+
+def test_queued_clients_join_in_arrival_order():
+    server = make_server(3, "newest")
+    room = bidding_room()
+    for name in ("a", "b", "c"):
+        server.enqueue(room, make_client(name))
+    room.bidding_start = False                                          # next auction accepts 2 buyers
+    room.num_bids = 2
+    server.admit_waiting(room)
+    assert [connection.name for connection in room.buyer_connections] == ["a", "b"]
+    assert room.buyers_ready.is_set()
+    assert waiting_names(room) == ["c"]
+    assert room.waiting[0][0].msgs[-1]["position"] == 1
+
+
+""" Returns a room waiting for 2 buyers with one joined, and the server and client ends of its seller connection. """
+def setup_room(server):
+    room = auction_room("r")
+    room.state = 1
+    room.num_bids = 2
+    server.rooms["r"] = room
+    server.add_buyer(room, make_client("a"))
+    return room, socket.socketpair()
+
+
+def test_seller_leaving_cancels_the_auction():
+    server = make_server(3, "newest")
+    room, (seller_end, seller) = setup_room(server)
+    seller.close()
+    assert not server.wait_for_buyers(room, seller_end, msg_reader(seller_end))
+    assert room.buyer_connections[0].msgs[-1] == {"type": "result", "text": server.auc_cancelled_msg, "peer": None}
+    assert room.closed and "r" not in server.rooms and server.active_rooms == 0
+    seller_end.close()
+
+
+def test_setup_timeout_cancels_the_auction():
+    server = make_server(3, "newest")
+    server.setup_timeout = 0.2
+    room, (seller_end, seller) = setup_room(server)
+    assert not server.wait_for_buyers(room, seller_end, msg_reader(seller_end))
+    assert msg_reader(seller).recv_msg() == {"type": "result", "text": server.auc_cancelled_msg, "peers": []}
+    assert room.bidding_start and room.closed                           # no buyer joins the cancelled auction
+    seller_end.close()
+    seller.close()
+
+
+def test_last_buyer_starts_the_bidding():
+    server = make_server(3, "newest")
+    room, (seller_end, seller) = setup_room(server)
+    started = time.monotonic()
+    threading.Timer(0.1, server.add_buyer, (room, make_client("b"))).start()
+    assert server.wait_for_buyers(room, seller_end, msg_reader(seller_end))
+    assert time.monotonic() - started < 0.2                             # woken by the join, not by a poll
+    assert not room.closed
+    seller_end.close()
+    seller.close()
@@ -0,0 +1,190 @@
+import json
+import socket
+import threading
+import time
+
+from auc_protocol import encode_msg, length_prefix, msg_reader, send_msg
+from auc_server_rdt import auc_server, auction_room, bid_book, price_board
+
+
+class slow_connection:
+    """ Buyer connection whose socket buffer takes room more bytes, recording every byte sent. """
+    def __init__(self, room):
+        self.room = room
+        self.data = bytearray()
+
+    def setsockopt(self, *args):
+        pass
+
+    def setblocking(self, flag):
+        pass
+
+    def send(self, data):
+        if self.room == 0:
+            raise BlockingIOError()
+        sent = min(self.room, len(data))
+        self.data += data[:sent]
+        self.room -= sent
+        return sent
+
+    def sendall(self, data):
+        self.data += data
+
+    """ Returns the control messages received so far. """
+    def msgs(self):
+        msgs, offset = [], 0
+        while offset < len(self.data):
+            length, = length_prefix.unpack_from(self.data, offset)
+            msgs.append(json.loads(self.data[offset + length_prefix.size:offset + length_prefix.size + length]))
+            offset += length_prefix.size + length
+        return msgs
+
+
+class fake_selector:
+    """ Selector that records the events every connection is watched for. """
+    def __init__(self):
+        self.events = {}
+
+    def modify(self, sock, events, data):
+        self.events[data] = events
+
+    def unregister(self, sock):
+        pass
+
+
+def price(value):
+    return encode_msg("price", text="", price=value, bids=1)
+
+
+def test_bid_book_ranks_ties_by_join_order():
+    book = bid_book(5, 2)
+    for ix, bid in enumerate([7, 9, 7, 9, 7]):
+        assert book.place(ix, bid)
+    assert not book.place(1, 10)                                        # one bid per buyer
+    assert book.ranked() == [(1, 9), (3, 9), (0, 7)]
+    assert book.count == 5
+
+
+def test_price_board_coalesces_updates_for_a_slow_buyer():
+    fast, slow = slow_connection(1 << 20), slow_connection(len(price(10)) + 3)
+    sel = fake_selector()
+    board = price_board([fast, slow], sel)
+    for value in (10, 11, 12, 13):
+        board.broadcast(price(value))
+    assert [msg["price"] for msg in fast.msgs()] == [10, 11, 12, 13]
+    assert board.blocked == {1} and sel.events[1] & 2                   # watched for EVENT_WRITE
+    board.send(1, encode_msg("bid_ok", text="", price=11))             # replies are queued, never dropped
+
+    slow.room = 1 << 20                                                 # the buyer caught up reading
+    assert board.flush(1)
+    assert [(msg["type"], msg["price"]) for msg in slow.msgs()] == [("price", 10), ("price", 11), ("bid_ok", 11),
+                                                                     ("price", 13)]
+    assert board.coalesced == 1 and not board.blocked and sel.events[1] == 1
+
+
+def test_price_board_finish_completes_partial_frames():
+    slow = slow_connection(5)
+    board = price_board([slow], fake_selector())
+    board.broadcast(price(10))
+    board.send(0, encode_msg("bid_ok", text="", price=10))
+    board.broadcast(price(11))
+    board.finish()
+    assert [(msg["type"], msg["price"]) for msg in slow.msgs()] == [("price", 10), ("bid_ok", 10)]
+
+
+""" Returns n connected (server end, client end) TCP socket pairs on the loopback interface. """
+def tcp_pairs(n):
+    listener = socket.create_server(("127.0.0.1", 0))
+    pairs = []
+    for _ in range(n):
+        client = socket.create_connection(listener.getsockname())
+        pairs.append((listener.accept()[0], client))
+    listener.close()
+    return pairs
+
+
+""" Returns every control message until the server closed the connection. """
+def read_all(sock):
+    reader, msgs = msg_reader(sock), []
+    msg = reader.recv_msg()
+    while msg is not None:
+        msgs.append(msg)
+        msg = reader.recv_msg()
+    return msgs
+
+
+""" Returns an ascending auction room whose buyers are the server ends of pairs, closing after close seconds. """
+def ascending_room(pairs, close):
+    room = auction_room("r")
+    room.auc_type = 3
+    room.lowest_price = 5
+    room.num_bids = len(pairs)
+    room.item = "item"
+    room.bid_deadline = close
+    for ix, (server_end, _) in enumerate(pairs):
+        room.buyer_connections.append(server_end)
+        room.buyer_readers.append(msg_reader(server_end))
+        room.buyer_ip_addr.append("127.0.0.1")
+        room.buyer_transfer_ports.append(ix)
+        room.buyer_stream_ports.append([ix])
+    return room
+
+
+def test_ascending_auction_closes_and_results_survive_late_raises():
+    server = auc_server.__new__(auc_server)
+    pairs = tcp_pairs(2)
+    room = ascending_room(pairs, 0.3)
+    send_msg(pairs[0][1], "bid", amount=6)
+    send_msg(pairs[1][1], "bid", amount=8)
+    started = time.monotonic()
+    server.bidding(room)
+    assert time.monotonic() - started >= 0.3                            # closed once no higher bid came
+    assert room.winners == [(1, 8)] and room.bid_count == 2
+
+    closing = threading.Thread(target=server.close_buyers, args=(room.buyer_connections,))
+    closing.start()
+    time.sleep(0.1)
+    for _, client in pairs:                                             # raises sent as the auction closed
+        send_msg(client, "bid", amount=20)
+    time.sleep(0.1)
+    results = [read_all(client)[-1] for _, client in pairs]
+    assert results[0]["type"] == "result" and results[0]["peer"] is None
+    assert results[1]["type"] == "result" and results[1]["peer"] is not None
+    assert closing.is_alive()                                           # lingers until the buyers close their end
+    for _, client in pairs:
+        client.close()
+    closing.join(2)
+    assert not closing.is_alive()
+
+
+def test_close_buyers_lingers_at_most_close_linger():
+    server = auc_server.__new__(auc_server)
+    server.close_linger = 0.2
+    pairs = tcp_pairs(1)
+    started = time.monotonic()
+    server.close_buyers([pairs[0][0]])                                  # the buyer never closes its end
+    assert time.monotonic() - started < 1
+    assert pairs[0][0].fileno() == -1
+    assert read_all(pairs[0][1]) == []
+    pairs[0][1].close()
+
+
+def test_sealed_bidding_drops_a_buyer_that_does_not_read_its_replies():
+    server = auc_server.__new__(auc_server)
+    pairs = tcp_pairs(2)
+    room = ascending_room(pairs, 5)
+    room.auc_type = 1
+    flood = threading.Thread(target=pairs[0][1].sendall, args=(encode_msg("bid", amount="x") * 50000,), daemon=True)
+    flood.start()                                                       # invalid bids, the replies are never read
+    send_msg(pairs[1][1], "bid", amount=8)
+    bidding = threading.Thread(target=server.sealed_bidding, args=(room,), daemon=True)
+    bidding.start()
+    bidding.join(3)
+    assert not bidding.is_alive()                                       # resolved before the deadline
+    assert room.bid_book.ranked() == [(1, 8)]
+    reader = msg_reader(pairs[1][1])
+    assert [reader.recv_msg()["type"], reader.recv_msg()["type"]] == ["bid_start", "bid_ok"]
+    for server_end, client in pairs:
+        server_end.close()
+        client.close()
+    flood.join(2)
@@ -0,0 +1,135 @@
+import json
+import os
+import time
+
+import pytest
+
+from auc_journal import auction_journal
+
+
+""" Opens the journal at path, saving the index after every commit. """
+def open_journal(path):
+    journal = auction_journal(path)
+    journal.index_interval = 0
+    return journal
+
+
+""" Appends an auction to journal with bids of amounts and returns its id. """
+def add_auction(journal, room, amounts):
+    auction = journal.append("created", None, room=room)
+    for amount in amounts:
+        journal.append("bid", auction, amount=amount)
+    return auction
+
+
+""" Returns the bid amounts of the records of an open auction. """
+def amounts(records):
+    return [record["amount"] for record in records if record["ev"] == "bid"]
+
+
+""" Waits until the commit thread saved an index covering the whole committed journal. """
+def wait_for_index(journal):
+    for _ in range(200):
+        try:
+            with open(journal.index_path) as f:
+                if json.load(f)["end"] == journal.committed:
+                    return
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.01)
+    raise AssertionError("index not saved")
+
+
+def test_torn_record_is_cut_off(tmp_path):
+    path = str(tmp_path / "auctions.journal")
+    journal = open_journal(path)
+    open_id = add_auction(journal, "a", [5, 7])
+    closed_id = add_auction(journal, "b", [3])
+    journal.append("resolved", closed_id, wait=True)
+    wait_for_index(journal)
+    size = os.path.getsize(path)
+    with open(path, "ab") as f:                                         # crash in the middle of the next record
+        f.write(b"\x00\x00\x00\x40\x12\x34")
+
+    restored = auction_journal(path)
+    assert os.path.getsize(path) == size
+    assert list(restored.open_auctions) == [open_id]
+    assert amounts(restored.open_auctions[open_id]) == [5, 7]
+    restored.append("bid", open_id, wait=True, amount=9)
+    assert amounts(auction_journal(path).open_auctions[open_id]) == [5, 7, 9]
+
+
+def test_corrupt_record_is_cut_off(tmp_path):
+    path = str(tmp_path / "auctions.journal")
+    journal = open_journal(path)
+    auction = add_auction(journal, "a", [5])
+    journal.append("bid", auction, wait=True, amount=6)
+    wait_for_index(journal)
+    with open(path, "r+b") as f:                                        # flip the last byte of the indexed record
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xff]))
+    size = os.path.getsize(path)
+
+    assert amounts(auction_journal(path).open_auctions[auction]) == [5]
+    assert os.path.getsize(path) < size
+
+
+def test_replay_starts_from_the_index(tmp_path, monkeypatch):
+    path = str(tmp_path / "auctions.journal")
+    journal = open_journal(path)
+    first = add_auction(journal, "a", [1, 2])
+    for room in range(20):                                              # history the index lets replay skip
+        journal.append("aborted", add_auction(journal, str(room), [3, 4]), reason="test")
+    second = add_auction(journal, "b", [5])
+    journal.append("bid", first, wait=True, amount=6)
+    wait_for_index(journal)
+    journal.index_interval = 3600                                       # later records are not indexed
+    third = add_auction(journal, "c", [8])
+    journal.append("resolved", second, wait=True)
+
+    reads = []
+    read_record = auction_journal.read_record
+    monkeypatch.setattr(auction_journal, "read_record", lambda self, f, offset: reads.append(offset)
+                        or read_record(self, f, offset))
+    restored = auction_journal(path)
+    assert sorted(restored.open_auctions) == [first, third]
+    assert amounts(restored.open_auctions[first]) == [1, 2, 6]
+    assert amounts(restored.open_auctions[third]) == [8]
+    assert len(reads) < 20                                              # only open auctions and the unindexed tail
+
+
+def test_stale_index_falls_back_to_a_full_scan(tmp_path):
+    path = str(tmp_path / "auctions.journal")
+    journal = open_journal(path)
+    auction = add_auction(journal, "a", [1])
+    journal.append("bid", auction, wait=True, amount=2)
+    wait_for_index(journal)
+    with open(journal.index_path, "w") as f:                            # index of a longer journal
+        json.dump({"end": journal.committed + 100, "open": {}}, f)
+
+    assert amounts(auction_journal(path).open_auctions[auction]) == [1, 2]
+
+
+def test_closed_auctions_are_forgotten(tmp_path):
+    journal = auction_journal(str(tmp_path / "auctions.journal"))
+    resolved = add_auction(journal, "a", [1])
+    journal.append("resolved", resolved)
+    aborted = add_auction(journal, "b", [])
+    journal.append("aborted", aborted, reason="test")
+    journal.append("transfer", resolved, wait=True, peers=[])
+    assert journal.last == {} and journal.open == set()
+
+
+def test_commit_failure_is_raised_to_writers(tmp_path):
+    journal = auction_journal(str(tmp_path / "auctions.journal"))
+    auction = add_auction(journal, "a", [])
+
+    def fail(batch):
+        raise OSError(28, "No space left on device")
+    journal.file.write = fail
+    with pytest.raises(OSError, match="journal commit failed"):
+        journal.append("bid", auction, wait=True, amount=1)
+    with pytest.raises(OSError, match="journal commit failed"):
+        journal.append("bid", auction, amount=2)
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import random
+import socket
+import threading
+import time
+
+import pytest
+
+from auc_client_rdt import auc_client, datagram_socket, file_sink, transfer_checkpoint
+
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)                                         # tosend.txt, received.txt and performance.txt
+
+
+""" Returns a UDP port of the loopback interface that is free right now. """
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+""" Returns a quiet client for one side of a loopback transfer in 1000 byte chunks, with the run options args. """
+def make_client(*args):
+    client = auc_client(["127.0.0.1", "0", str(free_port()), "--quiet", "--chunk-size", "1000",
+                         "--max-chunk-size", "1000"] + list(args))
+    client.reserve_ports([client.sendingPort])
+    return client
+
+
+""" Sends item from seller to buyer over the loopback interface and returns the bytes the buyer received. """
+def transfer(seller, buyer, item):
+    with open(seller.filename, "wb") as f:
+        f.write(item)
+    receiving = threading.Thread(target=buyer.recieve_item, args=("127.0.0.1", [seller.sendingPort]))
+    receiving.start()
+    seller.send_item([("127.0.0.1", buyer.sendingPort, [buyer.sendingPort])])
+    receiving.join(10)
+    assert not receiving.is_alive()
+    with open(buyer.received_filename, "rb") as f:
+        return f.read()
+
+
+""" Makes seller lose the first send of every data chunk in seqs, as if the path dropped it. """
+def lose_first_send(seller, seqs):
+    send_packet, lost = seller.send_packet, set()
+
+    def lossy_send_packet(sock, seq_num, type, payload, addr, flags=0):
+        if type == seller.data_type and seq_num in seqs and seq_num not in lost:
+            lost.add(seq_num)
+            return
+        send_packet(sock, seq_num, type, payload, addr, flags)
+    seller.send_packet = lossy_send_packet
+
+
+""" Writes data as the first chunks of an interrupted transfer of item, with the checkpoint naming them as held. """
+def interrupted_transfer(item, data, chunk_size=1000):
+    sink = file_sink(auc_client.received_filename, len(item))
+    sink.write(0, data)
+    params = {"length": len(item), "chunk_size": chunk_size, "offset": 0, "total": len(item),
+              "sha256": hashlib.sha256(item).hexdigest()}
+    checkpoint = transfer_checkpoint(auc_client.received_filename, 0, params, -(-len(item) // chunk_size))
+    for seq in range(len(data) // chunk_size):
+        checkpoint.add(seq)
+    checkpoint.save(sink)
+    sink.close()
+
+
+def test_resume_skips_the_checkpointed_chunks_and_verifies_the_sha256():
+    item = random.Random(1).randbytes(20000)
+    interrupted_transfer(item, item[:8000])
+    seller, buyer = make_client(), make_client()
+    assert transfer(seller, buyer, item) == item
+    assert seller.metrics.resumed_bytes == 8000 and buyer.metrics.resumed_bytes == 8000
+    assert seller.metrics.bytes == 12000                                # only the missing chunks were sent
+    assert buyer.metrics.verified
+    assert not os.path.exists(auc_client.received_filename + ".0.ckpt")
+
+
+def test_resume_of_corrupt_chunks_fails_verification():
+    item = random.Random(2).randbytes(20000)
+    interrupted_transfer(item, b"x" + item[1:8000])
+    seller, buyer = make_client(), make_client()
+    assert transfer(seller, buyer, item) != item
+    assert buyer.metrics.verified is False
+
+
+def test_checkpoint_of_another_item_is_discarded():
+    item = random.Random(3).randbytes(20000)
+    interrupted_transfer(item[::-1], item[::-1][:8000])
+    seller, buyer = make_client(), make_client()
+    assert transfer(seller, buyer, item) == item
+    assert seller.metrics.resumed_bytes == 0 and buyer.metrics.verified
+
+
+def test_random_item_is_sent_raw_although_a_codec_is_offered():
+    item = random.Random(4).randbytes(30000)
+    seller, buyer = make_client("--codec", "zlib"), make_client()
+    assert transfer(seller, buyer, item) == item
+    assert seller.metrics.codec == "none" and buyer.metrics.codec == "none"
+    assert seller.metrics.wire_bytes == len(item)
+
+
+def test_compressible_item_is_sent_compressed():
+    item = b"".join(b"lot " + str(i).encode() + b" of the auction\n" for i in range(3000))
+    seller, buyer = make_client("--codec", "zlib"), make_client()
+    assert transfer(seller, buyer, item) == item
+    assert seller.metrics.codec == "zlib" and buyer.metrics.codec == "zlib"
+    assert buyer.metrics.wire_bytes < len(item) // 2
+
+
+def test_chunk_lost_from_a_parity_block_is_rebuilt():
+    item = random.Random(5).randbytes(30500)
+    seller, buyer = make_client("--window", "16", "--fec", "4"), make_client()
+    lose_first_send(seller, {5, 30})                                    # 30 is the short last chunk
+    assert transfer(seller, buyer, item) == item
+    assert seller.metrics.recovered == 2 and buyer.metrics.recovered == 2
+    assert seller.metrics.retransmissions == 0
+
+
+def test_block_missing_two_chunks_is_retransmitted():
+    item = random.Random(6).randbytes(30000)
+    seller, buyer = make_client("--window", "16", "--fec", "4"), make_client()
+    lose_first_send(seller, {4, 5})
+    assert transfer(seller, buyer, item) == item
+    assert seller.metrics.retransmissions >= 1                          # one parity rebuilds one chunk at most
+
+
+def test_fec_block_must_fit_the_parity_header():
+    with pytest.raises(SystemExit):
+        make_client("--fec", "65536")
+    assert make_client("--fec", "65535").fec_block == 65535
+
+
+def test_sack_gap_triggers_a_fast_retransmit():
+    item = random.Random(7).randbytes(40000)
+    seller, buyer = make_client("--window", "16"), make_client()
+    lose_first_send(seller, {3, 20})
+    started = time.monotonic()
+    assert transfer(seller, buyer, item) == item
+    assert time.monotonic() - started < auc_client.timeout              # no retransmission waited for its timer
+    assert seller.metrics.fast_retransmits == 2 and seller.metrics.retransmissions == 2
+
+
+def test_drain_yields_every_ready_datagram_in_order():
+    sock = datagram_socket(free_port(), 1 << 20)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as peer:
+        peer.bind(("127.0.0.1", 0))
+        for i in range(50):
+            peer.sendto(bytes([i]) * (i + 1), ("127.0.0.1", sock.getsockname()[1]))
+        sock.wait(1)
+        time.sleep(0.05)                                                # let every datagram arrive
+        received = [(bytes(data), addr) for data, addr in sock.drain()]
+        assert [data for data, _ in received] == [bytes([i]) * (i + 1) for i in range(50)]
+        assert {addr for _, addr in received} == {peer.getsockname()}
+    assert sock.receive() is None
+    sock.close()
+
+
+def test_accepted_chunk_size_fits_a_window_into_the_receive_buffer():
+    buyer = make_client("--chunk-size", "1000", "--max-chunk-size", "60000")
+    sock = datagram_socket(free_port(), 1 << 16)
+    buffer = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // 2
+    assert buyer.accept_chunk_size(sock, 60000, 1) == min(60000, buffer)
+    assert buyer.accept_chunk_size(sock, 60000, 16) == max(1000, buffer // 16)
+    assert buyer.accept_chunk_size(sock, 60000, 10000) == 1000          # never below the smallest chunk size
+    assert buyer.accept_chunk_size(sock, 500, 1) == 500                 # nor above the offer
+    assert make_client("--max-chunk-size", "1000").accept_chunk_size(sock, 60000, 1) == 1000
+    sock.close()
+
+
+""" Sends item with a delta transfer to a buyer that holds the earlier version basis, returns the seller and buyer. """
+def delta_transfer(basis, item):
+    with open(auc_client.received_filename, "wb") as f:
+        f.write(basis)
+    seller, buyer = make_client("--delta"), make_client()
+    assert transfer(seller, buyer, item) == item
+    assert buyer.metrics.verified
+    return seller, buyer
+
+
+def test_delta_of_a_shifted_basis_copies_the_moved_blocks():
+    basis = random.Random(8).randbytes(40000)
+    seller, buyer = delta_transfer(basis, b"new lot\n" * 300 + basis)   # every block moves 2400 bytes back
+    assert buyer.metrics.reused_bytes >= 36000
+    assert seller.metrics.wire_bytes < 8000
+
+
+def test_delta_of_a_shrunk_basis_truncates_the_file():
+    basis = random.Random(9).randbytes(40000)
+    seller, buyer = delta_transfer(basis, basis[:10000] + basis[25000:30000])
+    assert buyer.metrics.reused_bytes >= 13000
+    assert seller.metrics.wire_bytes < 4000
+    assert os.path.getsize(auc_client.received_filename) == 15000